@@ -0,0 +1,319 @@
+# backend/MLmodels/RubberTree/BenchmarkRubberTree.py
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import threading
+import contextlib
+import subprocess
+from pathlib import Path
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from PredictRubberTree import RubberTreePredictor
+from ExportedModel import BACKENDS
+from Instrumentation import silence_logs
+
+PROJECT_DIR = Path(__file__).parent
+BACKEND_DIR = PROJECT_DIR.parent.parent
+IMAGE_DIRS = [BACKEND_DIR / 'uploads' / 'rubber-tree', BACKEND_DIR / 'datasets' / 'RubberTree' / 'images']
+STAGES = ['fetch', 'decode', 'inference', 'postprocess', 'generate_analysis', 'json']
+
+
+def make_detections(count, class_names, seed=0):
+    """Synthetic detections with the same fields predict() produces"""
+    rng = random.Random(seed)
+    detections = []
+    for _ in range(count):
+        x1, y1 = rng.uniform(0, 3000), rng.uniform(0, 3000)
+        width, height = rng.uniform(10, 800), rng.uniform(10, 800)
+        detections.append({
+            'class_id': rng.randrange(len(class_names)),
+            'class_name': rng.choice(class_names),
+            'confidence': round(rng.random(), 4),
+            'bbox': [round(x1, 2), round(y1, 2), round(x1 + width, 2), round(y1 + height, 2)],
+            'width': round(width, 2),
+            'height': round(height, 2)
+        })
+    return detections
+
+
+def benchmark_analysis(predictor, counts=(10, 100, 1000, 10000), min_seconds=0.5):
+    """Time generate_analysis at increasing detection counts"""
+    rows = []
+    for count in counts:
+        detections = make_detections(count, predictor.class_names)
+        img_shape = (3000, 4000, 3)
+
+        iterations = 0
+        start = time.perf_counter()
+        while True:
+            predictor.generate_analysis(detections, img_shape)
+            iterations += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+
+        per_call_us = elapsed / iterations * 1e6
+        rows.append({
+            'detections': count,
+            'iterations': iterations,
+            'us_per_call': round(per_call_us, 2),
+            'ns_per_detection': round(per_call_us * 1000 / count, 1)
+        })
+    return rows
+
+
+def collect_images(limit=None, seed=0):
+    """Local upload and dataset images, sampled reproducibly when limit is set"""
+    paths = []
+    for image_dir in IMAGE_DIRS:
+        paths.extend(sorted(image_dir.rglob('*.jpg')))
+    if limit and len(paths) > limit:
+        paths = sorted(random.Random(seed).sample(paths, limit))
+    return paths
+
+
+def percentiles(samples_ms):
+    """p50/p95/p99 and mean of a list of millisecond timings"""
+    if not samples_ms:
+        return None
+    ordered = sorted(samples_ms)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))], 3)
+
+    return {
+        'n': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'p99': pick(0.99)
+    }
+
+
+@contextlib.contextmanager
+def local_image_server():
+    """Serve the backend directory over HTTP so fetch timings go through ImageFetcher"""
+    handler = partial(SimpleHTTPRequestHandler, directory=str(BACKEND_DIR))
+    handler.log_message = lambda *args: None
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def benchmark_stages(predictor, paths, repeats=1, use_http=True):
+    """Per-image latency of each pipeline stage, run the way predict() runs them"""
+    timings = {stage: [] for stage in STAGES}
+    lowest_threshold = min(predictor.confidence_thresholds)
+
+    with contextlib.ExitStack() as stack:
+        base_url = stack.enter_context(local_image_server()) if use_http else None
+        for _ in range(repeats):
+            for path in paths:
+                start = time.perf_counter()
+                if base_url:
+                    content = predictor.fetcher.fetch(f'{base_url}/{path.relative_to(BACKEND_DIR).as_posix()}')
+                else:
+                    content = path.read_bytes()
+                fetched = time.perf_counter()
+
+                img = predictor.decode_image_bytes(content)
+                decoded = time.perf_counter()
+                if img is None:
+                    continue
+
+                results = predictor.run_model(img.pixels, lowest_threshold)
+                inferred = time.perf_counter()
+
+                detections, _ = predictor.replay_thresholds(results, img.original_shape,
+                                                            scale=img.scale)
+                if not detections:
+                    detections = predictor.create_fallback_detections(img)
+                postprocessed = time.perf_counter()
+
+                analysis = predictor.generate_analysis(detections, img.original_shape)
+                analysed = time.perf_counter()
+
+                json.dumps({
+                    'success': True,
+                    'detections': detections,
+                    'analysis': analysis
+                }, indent=2)
+                serialized = time.perf_counter()
+
+                marks = [start, fetched, decoded, inferred, postprocessed, analysed, serialized]
+                for stage, begin, end in zip(STAGES, marks, marks[1:]):
+                    timings[stage].append((end - begin) * 1000)
+
+    return {stage: percentiles(samples) for stage, samples in timings.items()}
+
+
+def benchmark_batch_sizes(predictor, paths, batch_sizes):
+    """End-to-end images/sec of predict_images on decoded images at each batch size"""
+    images = [img for img in (predictor.load_image_from_file(str(path)) for path in paths) if img is not None]
+    rows = []
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            predictor.predict_images(images[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        rows.append({
+            'batch_size': batch_size,
+            'images': len(images),
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(len(images) / elapsed, 2) if elapsed else None
+        })
+    return rows
+
+
+def benchmark_workers(paths, worker_counts, predictor_kwargs):
+    """End-to-end images/sec through a PredictorPool at each worker count, excluding model load"""
+    from PoolRubberTree import PredictorPool
+
+    rows = []
+    for workers in worker_counts:
+        pool = PredictorPool(workers=workers, queue_size=len(paths), **predictor_kwargs)
+        try:
+            pool.wait_ready()
+            start = time.perf_counter()
+            futures = [pool.submit(str(path)) for path in paths]
+            failures = sum(not future.result().get('success') for future in futures)
+            elapsed = time.perf_counter() - start
+        finally:
+            pool.close()
+        rows.append({
+            'workers': workers,
+            'threads_per_worker': pool.thread_plans[0][0],
+            'images': len(paths),
+            'failures': failures,
+            'seconds': round(elapsed, 3),
+            'images_per_second': round(len(paths) / elapsed, 2) if elapsed else None
+        })
+    return rows
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its largest finished child (Linux reports KiB)"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+
+def run_metadata(predictor, images):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': predictor.backend,
+        'model_path': str(predictor.loaded_model_path),
+        'images': images
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.1):
+    """Regressions of current against baseline: slower stage percentiles or lower throughput"""
+    regressions = []
+
+    def check(name, before, after, higher_is_better=False):
+        if before is None or after is None or before <= 0:
+            return
+        change = (after - before) / before
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({'metric': name, 'baseline': before, 'current': after,
+                                'change': round(change, 3)})
+
+    for stage, stats in (current.get('stages') or {}).items():
+        before = (baseline.get('stages') or {}).get(stage)
+        if stats and before:
+            for key in ('p50', 'p95', 'p99'):
+                check(f'stages.{stage}.{key}', before[key], stats[key])
+
+    for section, key in (('batch_sizes', 'batch_size'), ('workers', 'workers')):
+        before_rows = {row[key]: row for row in baseline.get(section) or []}
+        for row in current.get(section) or []:
+            if row[key] in before_rows:
+                check(f'{section}.{row[key]}.images_per_second',
+                      before_rows[row[key]]['images_per_second'], row['images_per_second'], higher_is_better=True)
+
+    for key in ('self', 'children'):
+        check(f'peak_rss_mb.{key}', (baseline.get('peak_rss_mb') or {}).get(key),
+              (current.get('peak_rss_mb') or {}).get(key))
+    return regressions
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the Rubber Tree prediction pipeline')
+    parser.add_argument('--images', type=int, default=50, help='Number of local images to sample (0 for all)')
+    parser.add_argument('--repeats', type=int, default=1, help='Passes over the images for per-stage latency')
+    parser.add_argument('--batch-sizes', type=str, default='1,4,8', help='Comma-separated batch sizes for throughput')
+    parser.add_argument('--workers', type=str, default='', help='Comma-separated pool worker counts for throughput')
+    parser.add_argument('--counts', type=str, default='10,100,1000,10000',
+                        help='Comma-separated detection counts for the generate_analysis benchmark')
+    parser.add_argument('--min-seconds', type=float, default=0.5, help='Minimum run time per generate_analysis measurement')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS, help='Inference backend to benchmark')
+    parser.add_argument('--single-pass', action='store_true', help='Benchmark single-pass batch inference')
+    parser.add_argument('--reduced-decode', action='store_true', help='Benchmark reduced JPEG decoding')
+    parser.add_argument('--no-http', action='store_true', help='Read files directly instead of fetching them over local HTTP')
+    parser.add_argument('--output', type=str, default=None, help='Also write the JSON report to this file')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative slowdown before flagging a regression')
+    args = parser.parse_args()
+
+    predictor_kwargs = {'image_cache': False, 'result_cache': False, 'backend': args.backend,
+                        'single_pass': args.single_pass, 'reduced_decode': args.reduced_decode,
+                        'instrument': True}
+    paths = collect_images(args.images or None)
+
+    # Per-image progress messages would swamp the report, so they are discarded while timing
+    with silence_logs():
+        predictor = RubberTreePredictor(warmup=True, **predictor_kwargs)
+        report = {'meta': run_metadata(predictor, len(paths))}
+        report['startup'] = predictor.startup_report()
+        report['stages'] = benchmark_stages(predictor, paths, args.repeats, use_http=not args.no_http)
+        report['batch_sizes'] = benchmark_batch_sizes(predictor, paths, parse_ints(args.batch_sizes))
+        report['generate_analysis'] = benchmark_analysis(predictor, parse_ints(args.counts), args.min_seconds)
+        worker_counts = parse_ints(args.workers)
+        if worker_counts:
+            report['workers'] = benchmark_workers(paths, worker_counts, predictor_kwargs)
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare_reports(baseline, report, args.tolerance)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+    if report.get('regressions'):
+        print(f"⚠️ {len(report['regressions'])} regressions against {args.compare}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
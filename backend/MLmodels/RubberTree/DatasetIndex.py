@@ -0,0 +1,296 @@
+# backend/MLmodels/RubberTree/DatasetIndex.py
+import os
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from LazyImport import lazy_import
+from Instrumentation import log
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+PROJECT_DIR = Path(__file__).parent
+MANIFEST_PATH = PROJECT_DIR / 'cache' / 'dataset_manifest.npz'
+MANIFEST_VERSION = 1
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+SPLITS = ['train', 'val', 'test']
+
+# Per-image problem flags, stored as a bitmask in the manifest
+CORRUPT = 1       # cv2 cannot decode the file
+TRUNCATED = 2     # JPEG without its end-of-image marker; decodes, but with grey rows at the bottom
+BAD_LABEL = 4     # label rows that are malformed, out of range, or have an unknown class id
+NO_LABEL = 8      # no labels/*.txt; ultralytics trains on it as a background image
+
+FLAG_NAMES = {CORRUPT: 'corrupt', TRUNCATED: 'truncated', BAD_LABEL: 'bad_label', NO_LABEL: 'no_label'}
+
+
+def label_path_for(image_path):
+    """labels/<split>/<stem>.txt next to images/<split>/, the layout ultralytics expects"""
+    parts = list(image_path.parts)
+    index = len(parts) - 1 - parts[::-1].index('images')
+    parts[index] = 'labels'
+    return Path(*parts).with_suffix('.txt')
+
+
+def file_stat(path):
+    """(size, mtime_ns) of path, or (-1, -1) when it does not exist"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return -1, -1
+    return stat.st_size, stat.st_mtime_ns
+
+
+def read_image_entry(path):
+    """Hash, decoded size and flags of one image file"""
+    content = path.read_bytes()
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    flags = 0
+    width = height = 0
+    img = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR) if content else None
+    if img is None:
+        flags |= CORRUPT
+    else:
+        height, width = img.shape[:2]
+        if path.suffix.lower() in ('.jpg', '.jpeg') and not content.rstrip(b'\x00').endswith(b'\xff\xd9'):
+            flags |= TRUNCATED
+    return digest, width, height, flags
+
+
+def read_label_entry(path, num_classes):
+    """Per-class box counts and flags of one YOLO label file"""
+    counts = np.zeros(num_classes, dtype=np.int32)
+    flags = 0
+    for line in path.read_text(errors='replace').splitlines():
+        values = line.split()
+        if not values:
+            continue
+        try:
+            class_id = int(values[0])
+            coords = [float(v) for v in values[1:]]
+        except ValueError:
+            flags |= BAD_LABEL
+            continue
+        # Boxes have 4 coordinates, segments an even number of at least 6
+        if len(coords) < 4 or len(coords) % 2 or not 0 <= class_id < num_classes \
+                or any(not -0.01 <= v <= 1.01 for v in coords):
+            flags |= BAD_LABEL
+            continue
+        counts[class_id] += 1
+    return counts, flags
+
+
+class DatasetIndex:
+    """Array-backed manifest of a YOLO dataset: one row per image with its file stats, content hash,
+    decoded size, problem flags and per-class box counts.
+
+    The manifest is saved as an .npz of plain column arrays. Rebuilding only re-reads files whose
+    size or mtime changed since the last scan, so checking an unchanged dataset costs one stat per file.
+    """
+
+    def __init__(self, data_yaml=PROJECT_DIR / 'data.yaml', manifest_path=MANIFEST_PATH):
+        data_yaml = Path(data_yaml)
+        with open(data_yaml, 'r') as f:
+            config = yaml.safe_load(f)
+        self.class_names = list(config['names'])
+        self.split_dirs = {split: (data_yaml.parent / config[split]).resolve()
+                           for split in SPLITS if config.get(split)}
+        # Dataset root holding images/ and labels/
+        first = next(iter(self.split_dirs.values()))
+        self.root = label_path_for(first / 'x').parent.parent.parent
+        self.manifest_path = Path(manifest_path)
+        self.columns = None
+        self.orphan_labels = []
+
+    def load(self):
+        """Previous manifest columns, or None when missing, unreadable or built for other classes"""
+        if not self.manifest_path.exists():
+            return None
+        try:
+            with np.load(self.manifest_path, allow_pickle=False) as data:
+                columns = {key: data[key] for key in data.files}
+        except Exception as e:
+            log(f"⚠️ Ignoring unreadable dataset manifest {self.manifest_path}: {e}")
+            return None
+        if int(columns.get('version', -1)) != MANIFEST_VERSION or \
+                list(columns['class_names']) != self.class_names:
+            return None
+        return columns
+
+    def save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, version=np.int32(MANIFEST_VERSION), class_names=np.array(self.class_names),
+                 orphan_labels=np.array(self.orphan_labels, dtype=str), **self.columns)
+        os.replace(tmp_path, self.manifest_path)
+
+    def scan(self, workers=None, rebuild=False):
+        """Index every split, reusing unchanged rows of the saved manifest; returns (reused, rescanned)"""
+        previous = None if rebuild else self.load()
+        previous_rows = {}
+        if previous is not None:
+            previous_rows = {path: i for i, path in enumerate(previous['image'])}
+
+        entries = []
+        for split_id, split in enumerate(SPLITS):
+            image_dir = self.split_dirs.get(split)
+            if image_dir is None or not image_dir.is_dir():
+                continue
+            for path in sorted(image_dir.rglob('*')):
+                if path.suffix.lower() in IMAGE_SUFFIXES:
+                    entries.append((split_id, path, label_path_for(path)))
+
+        def index_entry(entry):
+            split_id, image_path, label_path = entry
+            image_stat = file_stat(image_path)
+            label_stat = file_stat(label_path)
+            row = previous_rows.get(image_path.relative_to(self.root).as_posix())
+
+            if row is not None and (previous['image_size'][row], previous['image_mtime'][row]) == image_stat:
+                digest, width, height = previous['hash'][row], previous['width'][row], previous['height'][row]
+                image_flags = previous['flags'][row] & (CORRUPT | TRUNCATED)
+                image_reused = True
+            else:
+                digest, width, height, image_flags = read_image_entry(image_path)
+                image_reused = False
+
+            if label_stat[0] < 0:
+                counts, label_flags = np.zeros(len(self.class_names), dtype=np.int32), NO_LABEL
+            elif row is not None and (previous['label_size'][row], previous['label_mtime'][row]) == label_stat:
+                counts, label_flags = previous['class_counts'][row], previous['flags'][row] & BAD_LABEL
+            else:
+                counts, label_flags = read_label_entry(label_path, len(self.class_names))
+                image_reused = False
+
+            return (split_id, image_path, label_path if label_stat[0] >= 0 else None, image_stat, label_stat,
+                    digest, width, height, image_flags | label_flags, counts, image_reused)
+
+        # Finish the lazy imports here; LazyLoader is not safe to trigger from several threads at once
+        cv2.imdecode, np.frombuffer
+        # Decoding and hashing release the GIL, so threads scale across cores
+        workers = workers or min(16, (os.cpu_count() or 1) + 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = list(executor.map(index_entry, entries))
+
+        self.columns = {
+            'split': np.array([r[0] for r in rows], dtype=np.int8),
+            'image': np.array([r[1].relative_to(self.root).as_posix() for r in rows], dtype=str),
+            'label': np.array([r[2].relative_to(self.root).as_posix() if r[2] else '' for r in rows], dtype=str),
+            'image_size': np.array([r[3][0] for r in rows], dtype=np.int64),
+            'image_mtime': np.array([r[3][1] for r in rows], dtype=np.int64),
+            'label_size': np.array([r[4][0] for r in rows], dtype=np.int64),
+            'label_mtime': np.array([r[4][1] for r in rows], dtype=np.int64),
+            'hash': np.array([r[5] for r in rows], dtype='<U32'),
+            'width': np.array([r[6] for r in rows], dtype=np.int32),
+            'height': np.array([r[7] for r in rows], dtype=np.int32),
+            'flags': np.array([r[8] for r in rows], dtype=np.uint8),
+            'class_counts': np.array([r[9] for r in rows], dtype=np.int32).reshape(len(rows), len(self.class_names))
+        }
+        self.orphan_labels = self.find_orphan_labels({r[2] for r in rows if r[2] is not None})
+
+        reused = sum(r[10] for r in rows)
+        return reused, len(rows) - reused
+
+    def find_orphan_labels(self, used_labels):
+        """Label files with no matching image, relative to the dataset root"""
+        orphans = []
+        for image_dir in self.split_dirs.values():
+            label_dir = label_path_for(image_dir / 'x').parent
+            if label_dir.is_dir():
+                orphans.extend(p for p in label_dir.rglob('*.txt') if p not in used_labels)
+        return sorted(p.relative_to(self.root).as_posix() for p in orphans)
+
+    def duplicates(self):
+        """Groups of byte-identical images; a group spanning splits leaks data into validation"""
+        hashes = self.columns['hash']
+        unique, inverse, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        groups = []
+        for group_id in np.flatnonzero(counts > 1):
+            rows = np.flatnonzero(inverse == group_id)
+            splits = sorted({SPLITS[s] for s in self.columns['split'][rows]})
+            groups.append({'hash': str(unique[group_id]), 'images': self.columns['image'][rows].tolist(),
+                           'cross_split': len(splits) > 1})
+        return groups
+
+    def problems(self):
+        """Images with each problem flag, plus duplicate groups and orphan labels"""
+        flags = self.columns['flags']
+        report = {name: self.columns['image'][(flags & flag) != 0].tolist() for flag, name in FLAG_NAMES.items()}
+        report['duplicates'] = self.duplicates()
+        report['orphan_labels'] = list(self.orphan_labels)
+        return report
+
+    def class_balance(self):
+        """Boxes and images per class for each split, from the manifest's count matrix"""
+        balance = {}
+        counts = self.columns['class_counts']
+        for split_id, split in enumerate(SPLITS):
+            mask = self.columns['split'] == split_id
+            if not mask.any():
+                continue
+            split_counts = counts[mask]
+            boxes = split_counts.sum(axis=0)
+            images = (split_counts > 0).sum(axis=0)
+            present = boxes[boxes > 0]
+            balance[split] = {
+                'images': int(mask.sum()),
+                'boxes': int(boxes.sum()),
+                'classes': {name: {'boxes': int(b), 'images': int(i)}
+                            for name, b, i in zip(self.class_names, boxes, images)},
+                'missing_classes': [name for name, b in zip(self.class_names, boxes) if b == 0],
+                # Most over least frequent class that appears at all
+                'imbalance_ratio': round(float(present.max() / present.min()), 2) if present.size else None
+            }
+        return balance
+
+    def summary(self):
+        problems = self.problems()
+        return {
+            'root': str(self.root),
+            'images': int(len(self.columns['image'])),
+            'problems': {key: len(value) for key, value in problems.items()},
+            'details': problems,
+            'class_balance': self.class_balance()
+        }
+
+
+def build_index(data_yaml=PROJECT_DIR / 'data.yaml', workers=None, rebuild=False):
+    """Scan the dataset, save the updated manifest and return the DatasetIndex"""
+    index = DatasetIndex(data_yaml)
+    reused, rescanned = index.scan(workers=workers, rebuild=rebuild)
+    index.save()
+    log(f"📇 Indexed {reused + rescanned} images ({rescanned} read, {reused} unchanged) -> {index.manifest_path}")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index and validate the Rubber Tree dataset')
+    parser.add_argument('--data', type=str, default=str(PROJECT_DIR / 'data.yaml'), help='Dataset YAML')
+    parser.add_argument('--workers', type=int, default=None, help='Threads used to read images')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore the saved manifest and re-read every file')
+    parser.add_argument('--strict', action='store_true',
+                        help='Exit 1 on corrupt images, bad labels, orphan labels or cross-split duplicates')
+    args = parser.parse_args()
+
+    try:
+        index = build_index(args.data, workers=args.workers, rebuild=args.rebuild)
+        summary = index.summary()
+        print(json.dumps(summary, indent=2))
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': f"Fatal error: {str(e)}"}))
+        sys.exit(1)
+
+    problems = summary['details']
+    if args.strict and (problems['corrupt'] or problems['bad_label'] or problems['orphan_labels']
+                        or any(group['cross_split'] for group in problems['duplicates'])):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,445 @@
+# backend/MLmodels/RubberTree/EvaluateRubberTree.py
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from LazyImport import lazy_import
+from Instrumentation import log
+from DatasetIndex import SPLITS, CORRUPT, build_index
+from ExportedModel import BACKENDS, MAX_WH, nms
+from ResultCache import fingerprint_file
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+PROJECT_DIR = Path(__file__).parent
+EVAL_CACHE_DIR = PROJECT_DIR / 'cache' / 'evaluation'
+EVAL_CACHE_VERSION = 1
+# Inference keeps every box re-scoring could want: ultralytics' val confidence and an NMS loose
+# enough that any stricter iou is applied afterwards on the cached boxes
+CACHE_CONF = 0.001
+CACHE_IOU = 0.9
+IOU_THRESHOLDS = tuple(round(0.5 + 0.05 * i, 2) for i in range(10))
+
+
+def box_iou(boxes1, boxes2):
+    """(N, M) IoU between two sets of xyxy boxes"""
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:], boxes2[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    return intersection / (area1[:, None] + area2[None, :] - intersection + 1e-9)
+
+
+def read_ground_truth(label_path, width, height, num_classes):
+    """(N, 5) array of class id and pixel x1, y1, x2, y2; segments become their bounding box"""
+    rows = []
+    if label_path is not None:
+        for line in label_path.read_text(errors='replace').splitlines():
+            values = line.split()
+            try:
+                class_id = int(values[0])
+                coords = [float(v) for v in values[1:]]
+            except (ValueError, IndexError):
+                continue
+            # Malformed rows are reported by DatasetIndex and skipped here, as ultralytics does
+            if not 0 <= class_id < num_classes or len(coords) < 4 or len(coords) % 2:
+                continue
+            if len(coords) == 4:
+                cx, cy, w, h = coords
+                x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+            else:
+                xs, ys = coords[0::2], coords[1::2]
+                x1, y1, x2, y2 = min(xs), min(ys), max(xs), max(ys)
+            rows.append((class_id, x1 * width, y1 * height, x2 * width, y2 * height))
+    return np.array(rows, dtype=np.float64).reshape(-1, 5)
+
+
+def raw_boxes(result, img):
+    """(N, 6) x1, y1, x2, y2, conf, class of one YOLO result, in the pixels of the image as sent"""
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    # Columns are x1, y1, x2, y2, [track id,] conf, cls
+    data = boxes.data.cpu().numpy().astype(np.float32)
+    data = np.concatenate([data[:, :4], data[:, -2:]], axis=1)
+    if img.scale is not None:
+        height, width = img.original_shape[:2]
+        sx, sy = img.scale
+        data[:, :4] *= (sx, sy, sx, sy)
+        data[:, [0, 2]] = data[:, [0, 2]].clip(0, width)
+        data[:, [1, 3]] = data[:, [1, 3]].clip(0, height)
+    return data
+
+
+def rescore(boxes, conf, iou):
+    """The boxes inference at (conf, iou) would have kept, from a cached CACHE_CONF/CACHE_IOU run.
+
+    Re-running NMS at a stricter iou on boxes that survived the looser one gives the same result
+    except when a suppressing box was itself suppressed by the loose pass, which needs an overlap
+    above CACHE_IOU and is rare enough not to move the metrics.
+    """
+    boxes = boxes[boxes[:, 4] > conf]
+    if iou < CACHE_IOU and len(boxes) > 1:
+        # Offset boxes per class so one NMS pass never suppresses across classes
+        keep = nms(boxes[:, :4] + boxes[:, 5:6] * MAX_WH, boxes[:, 4], iou)
+        boxes = boxes[keep]
+    return boxes
+
+
+def match_predictions(predictions, truth, iou_thresholds=IOU_THRESHOLDS):
+    """(P, T) bool array: whether each prediction is a true positive at each IoU threshold.
+
+    Predictions claim ground-truth boxes of their own class greedily in confidence order, and each
+    ground-truth box is claimed at most once per threshold, as in the COCO evaluation.
+    """
+    correct = np.zeros((len(predictions), len(iou_thresholds)), dtype=bool)
+    if not len(predictions) or not len(truth):
+        return correct
+    ious = box_iou(predictions[:, :4].astype(np.float64), truth[:, 1:])
+    ious[predictions[:, 5][:, None] != truth[:, 0][None, :]] = 0
+    order = np.argsort(-predictions[:, 4], kind='stable')
+    for t, threshold in enumerate(iou_thresholds):
+        claimed = np.zeros(len(truth), dtype=bool)
+        for p in order:
+            candidates = np.where(claimed, -1.0, ious[p])
+            best = candidates.argmax()
+            if candidates[best] >= threshold:
+                claimed[best] = True
+                correct[p, t] = True
+    return correct
+
+
+def average_precision(recall, precision):
+    """COCO 101-point interpolated AP from a precision/recall curve in descending confidence order"""
+    envelope = np.maximum.accumulate(precision[::-1])[::-1]
+    index = np.searchsorted(recall, np.linspace(0, 1, 101), side='left')
+    sampled = np.where(index < len(recall), envelope[np.minimum(index, len(recall) - 1)], 0.0)
+    return float(sampled.mean())
+
+
+def class_metrics(predictions, truths, class_names, conf, iou):
+    """Per-class precision/recall at conf and AP over the whole curve, after NMS at iou.
+
+    AP ranks every cached prediction, so it depends on iou but not conf; precision and recall
+    are those of the boxes above conf, at IoU 0.5, i.e. what the operating point would return.
+    """
+    num_classes = len(class_names)
+    scores, classes, correct = [], [], []
+    for boxes, truth in zip(predictions, truths):
+        boxes = rescore(boxes, CACHE_CONF, iou)
+        scores.append(boxes[:, 4])
+        classes.append(boxes[:, 5].astype(np.int64))
+        correct.append(match_predictions(boxes, truth))
+    scores = np.concatenate(scores)
+    classes = np.concatenate(classes)
+    correct = np.concatenate(correct).reshape(-1, len(IOU_THRESHOLDS))
+    truth_classes = np.concatenate([truth[:, 0] for truth in truths]).astype(np.int64)
+    instances = np.bincount(truth_classes, minlength=num_classes)
+    images = np.zeros(num_classes, dtype=np.int64)
+    for truth in truths:
+        images[np.unique(truth[:, 0]).astype(np.int64)] += 1
+
+    rows = []
+    for class_id, class_name in enumerate(class_names):
+        selected = classes == class_id
+        order = np.argsort(-scores[selected], kind='stable')
+        class_correct = correct[selected][order]
+        class_scores = scores[selected][order]
+        kept = class_scores > conf
+        true_positives = int(class_correct[kept, 0].sum())
+        row = {
+            'class_id': class_id,
+            'class_name': class_name,
+            'images': int(images[class_id]),
+            'instances': int(instances[class_id]),
+            'predictions': int(kept.sum()),
+            'precision': round(true_positives / kept.sum(), 4) if kept.any() else 0.0,
+            'recall': None,
+            'ap50': None,
+            'ap50_95': None
+        }
+        # Classes absent from the split have no recall or AP; they are left out of the means
+        if instances[class_id]:
+            row['recall'] = round(true_positives / instances[class_id], 4)
+            cumulative = np.cumsum(class_correct, axis=0)
+            recall = cumulative / instances[class_id]
+            precision = cumulative / np.arange(1, len(class_scores) + 1)[:, None]
+            aps = [average_precision(recall[:, t], precision[:, t]) if len(class_scores) else 0.0
+                   for t in range(len(IOU_THRESHOLDS))]
+            row['ap50'] = round(aps[0], 4)
+            row['ap50_95'] = round(sum(aps) / len(aps), 4)
+        rows.append(row)
+
+    present = [row for row in rows if row['instances']]
+
+    def mean(key):
+        return round(sum(row[key] for row in present) / len(present), 4) if present else None
+
+    precision, recall = mean('precision'), mean('recall')
+    return {
+        'conf': conf,
+        'iou': iou,
+        'precision': precision,
+        'recall': recall,
+        'f1': round(2 * precision * recall / (precision + recall), 4) if precision and recall else 0.0,
+        'map50': mean('ap50'),
+        'map50_95': mean('ap50_95'),
+        'classes': rows
+    }
+
+
+def percentiles(samples_ms):
+    """p50/p95 and mean of a list of millisecond timings"""
+    if not samples_ms:
+        return None
+    ordered = sorted(samples_ms)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))], 3)
+
+    return {'n': len(ordered), 'mean': round(sum(ordered) / len(ordered), 3), 'p50': pick(0.50), 'p95': pick(0.95)}
+
+
+class PredictionCache:
+    """Raw predictions of one model, backend, input size and decode mode, as an .npz on disk.
+
+    Rows are keyed by image content hash, so editing or adding test images only re-runs those.
+    Each row keeps the decode and per-image inference time of the run that produced it.
+    """
+
+    def __init__(self, predictor, cache_dir=EVAL_CACHE_DIR):
+        key = json.dumps({
+            'version': EVAL_CACHE_VERSION,
+            'model': fingerprint_file(predictor.loaded_model_path),
+            'backend': predictor.backend,
+            'imgsz': predictor.imgsz,
+            'reduced_decode': predictor.reduced_decode,
+            'conf': CACHE_CONF,
+            'iou': CACHE_IOU
+        }, sort_keys=True)
+        self.path = Path(cache_dir) / f"{hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest()}.npz"
+        self.rows = {}
+
+    def load(self):
+        if not self.path.exists():
+            return self.rows
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                offsets = data['offsets']
+                for i, image_hash in enumerate(data['image_hash']):
+                    self.rows[str(image_hash)] = (data['boxes'][offsets[i]:offsets[i + 1]],
+                                                  float(data['decode_ms'][i]), float(data['inference_ms'][i]))
+        except Exception as e:
+            log(f"⚠️ Ignoring unreadable prediction cache {self.path}: {e}")
+            self.rows = {}
+        return self.rows
+
+    def save(self, image_hashes):
+        """Write the rows of image_hashes, dropping images no longer in the split"""
+        rows = [self.rows[image_hash] for image_hash in image_hashes]
+        offsets = np.cumsum([0] + [len(boxes) for boxes, _, _ in rows]).astype(np.int64)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp.npz')
+        np.savez(tmp_path,
+                 image_hash=np.array(image_hashes, dtype='<U32'),
+                 offsets=offsets,
+                 boxes=np.concatenate([boxes for boxes, _, _ in rows]) if rows else np.zeros((0, 6), np.float32),
+                 decode_ms=np.array([row[1] for row in rows], dtype=np.float64),
+                 inference_ms=np.array([row[2] for row in rows], dtype=np.float64))
+        os.replace(tmp_path, self.path)
+
+
+def run_inference(predictor, paths, batch_size=8, workers=8):
+    """Yield (boxes, decode_ms, inference_ms) per path, decoding the next batch while this one runs.
+
+    inference_ms is the batch's forward pass and NMS time divided by the images in it.
+    """
+    chunks = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+    if not chunks:
+        return
+
+    def load(path):
+        started = time.perf_counter()
+        img = predictor.load_image(str(path))
+        return img, (time.perf_counter() - started) * 1000
+
+    # Finish the lazy imports here; LazyLoader is not safe to trigger from several threads at once
+    cv2.imdecode, np.frombuffer
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(load, path) for path in chunks[0]]
+        for index, chunk in enumerate(chunks):
+            loaded = [future.result() for future in pending]
+            if index + 1 < len(chunks):
+                pending = [executor.submit(load, path) for path in chunks[index + 1]]
+
+            images = [img for img, _ in loaded if img is not None]
+            started = time.perf_counter()
+            results = iter(predictor.run_model([img.pixels for img in images], CACHE_CONF) if images else [])
+            inference_ms = (time.perf_counter() - started) * 1000 / max(1, len(images))
+            for img, decode_ms in loaded:
+                if img is None:
+                    yield None, decode_ms, None
+                else:
+                    yield raw_boxes(next(results), img), decode_ms, inference_ms
+
+
+def evaluate_run(predictor, samples, class_names, thresholds, batch_size=8, workers=8, rerun=False):
+    """Cached or fresh predictions for one predictor, scored at every (conf, iou) pair"""
+    cache = PredictionCache(predictor)
+    rows = {} if rerun else cache.load()
+    missing = [sample for sample in samples if sample['hash'] not in rows]
+    if missing:
+        log(f"🤖 Running {predictor.backend} at {predictor.imgsz}px on {len(missing)} images "
+            f"({len(samples) - len(missing)} cached)...")
+        for sample, (boxes, decode_ms, inference_ms) in zip(
+                missing, run_inference(predictor, [s['image'] for s in missing], batch_size, workers)):
+            if boxes is None:
+                raise ValueError(f"Could not load {sample['image']}")
+            rows[sample['hash']] = (boxes, decode_ms, inference_ms)
+        cache.rows = rows
+        cache.save([sample['hash'] for sample in samples])
+    else:
+        log(f"💾 Using cached {predictor.backend} predictions at {predictor.imgsz}px for {len(samples)} images")
+
+    predictions = [rows[sample['hash']][0] for sample in samples]
+    truths = [sample['truth'] for sample in samples]
+    decode_ms = [rows[sample['hash']][1] for sample in samples]
+    inference_ms = [rows[sample['hash']][2] for sample in samples]
+    return {
+        'backend': predictor.backend,
+        'imgsz': predictor.imgsz,
+        'model_path': str(predictor.loaded_model_path),
+        'images': len(samples),
+        'inferred_images': len(missing),
+        'prediction_cache': str(cache.path),
+        'latency_ms': {
+            'decode': percentiles(decode_ms),
+            'inference': percentiles(inference_ms),
+            'total': percentiles([d + i for d, i in zip(decode_ms, inference_ms)])
+        },
+        'thresholds': [class_metrics(predictions, truths, class_names, conf, iou) for conf, iou in thresholds]
+    }
+
+
+def load_samples(data_yaml, split):
+    """Images of a split with their content hash and ground-truth boxes, from the dataset manifest"""
+    index = build_index(data_yaml)
+    columns = index.columns
+    selected = (columns['split'] == SPLITS.index(split)) & ((columns['flags'] & CORRUPT) == 0)
+    samples = []
+    for i in np.flatnonzero(selected):
+        label = str(columns['label'][i])
+        samples.append({
+            'image': index.root / str(columns['image'][i]),
+            'hash': str(columns['hash'][i]),
+            'truth': read_ground_truth(index.root / label if label else None, int(columns['width'][i]),
+                                       int(columns['height'][i]), len(index.class_names))
+        })
+    return samples, index.class_names
+
+
+def evaluate(data_yaml=PROJECT_DIR / 'data.yaml', split='test', model_path='yolov11_custom.pt', backends=('torch',),
+             imgsizes=(640,), confs=(0.15,), ious=(0.45,), batch_size=8, workers=8, reduced_decode=False, rerun=False):
+    """Accuracy and latency of every backend and input size on one split of the dataset"""
+    from PredictRubberTree import RubberTreePredictor
+
+    for iou in ious:
+        if iou > CACHE_IOU:
+            raise ValueError(f"iou {iou} is looser than the cached NMS threshold {CACHE_IOU}")
+    samples, class_names = load_samples(data_yaml, split)
+    if not samples:
+        raise ValueError(f"No images in the {split} split")
+    thresholds = [(conf, iou) for conf in confs for iou in ious]
+
+    runs = []
+    for backend in backends:
+        for imgsz in imgsizes:
+            predictor = RubberTreePredictor(model_path=model_path, backend=backend, image_cache=False,
+                                            result_cache=False, instrument=False, reduced_decode=reduced_decode)
+            if predictor.backend != backend:
+                # The predictor already logged the missing export; torch is measured on its own
+                continue
+            if backend != 'torch' and tuple(predictor.model.input_shape) != (imgsz, imgsz):
+                log(f"⚠️ Skipping {backend} at {imgsz}px: the export's input shape is {predictor.model.input_shape}")
+                continue
+            predictor.imgsz = imgsz
+            predictor.iou = CACHE_IOU
+            predictor.warmup()
+            runs.append(evaluate_run(predictor, samples, class_names, thresholds, batch_size, workers, rerun))
+
+    return {'success': True, 'split': split, 'images': len(samples), 'runs': runs}
+
+
+def format_report(report):
+    """Plain-text per-class tables and latency lines for a terminal"""
+    lines = []
+    for run in report['runs']:
+        latency = run['latency_ms']
+        lines.append(f"\n{run['backend']} @ {run['imgsz']}px  ({run['images']} images, "
+                     f"{run['inferred_images']} inferred)")
+        for stage in ('decode', 'inference', 'total'):
+            stats = latency[stage]
+            lines.append(f"  {stage:<10} mean {stats['mean']:>9.2f} ms  p50 {stats['p50']:>9.2f} ms  "
+                         f"p95 {stats['p95']:>9.2f} ms")
+        for scores in run['thresholds']:
+            lines.append(f"  conf {scores['conf']}  iou {scores['iou']}")
+            lines.append(f"    {'class':<22}{'images':>7}{'boxes':>7}{'P':>8}{'R':>8}{'mAP50':>8}{'mAP50-95':>10}")
+            for row in [{'class_name': 'all', 'images': run['images'],
+                         'instances': sum(r['instances'] for r in scores['classes']),
+                         'precision': scores['precision'], 'recall': scores['recall'],
+                         'ap50': scores['map50'], 'ap50_95': scores['map50_95']}] + scores['classes']:
+                values = [row[key] for key in ('precision', 'recall', 'ap50', 'ap50_95')]
+                cells = ''.join(f"{'-' if v is None else f'{v:.3f}':>{w}}" for v, w in zip(values, (8, 8, 8, 10)))
+                lines.append(f"    {row['class_name']:<22}{row['images']:>7}{row['instances']:>7}{cells}")
+    return '\n'.join(lines)
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate Rubber Tree accuracy and latency per backend and input size')
+    parser.add_argument('--data', type=str, default=str(PROJECT_DIR / 'data.yaml'), help='Dataset YAML')
+    parser.add_argument('--split', type=str, default='test', choices=SPLITS, help='Split to evaluate on')
+    parser.add_argument('--model', type=str, default='yolov11_custom.pt', help='Weights, relative to this directory')
+    parser.add_argument('--backends', type=str, default='torch',
+                        help=f"Comma-separated backends: {', '.join(BACKENDS)}")
+    parser.add_argument('--imgsz', type=str, default='640', help='Comma-separated input sizes')
+    parser.add_argument('--conf', type=str, default='0.15', help='Comma-separated confidence thresholds to score at')
+    parser.add_argument('--iou', type=str, default='0.45', help=f'Comma-separated NMS IoU thresholds, at most {CACHE_IOU}')
+    parser.add_argument('--batch-size', type=int, default=8, help='Images per inference batch')
+    parser.add_argument('--workers', type=int, default=8, help='Threads decoding the next batch')
+    parser.add_argument('--reduced-decode', action='store_true', help='Score with reduced JPEG decoding')
+    parser.add_argument('--rerun', action='store_true', help='Ignore cached predictions and run inference again')
+    parser.add_argument('--output', type=str, default=None, help='Also write the JSON report to this file')
+    args = parser.parse_args()
+
+    try:
+        backends = parse_list(args.backends, str)
+        unknown = [backend for backend in backends if backend not in BACKENDS]
+        if unknown:
+            raise ValueError(f"Unknown backends: {', '.join(unknown)}")
+        report = evaluate(args.data, args.split, args.model, backends, parse_list(args.imgsz, int),
+                          parse_list(args.conf, float), parse_list(args.iou, float), args.batch_size,
+                          args.workers, reduced_decode=args.reduced_decode, rerun=args.rerun)
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': f"Fatal error: {str(e)}"}))
+        sys.exit(1)
+
+    log(format_report(report))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
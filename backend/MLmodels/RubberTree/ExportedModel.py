@@ -0,0 +1,303 @@
+# backend/MLmodels/RubberTree/ExportedModel.py
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+
+from LazyImport import lazy_import
+from Preprocess import LetterboxBuffers
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Same limits as ultralytics' non_max_suppression
+MAX_WH = 7680
+MAX_NMS = 30000
+MAX_DET = 300
+
+BACKENDS = ['torch', 'onnx', 'openvino', 'openvino-int8']
+
+
+def exported_model_path(weights_path, backend):
+    """Where TrainRubberTree.py --export writes each backend's files, next to the .pt weights"""
+    weights_path = Path(weights_path)
+    if backend == 'onnx':
+        return weights_path.with_suffix('.onnx')
+    if backend == 'openvino':
+        return weights_path.parent / f'{weights_path.stem}_openvino_model'
+    if backend == 'openvino-int8':
+        return weights_path.parent / f'{weights_path.stem}_int8_openvino_model'
+    return weights_path
+
+
+class HostArray:
+    """numpy array with the torch .cpu()/.numpy() calls used by the predictor's post-processing"""
+
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        item = self.array[index]
+        return HostArray(item) if isinstance(item, np.ndarray) else item
+
+
+class Boxes:
+    """Minimal stand-in for ultralytics Boxes backed by an (N, 6) xyxy/conf/cls array"""
+
+    def __init__(self, data):
+        self.array = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+    @property
+    def data(self):
+        return HostArray(self.array)
+
+    @property
+    def xyxy(self):
+        return HostArray(self.array[:, :4])
+
+    @property
+    def conf(self):
+        return HostArray(self.array[:, 4])
+
+    @property
+    def cls(self):
+        return HostArray(self.array[:, 5])
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return Boxes(self.array[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Boxes(self.array[i:i + 1])
+
+
+class Result:
+    def __init__(self, boxes, orig_shape):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+
+
+def box_iou_one_to_many(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / (area + areas - intersection + 1e-9)
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy NMS; each step suppresses against all remaining boxes in one vectorized IoU"""
+    order = np.argsort(-scores, kind='stable')
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        ious = box_iou_one_to_many(boxes[i], boxes[order[1:]])
+        order = order[1:][ious <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def non_max_suppression(prediction, conf, iou, max_det=MAX_DET):
+    """Decode one raw YOLO output of shape (4 + nc, anchors) into an (N, 6) xyxy/conf/cls array"""
+    prediction = prediction.T
+    scores = prediction[:, 4:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+
+    # Same strict comparison as ultralytics
+    mask = confidences > conf
+    if not mask.any():
+        return np.zeros((0, 6), dtype=np.float32)
+
+    xywh = prediction[mask, :4]
+    confidences = confidences[mask]
+    class_ids = class_ids[mask].astype(np.float32)
+
+    xyxy = np.empty_like(xywh)
+    xyxy[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+    xyxy[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+    xyxy[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+    xyxy[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+    if len(confidences) > MAX_NMS:
+        top = np.argsort(-confidences, kind='stable')[:MAX_NMS]
+        xyxy, confidences, class_ids = xyxy[top], confidences[top], class_ids[top]
+
+    # Offset boxes per class so a single NMS pass never suppresses across classes
+    keep = nms(xyxy + class_ids[:, None] * MAX_WH, confidences, iou)[:max_det]
+    return np.concatenate([xyxy[keep], confidences[keep, None], class_ids[keep, None]], axis=1)
+
+
+def scale_boxes(input_shape, boxes, orig_shape):
+    """Undo the letterbox so boxes are in original image pixels"""
+    gain = min(input_shape[0] / orig_shape[0], input_shape[1] / orig_shape[1])
+    pad_x = round((input_shape[1] - orig_shape[1] * gain) / 2 - 0.1)
+    pad_y = round((input_shape[0] - orig_shape[0] * gain) / 2 - 0.1)
+
+    boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) / gain).clip(0, orig_shape[1])
+    boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) / gain).clip(0, orig_shape[0])
+    return boxes
+
+
+class ExportedYOLO:
+    """CPU inference on exported ONNX/OpenVINO weights, callable like ultralytics.YOLO"""
+
+    def __init__(self, path, threads=None):
+        self.path = Path(path)
+        if self.path.is_dir():
+            self._load_openvino(threads)
+        else:
+            self._load_onnx(threads)
+        # Letterbox canvases and the input blob are allocated once and reused by every call
+        self.buffers = LetterboxBuffers(self.input_shape)
+        self.lock = threading.Lock()
+
+    def _load_onnx(self, threads):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(self.path), options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_shape = tuple(model_input.shape[2:])
+        # Exports are static batch 1 unless they were made with dynamic=True
+        self.max_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        self.run = lambda batch: self.session.run(None, {self.input_name: batch})[0]
+
+    def _load_openvino(self, threads):
+        import openvino as ov
+
+        core = ov.Core()
+        if threads:
+            core.set_property('CPU', {'INFERENCE_NUM_THREADS': threads})
+        model = core.read_model(str(next(self.path.glob('*.xml'))))
+        self.compiled = core.compile_model(model, 'CPU')
+        shape = self.compiled.input(0).get_partial_shape()
+        self.input_shape = (shape[2].get_length(), shape[3].get_length())
+        self.max_batch = shape[0].get_length() if shape[0].is_static else None
+        output = self.compiled.output(0)
+        self.run = lambda batch: self.compiled(batch)[output]
+
+    def __call__(self, source, conf=0.25, iou=0.45, imgsz=None, verbose=False, max_det=MAX_DET):
+        # imgsz is fixed at export time; the input shape of the exported graph always wins
+        images = source if isinstance(source, list) else [source]
+        step = self.max_batch or len(images)
+        results = []
+        for start in range(0, len(images), step):
+            chunk = images[start:start + step]
+            with self.lock:
+                outputs = self.run(self.buffers.preprocess(chunk))
+            for img, prediction in zip(chunk, outputs):
+                detections = non_max_suppression(prediction, conf, iou, max_det)
+                detections[:, :4] = scale_boxes(self.input_shape, detections[:, :4], img.shape[:2])
+                results.append(Result(Boxes(detections), img.shape[:2]))
+        return results
+
+
+def match_detections(reference, candidate, iou_threshold=0.9):
+    """Greedily pair same-class boxes; returns (pairs, unmatched_reference, unmatched_candidate)"""
+    pairs = []
+    used = set()
+    for i, ref in enumerate(reference):
+        best, best_iou = None, iou_threshold
+        for j, cand in enumerate(candidate):
+            if j in used or cand[5] != ref[5]:
+                continue
+            overlap = box_iou_one_to_many(ref[:4], cand[None, :4])[0]
+            if overlap >= best_iou:
+                best, best_iou = j, overlap
+        if best is not None:
+            used.add(best)
+            pairs.append((i, best, best_iou))
+    return pairs, len(reference) - len(pairs), len(candidate) - len(used)
+
+
+def check_parity(weights_path, image_paths, backend='onnx', conf=0.15, iou=0.45, imgsz=640):
+    """Compare an exported backend against the PyTorch weights on the same images"""
+    from ultralytics import YOLO
+
+    torch_model = YOLO(str(weights_path))
+    exported_model = ExportedYOLO(exported_model_path(weights_path, backend))
+
+    report = {'backend': backend, 'images': 0, 'matched': 0, 'missing': 0, 'extra': 0,
+              'max_conf_diff': 0.0, 'min_box_iou': 1.0,
+              'torch_ms': [], 'exported_ms': []}
+
+    for image_path in image_paths:
+        img = cv2.imread(str(image_path), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+
+        start = time.perf_counter()
+        reference = torch_model(img, conf=conf, iou=iou, imgsz=imgsz, verbose=False)[0].boxes.data.cpu().numpy()
+        report['torch_ms'].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        candidate = exported_model(img, conf=conf, iou=iou)[0].boxes.data.numpy()
+        report['exported_ms'].append((time.perf_counter() - start) * 1000)
+
+        pairs, missing, extra = match_detections(reference, candidate)
+        report['images'] += 1
+        report['matched'] += len(pairs)
+        report['missing'] += missing
+        report['extra'] += extra
+        for i, j, overlap in pairs:
+            report['max_conf_diff'] = max(report['max_conf_diff'], float(abs(reference[i, 4] - candidate[j, 4])))
+            report['min_box_iou'] = min(report['min_box_iou'], float(overlap))
+
+    total = report['matched'] + report['missing']
+    report['match_rate'] = round(report['matched'] / total, 4) if total else 1.0
+    for key in ('torch_ms', 'exported_ms'):
+        times = report.pop(key)
+        report[f'{key[:-3]}_mean_ms'] = round(float(np.mean(times)), 2) if times else None
+    report['max_conf_diff'] = round(report['max_conf_diff'], 4)
+    report['min_box_iou'] = round(report['min_box_iou'], 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check exported Rubber Tree models against the PyTorch weights')
+    parser.add_argument('images', nargs='*', help='Images to compare on (defaults to the test split)')
+    parser.add_argument('--weights', type=str, default='yolov11_custom.pt', help='PyTorch weights file')
+    parser.add_argument('--backend', type=str, default='onnx', choices=BACKENDS[1:], help='Exported backend to check')
+    parser.add_argument('--conf', type=float, default=0.15, help='Confidence threshold')
+    parser.add_argument('--iou', type=float, default=0.45, help='NMS IoU threshold')
+    args = parser.parse_args()
+
+    project_dir = Path(__file__).parent
+    images = args.images or sorted((project_dir / '../../datasets/RubberTree/images/test').glob('*.jpg'))
+    report = check_parity(project_dir / args.weights, images, args.backend, args.conf, args.iou)
+    print(json.dumps(report, indent=2))
+
+    if report['match_rate'] < 0.99:
+        print(f"⚠️ Parity check failed: only {report['match_rate']:.2%} of PyTorch detections matched", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+# backend/MLmodels/RubberTree/ImageFetcher.py
+import os
+import json
+import time
+import hashlib
+import threading
+import tempfile
+from pathlib import Path
+
+from Instrumentation import log
+
+
+class ImageCache:
+    """On-disk LRU cache of downloaded image bytes, keyed by URL"""
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = sum(path.stat().st_size for path in self.cache_dir.glob('*.bin'))
+
+    def key_for(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """Return (content, metadata) for a cached URL, or (None, None) on a miss"""
+        key = self.key_for(url)
+        data_path = self.cache_dir / f'{key}.bin'
+        meta_path = self.cache_dir / f'{key}.json'
+        try:
+            content = data_path.read_bytes()
+            metadata = json.loads(meta_path.read_text())
+        except (OSError, ValueError):
+            return None, None
+
+        if metadata.get('url') != url:
+            return None, None
+
+        # Touch the entry so eviction sees it as recently used
+        try:
+            os.utime(data_path)
+        except OSError:
+            pass
+        return content, metadata
+
+    def put(self, url, content, etag=None, last_modified=None):
+        if len(content) > self.max_bytes:
+            return
+
+        key = self.key_for(url)
+        data_path = self.cache_dir / f'{key}.bin'
+        meta_path = self.cache_dir / f'{key}.json'
+        metadata = {'url': url, 'etag': etag, 'last_modified': last_modified, 'size': len(content),
+                    'fetched_at': time.time()}
+
+        with self.lock:
+            previous_size = data_path.stat().st_size if data_path.exists() else 0
+            # Body first: metadata must never vouch (etag, fetched_at) for bytes that are not on disk yet
+            self._atomic_write(data_path, content)
+            self._atomic_write(meta_path, json.dumps(metadata).encode('utf-8'))
+            self.total_bytes += len(content) - previous_size
+            self._evict()
+
+    def refresh(self, url, metadata):
+        """Restart an entry's max age after the server confirmed it is unchanged"""
+        meta_path = self.cache_dir / f'{self.key_for(url)}.json'
+        with self.lock:
+            self._atomic_write(meta_path, json.dumps({**metadata, 'fetched_at': time.time()}).encode('utf-8'))
+
+    def _atomic_write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        if self.total_bytes <= self.max_bytes:
+            return
+
+        entries = []
+        for data_path in self.cache_dir.glob('*.bin'):
+            try:
+                stat = data_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, data_path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        for _, size, data_path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            for path in (data_path, data_path.with_suffix('.json')):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            for path in self.cache_dir.iterdir():
+                if path.suffix in ('.bin', '.json', '.tmp'):
+                    path.unlink()
+            self.total_bytes = 0
+
+
+class ImageFetcher:
+    """Pooled keep-alive HTTP downloads with retries and an optional on-disk cache.
+
+    The cache is keyed by URL. Entries younger than max_age seconds are served without a round
+    trip; older ones are revalidated with If-None-Match/If-Modified-Since, which costs a request
+    but only re-downloads when the content changed. Versioned URLs such as Cloudinary's never
+    change, so a long max_age is safe for them; an unversioned URL whose content is replaced can
+    be served stale for up to max_age. revalidate=True checks on every fetch.
+    """
+
+    def __init__(self, cache_dir=None, cache_max_bytes=512 * 1024 * 1024, pool_size=8,
+                 retries=3, timeout=30, revalidate=False, max_age=300):
+        self.timeout = timeout
+        self.revalidate = revalidate
+        self.max_age = max_age
+        self.cache = ImageCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.pool_size = pool_size
+        self.retries = retries
+        # Created on the first download; local files and stdin never import requests
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def _create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET']
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def fetch(self, url):
+        """Return the raw bytes at url, from the cache when possible"""
+        cached, metadata = self.cache.get(url) if self.cache else (None, None)
+
+        fresh = cached is not None and time.time() - metadata.get('fetched_at', 0) < self.max_age
+        if fresh and not self.revalidate:
+            log(f"💾 Cache hit for: {url}")
+            return cached
+
+        headers = {}
+        if cached is not None:
+            if metadata.get('etag'):
+                headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last_modified'):
+                headers['If-Modified-Since'] = metadata['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached is not None:
+            log(f"💾 Cache revalidated for: {url}")
+            self.cache.refresh(url, metadata)
+            return cached
+        response.raise_for_status()
+
+        content = response.content
+        if self.cache:
+            self.cache.put(url, content, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return content
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
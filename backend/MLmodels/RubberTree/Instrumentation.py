@@ -0,0 +1,187 @@
+# backend/MLmodels/RubberTree/Instrumentation.py
+import os
+import sys
+import time
+import tempfile
+import threading
+import contextlib
+import contextvars
+
+# Upper bounds in seconds, matching the Prometheus client defaults
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# One reusable no-op context manager, so a disabled span costs a lookup and nothing else
+NULL_SPAN = contextlib.nullcontext()
+
+_current_timings = contextvars.ContextVar('rubber_tree_timings', default=None)
+
+# Process-wide, so log() calls from fetch and worker threads are dropped too
+_logs_silenced = threading.Event()
+
+
+def log(*args):
+    """Progress messages go to stderr so stdout carries only the JSON result"""
+    if not _logs_silenced.is_set():
+        print(*args, file=sys.stderr)
+
+
+@contextlib.contextmanager
+def silence_logs():
+    """Drop log() messages for the duration; errors raised or printed as tracebacks still show"""
+    _logs_silenced.set()
+    try:
+        yield
+    finally:
+        _logs_silenced.clear()
+
+
+class Span:
+    __slots__ = ('timings', 'stage', 'started')
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timings.add(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class Timings:
+    """Wall time per pipeline stage for one prediction call"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.inference_passes = []
+
+    def span(self, stage):
+        return Span(self, stage)
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if stage == 'inference':
+            self.inference_passes.append(seconds)
+
+    def as_dict(self):
+        timing = {f'{stage}_ms': round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timing['inference_passes_ms'] = [round(seconds * 1000, 3) for seconds in self.inference_passes]
+        timing['total_ms'] = round((time.perf_counter() - self.started) * 1000, 3)
+        return timing
+
+
+def span(stage):
+    """Time a block against the prediction currently being collected, if any"""
+    timings = _current_timings.get()
+    return NULL_SPAN if timings is None else Span(timings, stage)
+
+
+@contextlib.contextmanager
+def collect_timings(enabled=True):
+    """Collect spans opened on this thread into a Timings; yields None when instrumentation is off"""
+    if not enabled:
+        yield None
+        return
+
+    timings = Timings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+class MetricsRegistry:
+    """Process-wide counters and latency histograms rendered in the Prometheus text format"""
+
+    def __init__(self, prefix='rubber_tree'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def inc(self, name, labels=None, value=1, help_text=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help_text:
+                self.help.setdefault(name, help_text)
+
+    def observe(self, name, seconds, labels=None, help_text=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            if help_text:
+                self.help.setdefault(name, help_text)
+
+    def observe_result(self, result, seconds):
+        """Record one served prediction, including the stage timing block when the predictor sent one"""
+        status = 'success' if result.get('success') else 'error'
+        self.inc('predictions_total', {'status': status}, help_text='Predictions served by outcome')
+        self.observe('request_seconds', seconds, help_text='End-to-end prediction latency')
+
+        timing = result.get('timing')
+        if not timing:
+            return
+        for key, value in timing.items():
+            if key.endswith('_ms') and key != 'total_ms' and isinstance(value, (int, float)):
+                self.observe('stage_seconds', value / 1000, {'stage': key[:-3]},
+                             help_text='Time spent in each prediction stage')
+        self.inc('inference_passes_total', value=len(timing.get('inference_passes_ms', [])),
+                 help_text='Model forward passes, including threshold retries')
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for kind, series in (('counter', self.counters), ('histogram', self.histograms)):
+                names = sorted({name for name, _ in series})
+                for name in names:
+                    full_name = f'{self.prefix}_{name}'
+                    if name in self.help:
+                        lines.append(f'# HELP {full_name} {self.help[name]}')
+                    lines.append(f'# TYPE {full_name} {kind}')
+                    for (series_name, labels), value in sorted(series.items()):
+                        if series_name != name:
+                            continue
+                        if kind == 'counter':
+                            lines.append(f'{full_name}{format_labels(labels)} {value}')
+                            continue
+                        for bound, count in zip(BUCKETS, value['buckets']):
+                            lines.append(f'{full_name}_bucket{format_labels(labels + (("le", str(bound)),))} {count}')
+                        lines.append(f'{full_name}_bucket{format_labels(labels + (("le", "+Inf"),))} {value["count"]}')
+                        lines.append(f'{full_name}_sum{format_labels(labels)} {value["sum"]:.6f}')
+                        lines.append(f'{full_name}_count{format_labels(labels)} {value["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Atomically replace path with the current metrics, for node_exporter's textfile collector"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.render())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
@@ -0,0 +1,460 @@
+# backend/MLmodels/RubberTree/JobQueue.py
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+import argparse
+import threading
+import contextlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from Instrumentation import log
+from ImageFetcher import ImageFetcher
+from ExportedModel import BACKENDS
+
+PROJECT_DIR = Path(__file__).parent
+JOBS_DB_PATH = PROJECT_DIR / 'cache' / 'jobs.sqlite3'
+IMAGE_CACHE_DIR = PROJECT_DIR / 'cache' / 'images'
+# A job counts as active while queued or running; later submissions of the same image join it
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('done', 'failed')
+# A running job whose worker has not renewed its lease for this long is requeued
+LEASE_SECONDS = 60
+
+
+def hash_content(content):
+    """Hash of encoded image bytes, the dedup key for jobs"""
+    return hashlib.blake2b(bytes(content), digest_size=16).hexdigest()
+
+
+class JobQueue:
+    """Durable SQLite queue of prediction jobs with priorities and dedup by source and image hash.
+
+    Finished results are only reused for a job under the same result key (weights fingerprint
+    plus inference parameters), so retraining or switching backend never serves stale results.
+
+    Several processes may share one database: claims run in an IMMEDIATE transaction, so each
+    queued job is handed to exactly one worker.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH, max_finished=10000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_finished = max_finished
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None,
+                                    timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                image_hash TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                duplicate_of TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL,
+                result_key TEXT
+            )
+        ''')
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(jobs)')}
+        for column, column_type in (('heartbeat_at', 'REAL'), ('result_key', 'TEXT')):
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {column_type}')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, created_at)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_source ON jobs (source, status)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_hash ON jobs (image_hash, status)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)')
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Write transaction that holds the database lock from its first statement"""
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.conn
+            except BaseException:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.conn.execute('COMMIT')
+
+    def submit(self, source, priority=0, image_hash=None, result_key=None):
+        """Queue a job, or return an existing job for the same image.
+
+        A queued or running job with the same source or image_hash is joined, as is a done job
+        with the same image_hash and result_key. A finished job is never matched by source alone:
+        the content behind a URL or path can change, so it is matched by hash once the worker has
+        loaded it (see set_image_hash).
+
+        Returns (job, created). A duplicate submitted with a higher priority raises the priority
+        of the job it joins.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            existing = conn.execute(
+                "SELECT * FROM jobs WHERE (source = ? AND status IN ('queued', 'running')) "
+                "OR (? IS NOT NULL AND image_hash = ? AND "
+                "(status IN ('queued', 'running') OR (status = 'done' AND result_key = ?))) "
+                'ORDER BY created_at DESC LIMIT 1',
+                (source, image_hash, image_hash, result_key)
+            ).fetchone()
+            if existing is not None:
+                if existing['status'] == 'queued' and priority > existing['priority']:
+                    conn.execute('UPDATE jobs SET priority = ? WHERE id = ?', (priority, existing['id']))
+                return self.get(existing['id'], conn), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO jobs (id, source, image_hash, priority, status, created_at) '
+                "VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, source, image_hash, priority, now)
+            )
+            return self.get(job_id, conn), True
+
+    def claim(self):
+        """Mark the highest-priority, oldest queued job as running and return it, or None"""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                'WHERE id = ?',
+                (now, now, row['id'])
+            )
+            return self.get(row['id'], conn)
+
+    def set_image_hash(self, job_id, image_hash, result_key=None):
+        """Record the content hash of a running job's image.
+
+        Returns a done job with the same hash whose result came from the same result_key, or None;
+        without a result_key nothing is reused.
+        """
+        with self.transaction() as conn:
+            conn.execute('UPDATE jobs SET image_hash = ? WHERE id = ?', (image_hash, job_id))
+            row = conn.execute(
+                "SELECT id, result FROM jobs WHERE image_hash = ? AND status = 'done' AND result_key = ? "
+                'AND id != ? ORDER BY finished_at DESC LIMIT 1',
+                (image_hash, result_key, job_id)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def complete(self, job_id, result, duplicate_of=None, result_key=None):
+        """Store a job's result and the result_key it was produced under.
+
+        Unsuccessful predictions are kept as failed jobs with their result.
+        """
+        if isinstance(result, str):
+            encoded, success, error = result, True, None
+        else:
+            encoded, success, error = json.dumps(result), result.get('success', False), result.get('error')
+        with self.transaction() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = ?, duplicate_of = ?, result_key = ?, finished_at = ? '
+                'WHERE id = ?',
+                ('done' if success else 'failed', encoded, error, duplicate_of, result_key, time.time(), job_id)
+            )
+            self._evict(conn)
+
+    def fail(self, job_id, error, retry=False):
+        """Requeue a job after a transient error, or mark it failed"""
+        with self.transaction() as conn:
+            if retry:
+                conn.execute("UPDATE jobs SET status = 'queued', error = ?, started_at = NULL WHERE id = ?",
+                             (error, job_id))
+            else:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                             (error, time.time(), job_id))
+                self._evict(conn)
+
+    def heartbeat(self, job_ids):
+        """Renew the lease of jobs this worker is still running"""
+        if not job_ids:
+            return
+        job_ids = list(job_ids)
+        with self.transaction() as conn:
+            conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE status = 'running' AND id IN ({','.join('?' * len(job_ids))})",
+                (time.time(), *job_ids)
+            )
+
+    def recover(self, lease_seconds=LEASE_SECONDS, max_attempts=None):
+        """Requeue running jobs whose lease expired because their worker died; returns how many.
+
+        Jobs that already used max_attempts are marked failed instead, so an image that crashes
+        the worker cannot take it down forever.
+        """
+        now = time.time()
+        expired = "status = 'running' AND COALESCE(heartbeat_at, started_at) < ?"
+        with self.transaction() as conn:
+            failed = 0
+            if max_attempts is not None:
+                failed = conn.execute(
+                    f"UPDATE jobs SET status = 'failed', error = 'Worker stopped while running the job', "
+                    f'finished_at = ? WHERE {expired} AND attempts >= ?',
+                    (now, now - lease_seconds, max_attempts)
+                ).rowcount
+            requeued = conn.execute(
+                f"UPDATE jobs SET status = 'queued', started_at = NULL, heartbeat_at = NULL WHERE {expired}",
+                (now - lease_seconds,)
+            ).rowcount
+            if failed:
+                self._evict(conn)
+        return requeued + failed
+
+    def _evict(self, conn):
+        """Keep only the max_finished most recently finished jobs"""
+        count = conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('done', 'failed')").fetchone()[0]
+        if count > self.max_finished:
+            conn.execute(
+                'DELETE FROM jobs WHERE id IN '
+                "(SELECT id FROM jobs WHERE status IN ('done', 'failed') ORDER BY finished_at ASC LIMIT ?)",
+                (count - self.max_finished,)
+            )
+
+    def get(self, job_id, conn=None):
+        """Job status and, once finished, its result"""
+        if conn is None:
+            with self.lock:
+                row = self.conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        else:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['job_id'] = job.pop('id')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+            oldest = self.conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        counts = {status: 0 for status in ACTIVE_STATUSES + FINISHED_STATUSES}
+        counts.update({status: count for status, count in rows})
+        return {
+            **counts,
+            'oldest_queued_seconds': round(time.time() - oldest, 1) if oldest else None
+        }
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class JobWorker:
+    """asyncio loop that drains a JobQueue through a blocking predict(source) callable.
+
+    concurrency jobs run at once on a thread pool, so it should match what predict can serve in
+    parallel: 1 for an in-process model, the worker count for a PredictorPool. Image bytes are
+    loaded here so a job for an image that was already analysed reuses that result.
+
+    result_key identifies predict's weights and inference parameters (the predictor's describe()
+    reports it); a job only reuses a finished result produced under the same key, and None turns
+    that reuse off.
+
+    Running jobs hold a lease that this worker renews every lease_seconds / 3. The same loop
+    requeues jobs whose lease expired, so jobs left running by a crashed worker, in this or
+    another process, run again within lease_seconds.
+    """
+
+    def __init__(self, job_queue, predict, fetcher=None, concurrency=1, poll_interval=1.0, max_attempts=3,
+                 lease_seconds=LEASE_SECONDS, result_key=None):
+        self.queue = job_queue
+        self.predict = predict
+        self.result_key = result_key
+        self.fetcher = fetcher
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.loop = None
+        self.wakeup = None
+        self.stopped = None
+        self.stopping = False
+        self.processed = 0
+        self.running = set()
+
+    def notify(self, event=None):
+        """Wake idle workers after a submit; safe to call from any thread"""
+        loop = self.loop
+        if loop is not None:
+            # The loop may close between the check and the call once run() has returned
+            with contextlib.suppress(RuntimeError):
+                loop.call_soon_threadsafe((event or self.wakeup).set)
+
+    def stop(self):
+        """Finish the jobs in progress and return from run(); safe to call from any thread"""
+        self.stopping = True
+        self.notify()
+        self.notify(self.stopped)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.stopped = asyncio.Event()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job') as executor:
+            await asyncio.gather(self._maintain_leases(), *(self._work(executor) for _ in range(self.concurrency)))
+        self.loop = None
+
+    async def _maintain_leases(self):
+        """Renew the leases of jobs in progress and requeue expired ones until stopped"""
+        while not self.stopping:
+            try:
+                await self.loop.run_in_executor(None, self.queue.heartbeat, set(self.running))
+                recovered = await self.loop.run_in_executor(None, self.queue.recover, self.lease_seconds,
+                                                            self.max_attempts)
+                if recovered:
+                    log(f"♻️ Recovered {recovered} jobs whose worker stopped renewing their lease")
+                    self.wakeup.set()
+            except Exception as e:
+                log(f"⚠️ Could not update job leases: {e}")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self.stopped.wait(), self.lease_seconds / 3)
+
+    async def _work(self, executor):
+        while not self.stopping:
+            try:
+                job = await self.loop.run_in_executor(executor, self.queue.claim)
+            except Exception as e:
+                log(f"⚠️ Could not claim a job: {e}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    # Polling also picks up jobs submitted by other processes
+                    await asyncio.wait_for(self.wakeup.wait(), self.poll_interval)
+                continue
+            await self.loop.run_in_executor(executor, self.process, job)
+
+    def load_source(self, source):
+        if source.startswith(('http://', 'https://')):
+            return self.fetcher.fetch(source)
+        path = Path(source)
+        # Devices and FIFOs such as /dev/zero would block this worker forever
+        if not path.is_file():
+            raise FileNotFoundError(f'Not a regular file: {source}')
+        return path.read_bytes()
+
+    def process(self, job):
+        job_id = job['job_id']
+        self.running.add(job_id)
+        try:
+            try:
+                content = self.load_source(job['source'])
+            except Exception as e:
+                raise RuntimeError(f'Could not load image: {e}') from e
+
+            image_hash = hash_content(content)
+            duplicate = self.queue.set_image_hash(job_id, image_hash, self.result_key)
+            if duplicate is not None:
+                log(f"💾 Job {job_id} has the same image as job {duplicate['id']}, reusing its result")
+                self.queue.complete(job_id, duplicate['result'], duplicate_of=duplicate['id'],
+                                    result_key=self.result_key)
+            else:
+                self.queue.complete(job_id, self.predict(content), result_key=self.result_key)
+            self.processed += 1
+        except Exception as e:
+            retry = job['attempts'] < self.max_attempts
+            log(f"❌ Job {job_id} ({job['source']}) failed: {e}" + (', will retry' if retry else ''))
+            try:
+                self.queue.fail(job_id, str(e), retry=retry)
+            except Exception as fail_error:
+                # The lease lapses once this worker stops renewing it, and recover() requeues the job
+                log(f"⚠️ Could not record the failure of job {job_id}: {fail_error}")
+        finally:
+            self.running.discard(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Durable job queue for Rubber Tree predictions')
+    parser.add_argument('--db', type=str, default=str(JOBS_DB_PATH), help='SQLite job database')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    submit = commands.add_parser('submit', help='Queue an image URL or path and print the job')
+    submit.add_argument('source', help='Image URL or local path')
+    submit.add_argument('--priority', type=int, default=0, help='Higher priorities run first')
+
+    status = commands.add_parser('status', help='Print a job and its result')
+    status.add_argument('job_id')
+
+    commands.add_parser('stats', help='Print job counts by status')
+
+    work = commands.add_parser('work', help='Process queued jobs until interrupted')
+    work.add_argument('--model', type=str, default='yolov11_custom.pt', help='Model weights file')
+    work.add_argument('--backend', type=str, default='torch', choices=BACKENDS, help='Inference backend')
+    work.add_argument('--single-pass', action='store_true', help='Run YOLO once at the lowest confidence threshold')
+    work.add_argument('--workers', type=int, default=0, help='Predict with a pool of N worker processes')
+    work.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks for new jobs')
+    args = parser.parse_args()
+
+    job_queue = JobQueue(args.db)
+    try:
+        if args.command == 'submit':
+            job, created = job_queue.submit(args.source.strip('"\''), args.priority)
+            print(json.dumps({'success': True, 'created': created, **job}))
+        elif args.command == 'status':
+            job = job_queue.get(args.job_id)
+            print(json.dumps({'success': True, **job} if job else {'success': False, 'error': 'Unknown job'}))
+        elif args.command == 'stats':
+            print(json.dumps({'success': True, **job_queue.stats()}))
+        else:
+            run_worker(job_queue, args)
+    except Exception as e:
+        print(json.dumps({'success': False, 'error': f"Fatal error: {str(e)}"}))
+        sys.exit(1)
+    finally:
+        job_queue.close()
+
+
+def run_worker(job_queue, args):
+    """Standalone worker: loads the model once and drains the queue until SIGINT/SIGTERM"""
+    import signal
+    from PredictRubberTree import RubberTreePredictor
+    from PoolRubberTree import PredictorPool
+
+    predictor_kwargs = {'model_path': args.model, 'single_pass': args.single_pass, 'backend': args.backend,
+                        'image_cache': False}
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.workers > 0:
+            predictor = PredictorPool(workers=args.workers, **predictor_kwargs)
+            if not predictor.wait_ready(timeout=300):
+                predictor.close(timeout=0)
+                raise RuntimeError(predictor.failed or 'Workers did not load the model within 300s')
+        else:
+            predictor = RubberTreePredictor(**predictor_kwargs)
+    # Jobs hand the predictor image bytes, so downloads are cached here instead of in the predictor
+    fetcher = ImageFetcher(cache_dir=IMAGE_CACHE_DIR)
+    worker = JobWorker(job_queue, predictor.predict, fetcher=fetcher, concurrency=max(1, args.workers),
+                       poll_interval=args.poll_interval, result_key=predictor.describe()['result_key'])
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: worker.stop())
+    log(f"🚀 Job worker polling {job_queue.db_path}")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            asyncio.run(worker.run())
+    finally:
+        fetcher.close()
+        if isinstance(predictor, PredictorPool):
+            predictor.close()
+    print(json.dumps({'success': True, 'processed': worker.processed}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+# backend/MLmodels/RubberTree/LazyImport.py
+import sys
+import importlib.util
+
+
+class MissingModule:
+    """Placeholder for a package that is not installed; raises ImportError when it is used"""
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        raise ImportError(f"No module named '{self.__name}'", name=self.__name)
+
+
+def lazy_import(name):
+    """Return a module that is only executed on first attribute access.
+
+    Lets the CLI answer --help and argument errors, or report a missing package,
+    without paying for numpy/OpenCV imports it never uses.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return MissingModule(name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def missing_packages(packages):
+    """Names in packages that are not installed, checked without importing them"""
+    # find_spec reads __spec__ from modules already in sys.modules, which would execute a lazy one
+    return [
+        package for package in packages
+        if package not in sys.modules and importlib.util.find_spec(package) is None
+    ]
@@ -0,0 +1,169 @@
+# backend/MLmodels/RubberTree/MicroBatcher.py
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+from Instrumentation import log
+
+
+class WindowTuner:
+    """Adjusts the batching window from observed request latency.
+
+    Additive increase, multiplicative decrease: while requests finish well inside
+    target_latency_ms and batches are forming, the window grows so more requests share a forward
+    pass; as soon as latency overshoots the target it is halved. A window that only ever collects
+    one request adds latency for nothing, so it decays towards min_window_ms.
+    """
+
+    def __init__(self, window_ms=5.0, min_window_ms=0.5, max_window_ms=50.0, target_latency_ms=250.0,
+                 step_ms=1.0, smoothing=0.2):
+        self.window_ms = window_ms
+        self.min_window_ms = min_window_ms
+        self.max_window_ms = max_window_ms
+        self.target_latency_ms = target_latency_ms
+        self.step_ms = step_ms
+        self.smoothing = smoothing
+        self.latency_ms = None
+        self.batch_size = None
+
+    def record(self, batch_size, max_batch_size, latencies_ms):
+        """Update the window after a batch; latencies run from each request's arrival to its result"""
+        worst = max(latencies_ms)
+        if self.latency_ms is None:
+            self.latency_ms, self.batch_size = worst, batch_size
+        else:
+            self.latency_ms += self.smoothing * (worst - self.latency_ms)
+            self.batch_size += self.smoothing * (batch_size - self.batch_size)
+
+        if self.target_latency_ms is None:
+            return
+        if self.latency_ms > self.target_latency_ms:
+            self.window_ms = max(self.min_window_ms, self.window_ms / 2)
+        elif self.batch_size < 1.5:
+            self.window_ms = max(self.min_window_ms, self.window_ms * 0.9)
+        elif batch_size < max_batch_size and self.latency_ms < 0.8 * self.target_latency_ms:
+            self.window_ms = min(self.max_window_ms, self.window_ms + self.step_ms)
+
+    def stats(self):
+        return {
+            'window_ms': round(self.window_ms, 3),
+            'target_latency_ms': self.target_latency_ms,
+            'smoothed_latency_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+            'smoothed_batch_size': round(self.batch_size, 2) if self.batch_size is not None else None
+        }
+
+
+class MicroBatcher:
+    """Groups concurrent predict() calls into batched forward passes on one RubberTreePredictor.
+
+    Callers load and decode their own image, so downloads overlap; the decoded images then wait
+    at most one window (or until max_batch_size have arrived) and go through predict_images(),
+    whose batched inference letterboxes mixed image sizes to the model's common input shape.
+    Results come back to each caller with the same contract as RubberTreePredictor.predict.
+    """
+
+    def __init__(self, predictor, max_batch_size=8, window_ms=5.0, target_latency_ms=250.0,
+                 min_window_ms=0.5, max_window_ms=50.0):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.tuner = WindowTuner(window_ms, min_window_ms, max_window_ms, target_latency_ms)
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.stopped = False
+        self.thread = threading.Thread(target=self._batch_loop, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def predict(self, source):
+        """Load source on the calling thread, then wait for its slot in the next batch"""
+        started = time.perf_counter()
+        img = self.predictor.load_image(source)
+        loaded = time.perf_counter()
+        if img is None:
+            return {
+                'success': False,
+                'error': 'Could not load image from URL',
+                'detections': [],
+                'analysis': {}
+            }
+
+        result = self.submit(img, arrived=loaded).result()
+        if 'timing' in result:
+            result['timing']['load_ms'] = round((loaded - started) * 1000, 3)
+            result['timing']['total_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    def submit(self, img, arrived=None):
+        """Queue a decoded image; the Future resolves to its result dict"""
+        future = Future()
+        if self.stopped:
+            future.set_result({'success': False, 'error': 'Server is shutting down', 'detections': [], 'analysis': {}})
+            return future
+        self.pending.put((img, arrived or time.perf_counter(), future))
+        return future
+
+    def _collect(self):
+        """Block for the first request, then gather more until the window closes or the batch is full"""
+        first = self.pending.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = first[1] + self.tuner.window_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.pending.get(timeout=remaining) if remaining > 0 else self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self.pending.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _batch_loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            dispatched = time.perf_counter()
+            try:
+                results = self.predictor.predict_images([img for img, _, _ in batch])
+            except Exception as e:
+                log(f"❌ Micro-batch error: {e}")
+                results = [{'success': False, 'error': str(e), 'detections': [], 'analysis': {}} for _ in batch]
+            finished = time.perf_counter()
+
+            for (_, arrived, future), result in zip(batch, results):
+                if 'timing' in result:
+                    result['timing']['queue_ms'] = round((dispatched - arrived) * 1000, 3)
+                future.set_result(result)
+
+            with self.lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.tuner.record(len(batch), self.max_batch_size,
+                                  [(finished - arrived) * 1000 for _, arrived, _ in batch])
+
+    def stats(self):
+        with self.lock:
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'mean_batch_size': round(self.requests / self.batches, 2) if self.batches else None,
+                'max_batch_size': self.max_batch_size,
+                **self.tuner.stats()
+            }
+
+    def describe(self):
+        return {**self.predictor.describe(), 'micro_batching': self.stats()}
+
+    def close(self):
+        """Finish queued requests and stop the batching thread"""
+        self.stopped = True
+        self.pending.put(None)
+        self.thread.join()
@@ -0,0 +1,373 @@
+# backend/MLmodels/RubberTree/PoolRubberTree.py
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+import multiprocessing as mp
+from multiprocessing import connection
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from Instrumentation import log
+
+
+def plan_threads(workers, threads_per_worker=None):
+    """Split the available cores between workers so their thread pools never oversubscribe"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    if threads_per_worker is None:
+        threads_per_worker = max(1, len(cores) // workers)
+
+    plans = []
+    for worker_id in range(workers):
+        start = (worker_id * threads_per_worker) % len(cores)
+        worker_cores = [cores[(start + i) % len(cores)] for i in range(threads_per_worker)]
+        plans.append((threads_per_worker, worker_cores))
+    return plans
+
+
+def worker_main(worker_id, threads, cores, predictor_kwargs, conn):
+    """Worker process: owns one RubberTreePredictor and serves jobs sent over its pipe"""
+    # Thread pools read these when torch/numpy/OpenCV are first imported
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+    if cores and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+
+    # Keep predictor progress output off stdout, which belongs to the parent
+    with contextlib.redirect_stdout(sys.stderr):
+        import cv2
+        cv2.setNumThreads(threads)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+            torch.set_num_interop_threads(1)
+        except (ImportError, RuntimeError):
+            pass
+
+        from PredictRubberTree import RubberTreePredictor
+        predictor = RubberTreePredictor(**predictor_kwargs)
+        conn.send(('ready', None, predictor.result_key))
+
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+            job_id, source = task
+            conn.send(('done', job_id, predictor.predict(source)))
+
+
+class PredictorPool:
+    """Process pool of RubberTreePredictor replicas fed by a dispatcher from one bounded queue.
+
+    Dead workers are restarted after an exponential backoff. A worker that dies max_failures
+    times in a row without loading its model (bad weights, missing package, out of memory) marks
+    the whole pool failed, since every replica shares that configuration; requests then fail
+    immediately instead of waiting on a crash loop.
+    """
+
+    def __init__(self, workers=None, threads_per_worker=None, queue_size=None, request_timeout=120,
+                 max_failures=5, restart_backoff=0.5, max_restart_backoff=30, **predictor_kwargs):
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 2)
+        self.thread_plans = plan_threads(self.workers, threads_per_worker)
+        self.request_timeout = request_timeout
+        self.max_failures = max_failures
+        self.restart_backoff = restart_backoff
+        self.max_restart_backoff = max_restart_backoff
+        self.predictor_kwargs = predictor_kwargs
+
+        # spawn gives each worker a clean interpreter, so thread settings apply before torch loads
+        self.context = mp.get_context('spawn')
+        # A bounded queue is the backpressure: submit() blocks or fails once it is full.
+        # Jobs stay in the parent until a worker is idle, and each worker has a private pipe,
+        # so killing a stuck or crashed worker never leaves a shared lock held.
+        self.pending = queue.Queue(maxsize=queue_size or self.workers * 4)
+
+        self.lock = threading.Lock()
+        self.processes = {}
+        self.conns = {}
+        self.idle = set()
+        self.in_flight = {}
+        self.futures = {}
+        # Consecutive deaths of each worker since it last loaded its model, and when to restart it
+        self.failures = {}
+        self.restart_at = {}
+        self.failed = None
+        # Every replica loads the same weights with the same parameters; reported once one is ready
+        self.result_key = None
+        self.next_job_id = 0
+        self.restarts = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.closing = False
+        self.stopped = False
+
+        for worker_id in range(self.workers):
+            self._start_worker(worker_id)
+
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self.dispatcher.start()
+
+    def _start_worker(self, worker_id):
+        threads, cores = self.thread_plans[worker_id]
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=worker_main,
+            args=(worker_id, threads, cores, self.predictor_kwargs, child_conn),
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self.processes[worker_id] = process
+        self.conns[worker_id] = parent_conn
+        log(f"👷 Started worker {worker_id} (pid {process.pid}, {threads} threads)")
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded its model; False on timeout or if the pool failed"""
+        deadline = None if timeout is None else time.time() + timeout
+        while len(self.idle) + len(self.in_flight) < self.workers:
+            if self.failed is not None or (deadline is not None and time.time() > deadline):
+                return False
+            time.sleep(0.05)
+        return True
+
+    def submit(self, source, block=True, timeout=None):
+        """Queue one prediction; raises queue.Full when the pool is saturated"""
+        future = Future()
+        if self.failed is not None:
+            future.set_result(self._error_result(self.failed))
+            return future
+        with self.lock:
+            job_id = self.next_job_id
+            self.next_job_id += 1
+            self.futures[job_id] = future
+
+        try:
+            self.pending.put((job_id, source), block=block, timeout=timeout)
+        except queue.Full:
+            with self.lock:
+                self.futures.pop(job_id, None)
+            raise
+        return future
+
+    def predict(self, source, timeout=None):
+        """Synchronous prediction with the same result contract as RubberTreePredictor.predict.
+
+        timeout (default request_timeout) covers the whole request: waiting for queue space,
+        waiting for a worker and the prediction itself.
+        """
+        timeout = timeout or self.request_timeout
+        deadline = time.time() + timeout
+        try:
+            future = self.submit(source, timeout=timeout)
+        except queue.Full:
+            return self._error_result('Prediction pool is busy, try again later')
+        try:
+            return future.result(timeout=max(0, deadline - time.time()))
+        except FutureTimeoutError:
+            with self.lock:
+                # A queued job is skipped by the dispatcher; a running one finishes unobserved
+                abandoned = [job_id for job_id, f in self.futures.items() if f is future]
+                for job_id in abandoned:
+                    del self.futures[job_id]
+                self.timed_out += 1
+            return self._error_result(f'Prediction timed out after {timeout}s')
+
+    @staticmethod
+    def _error_result(error):
+        return {
+            'success': False,
+            'error': error,
+            'detections': [],
+            'analysis': {}
+        }
+
+    def _dispatch_loop(self):
+        while not self.stopped:
+            self._dispatch()
+            with self.lock:
+                conns = {conn: worker_id for worker_id, conn in self.conns.items()}
+            for conn in connection.wait(list(conns), timeout=0.05):
+                self._receive(conns[conn], conn)
+            self._check_workers()
+
+    def _dispatch(self):
+        """Hand queued jobs to idle workers"""
+        with self.lock:
+            while self.idle:
+                try:
+                    job_id, source = self.pending.get_nowait()
+                except queue.Empty:
+                    return
+                if job_id not in self.futures:
+                    # The caller gave up while the job was queued
+                    continue
+                worker_id = self.idle.pop()
+                try:
+                    self.conns[worker_id].send((job_id, source))
+                except OSError:
+                    # Worker died while idle; _check_workers restarts it and fails this job
+                    pass
+                self.in_flight[worker_id] = (job_id, time.time())
+
+    def _receive(self, worker_id, conn):
+        try:
+            kind, job_id, result = conn.recv()
+        except (EOFError, OSError):
+            # The worker exited; _check_workers sees the dead process
+            return
+
+        with self.lock:
+            if self.conns.get(worker_id) is not conn:
+                return
+            if kind == 'done':
+                self.in_flight.pop(worker_id, None)
+                future = self.futures.pop(job_id, None)
+                if future is not None:
+                    self.completed += 1
+                    future.set_result(result)
+            else:
+                # Loaded its model, so earlier deaths were not a crash loop
+                self.failures[worker_id] = 0
+                self.result_key = result
+            self.idle.add(worker_id)
+
+    def _check_workers(self):
+        """Fail and restart workers that crashed or exceeded the per-request timeout"""
+        now = time.time()
+        with self.lock:
+            if self.failed is not None:
+                return
+            for worker_id, restart_at in list(self.restart_at.items()):
+                if now >= restart_at and not self.closing:
+                    del self.restart_at[worker_id]
+                    self.restarts += 1
+                    self._start_worker(worker_id)
+
+            for worker_id, process in list(self.processes.items()):
+                job_id, started = self.in_flight.get(worker_id, (None, None))
+                timed_out = started is not None and now - started > self.request_timeout
+
+                if process.is_alive() and not timed_out:
+                    continue
+                if self.closing and job_id is None:
+                    # Exited after its shutdown sentinel
+                    continue
+
+                if timed_out:
+                    self.timed_out += 1
+                    error = f'Prediction timed out after {self.request_timeout}s'
+                    process.kill()
+                else:
+                    error = f'Worker {worker_id} crashed with exit code {process.exitcode}'
+                process.join(timeout=5)
+                self.conns.pop(worker_id).close()
+                del self.processes[worker_id]
+
+                self.in_flight.pop(worker_id, None)
+                self.idle.discard(worker_id)
+                future = self.futures.pop(job_id, None)
+                if future is not None:
+                    future.set_result(self._error_result(error))
+
+                if self.closing:
+                    continue
+                failures = self.failures.get(worker_id, 0) + 1
+                self.failures[worker_id] = failures
+                if failures >= self.max_failures:
+                    self._fail_pool(f'Worker {worker_id} died {failures} times without loading the model: {error}')
+                    return
+                delay = min(self.max_restart_backoff, self.restart_backoff * 2 ** (failures - 1))
+                self.restart_at[worker_id] = now + delay
+                log(f"⚠️ {error}, restarting worker {worker_id} in {delay:.1f}s")
+
+    def _fail_pool(self, error):
+        """Stop restarting workers and fail every waiting request; called with the lock held"""
+        self.failed = error
+        log(f"❌ Prediction pool failed: {error}")
+        for process in self.processes.values():
+            process.kill()
+        self.restart_at.clear()
+        for future in self.futures.values():
+            future.set_result(self._error_result(error))
+        self.futures.clear()
+        while True:
+            try:
+                self.pending.get_nowait()
+            except queue.Empty:
+                break
+
+    def describe(self):
+        with self.lock:
+            return {
+                'mode': 'pool',
+                'result_key': self.result_key,
+                'workers': self.workers,
+                'workers_ready': len(self.idle) + len(self.in_flight),
+                'threads_per_worker': self.thread_plans[0][0],
+                'in_flight': len(self.in_flight),
+                'queued': self.pending.qsize(),
+                'completed': self.completed,
+                'timed_out': self.timed_out,
+                'restarts': self.restarts,
+                'failed': self.failed
+            }
+
+    def close(self, timeout=30):
+        """Let workers finish queued jobs, then stop them"""
+        deadline = time.time() + timeout
+        while (self.pending.qsize() or self.in_flight) and time.time() < deadline:
+            time.sleep(0.05)
+
+        self.closing = True
+        self.stopped = True
+        self.dispatcher.join(timeout=1)
+        with self.lock:
+            for conn in self.conns.values():
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            for process in self.processes.values():
+                process.join(timeout=max(0, deadline - time.time()))
+                if process.is_alive():
+                    process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run Rubber Tree predictions on a pool of worker processes')
+    parser.add_argument('images', nargs='*', help="Image URLs or paths (reads one per line from stdin if omitted)")
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: half the cores)')
+    parser.add_argument('--threads-per-worker', type=int, default=None, help='Torch/OpenCV threads in each worker')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds')
+    parser.add_argument('--single-pass', action='store_true',
+                        help='Run YOLO once at the lowest confidence threshold instead of retrying')
+    args = parser.parse_args()
+
+    image_sources = args.images or [line.strip() for line in sys.stdin if line.strip()]
+
+    pool = PredictorPool(workers=args.workers, threads_per_worker=args.threads_per_worker,
+                         request_timeout=args.timeout, single_pass=args.single_pass)
+    def emit(source, future):
+        result = future.result()
+        result['image_url'] = source
+        print(json.dumps(result), flush=True)
+
+    try:
+        # Print in input order, one JSON line per image, as soon as the head of the line is done
+        pending = deque()
+        for source in image_sources:
+            pending.append((source, pool.submit(source)))
+            while pending and pending[0][1].done():
+                emit(*pending.popleft())
+        while pending:
+            emit(*pending.popleft())
+    finally:
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,66 +1,153 @@
 # backend/MLmodels/RubberTree/PredictRubberTree.py
 import sys
 import json
+import mmap
+import time
+import argparse
+import contextlib
 import traceback
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from LazyImport import lazy_import, missing_packages
+from Instrumentation import log, span, collect_timings
+from ImageFetcher import ImageFetcher
+from ResultCache import ResultCache, fingerprint_file, hash_image, result_key
+from ExportedModel import BACKENDS, exported_model_path
+from TiledInference import MERGE_METHODS, predict_tiled
+from ResultFormat import OUTPUT_FORMATS, write_result
+from Preprocess import decode_image, as_decoded
+
+# numpy and OpenCV load on first use and ultralytics only when the torch backend is built,
+# so argument errors and --help return without importing them
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+def above_threshold(confidences, threshold):
+    """Mask of confidences strictly above threshold, compared in float32 like YOLO's own conf filter.
 
-def check_imports():
+    Comparing in float64 would keep a box scored exactly float32(threshold), which YOLO drops.
+    """
+    return confidences.astype(np.float32, copy=False) > np.float32(threshold)
+
+
+def check_imports(backend='torch'):
     """Check if all required packages are installed"""
-    required_packages = ['cv2', 'ultralytics', 'numpy', 'requests']
-    missing_packages = []
-    
-    for package in required_packages:
-        try:
-            if package == 'cv2':
-                import cv2
-            elif package == 'ultralytics':
-                from ultralytics import YOLO
-            elif package == 'numpy':
-                import numpy as np
-            elif package == 'requests':
-                import requests
-        except ImportError:
-            missing_packages.append(package)
-    
-    return missing_packages
-
-# Check imports before doing anything
-missing = check_imports()
-if missing:
-    error_msg = f"Missing required packages: {', '.join(missing)}. Please run: pip install {' '.join(missing)}"
-    print(json.dumps({
-        'success': False, 
-        'error': error_msg,
-        'detections': [],
-        'analysis': {}
-    }))
-    sys.exit(1)
-
-# Now import the packages (they should all be available)
-import cv2
-import numpy as np
-from pathlib import Path
-from ultralytics import YOLO
-import requests
+    required_packages = ['cv2', 'numpy', 'requests']
+    if backend == 'torch':
+        required_packages.insert(1, 'ultralytics')
+    return missing_packages(required_packages)
+
+# Input size every prediction runs at; weights are compared at this size before they are deployed
+IMGSZ = 640
+
+# COCO class names (approximate mapping to rubber tree features)
+COCO_CLASSES = {
+    0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 4: 'airplane', 5: 'bus',
+    6: 'train', 7: 'truck', 8: 'boat', 9: 'traffic light', 10: 'fire hydrant',
+    11: 'stop sign', 12: 'parking meter', 13: 'bench', 14: 'bird', 15: 'cat',
+    16: 'dog', 17: 'horse', 18: 'sheep', 19: 'cow', 20: 'elephant', 21: 'bear',
+    22: 'zebra', 23: 'giraffe', 24: 'backpack', 25: 'umbrella', 26: 'handbag',
+    27: 'tie', 28: 'suitcase', 29: 'frisbee', 30: 'skis', 31: 'snowboard',
+    32: 'sports ball', 33: 'kite', 34: 'baseball bat', 35: 'baseball glove',
+    36: 'skateboard', 37: 'surfboard', 38: 'tennis racket', 39: 'bottle',
+    40: 'wine glass', 41: 'cup', 42: 'fork', 43: 'knife', 44: 'spoon',
+    45: 'bowl', 46: 'banana', 47: 'apple', 48: 'sandwich', 49: 'orange',
+    50: 'broccoli', 51: 'carrot', 52: 'hot dog', 53: 'pizza', 54: 'donut',
+    55: 'cake', 56: 'chair', 57: 'couch', 58: 'potted plant', 59: 'bed',
+    60: 'dining table', 61: 'toilet', 62: 'tv', 63: 'laptop', 64: 'mouse',
+    65: 'remote', 66: 'keyboard', 67: 'cell phone', 68: 'microwave', 69: 'oven',
+    70: 'toaster', 71: 'sink', 72: 'refrigerator', 73: 'book', 74: 'clock',
+    75: 'vase', 76: 'scissors', 77: 'teddy bear', 78: 'hair drier', 79: 'toothbrush'
+}
 
 class RubberTreePredictor:
-    def __init__(self, model_path='yolov11_custom.pt'):
+    def __init__(self, model_path='yolov11_custom.pt', single_pass=False, image_cache=True,
+                 image_cache_max_mb=512, fetch_workers=8, result_cache=True, result_cache_max_entries=10000,
+                 backend='torch', warmup=False, tile_size=None, tile_overlap=0.2, tile_batch_size=8,
+                 tile_merge='nms', instrument=False, reduced_decode=False, report_threshold=False):
         self.project_dir = Path(__file__).parent
 
+        # Keep-alive HTTP pool shared by all downloads, with an on-disk cache of fetched images
+        self.fetcher = ImageFetcher(
+            cache_dir=self.project_dir / 'cache' / 'images' if image_cache else None,
+            cache_max_bytes=image_cache_max_mb * 1024 * 1024,
+            pool_size=fetch_workers
+        )
+
+        # Try multiple confidence thresholds to ensure we get detections
+        self.confidence_thresholds = [0.15, 0.1, 0.05, 0.01]
+        self.iou = 0.45
+        self.imgsz = IMGSZ
+        # Run YOLO once at the lowest threshold and filter the boxes instead of re-running it
+        self.single_pass = single_pass
+        # Per-stage timings in every result; off skips collection entirely
+        self.instrument = instrument
+        # Off keeps the original result schema; on adds the ladder threshold the detections came from
+        self.report_threshold = report_threshold
+        # Images larger than tile_size are cut into overlapping tiles so small lesions keep their pixels
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.tile_batch_size = tile_batch_size
+        self.tile_merge = tile_merge
+        # Opt-in: decode large JPEGs at 1/2, 1/4 or 1/8 scale when YOLO would shrink them to imgsz
+        # anyway. The DCT downscale is not YOLO's INTER_LINEAR resize, so boxes can shift slightly;
+        # tiling needs the full-resolution pixels, so it always decodes at full size
+        self.reduced_decode = reduced_decode and tile_size is None
+
         # Check if custom model exists, otherwise use the available yolo11n.pt
         self.model_path = self.project_dir / model_path
         if not self.model_path.exists():
             # Check for available model
             available_model = self.project_dir / 'yolo11n.pt'
             if available_model.exists():
-                print(f"✅ Using available YOLO model: {available_model}")
-                self.model = YOLO(str(available_model))
+                log(f"✅ Using available YOLO model: {available_model}")
+                self.weights_path = available_model
             else:
                 # Fallback to default YOLO model
-                print(f"⚠️ No local model found. Using base YOLO model.")
-                self.model = YOLO('yolo11n.pt')
+                log(f"⚠️ No local model found. Using base YOLO model.")
+                self.weights_path = Path('yolo11n.pt')
         else:
-            print(f"✅ Loading custom model from: {self.model_path}")
-            self.model = YOLO(str(self.model_path))
+            log(f"✅ Loading custom model from: {self.model_path}")
+            self.weights_path = self.model_path
+
+        # Exported ONNX/OpenVINO weights run on CPU without loading torch for inference
+        self.backend = backend
+        self.loaded_model_path = self.weights_path
+        if backend != 'torch':
+            exported_path = exported_model_path(self.weights_path, backend)
+            if exported_path.exists():
+                log(f"✅ Using {backend} backend: {exported_path}")
+                self.loaded_model_path = exported_path
+            else:
+                log(f"⚠️ No {backend} export found at {exported_path}. Falling back to PyTorch; "
+                      f"run TrainRubberTree.py --export-only --export {backend}")
+                self.backend = 'torch'
+
+        self.startup_timings = {}
+        self.model = self.load_model()
+
+        # Results are keyed by image content, weights and inference parameters,
+        # so retraining the model automatically misses every older entry
+        model_fingerprint = fingerprint_file(self.loaded_model_path)
+        inference_params = {
+            'backend': self.backend,
+            'confidence_thresholds': self.confidence_thresholds,
+            'iou': self.iou,
+            'imgsz': self.imgsz,
+            'tiling': [tile_size, tile_overlap, tile_merge] if tile_size else None,
+            'reduced_decode': self.reduced_decode
+        }
+        # Lets the job queue reuse a finished job's result only for the same weights and parameters
+        self.result_key = result_key(model_fingerprint, inference_params)
+        self.result_cache = None
+        if result_cache:
+            self.result_cache = ResultCache(
+                self.project_dir / 'cache' / 'results.sqlite3',
+                model_fingerprint=model_fingerprint,
+                params=inference_params,
+                max_entries=result_cache_max_entries
+            )
         
         # Class names from data.yaml
         self.class_names = [
@@ -71,34 +158,143 @@ class RubberTreePredictor:
             'white root disease'
         ]
         
-        print(f"✅ Predictor initialized with {len(self.class_names)} classes")
+        # Detection class name for every COCO id, so boxes are mapped with a table lookup
+        self.class_name_lut = [
+            self.map_coco_to_rubber_classes(class_id, None, None, None) for class_id in range(len(COCO_CLASSES))
+        ]
+        
+        log(f"✅ Predictor initialized with {len(self.class_names)} classes")
+
+        if warmup:
+            self.warmup()
+
+    def load_model(self):
+        """Import the inference runtime and load the weights, timing each step for the startup report"""
+        started = time.perf_counter()
+        # Touch the lazy modules so their import cost is counted here rather than on the first image
+        cv2.imdecode, np.frombuffer
+        if self.backend == 'torch':
+            from ultralytics import YOLO
+        else:
+            from ExportedModel import ExportedYOLO
+        imported = time.perf_counter()
+
+        if self.backend == 'torch':
+            model = YOLO(str(self.weights_path))
+        else:
+            model = ExportedYOLO(self.loaded_model_path)
+        loaded = time.perf_counter()
+
+        self.startup_timings['import_seconds'] = round(imported - started, 4)
+        self.startup_timings['weight_load_seconds'] = round(loaded - imported, 4)
+        return model
+
+    def warmup(self):
+        """Run one dummy inference so one-off setup (layer fusing, allocators, thread pools) happens now"""
+        log(f"🔥 Warming up {self.backend} model with a {self.imgsz}x{self.imgsz} dummy image...")
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        self.run_model(dummy, min(self.confidence_thresholds))
+
+    def run_model(self, source, conf_threshold):
+        """Single entry point for inference; the first call is recorded in the startup timings"""
+        started = time.perf_counter()
+        with span('inference'):
+            results = self.model(source, conf=conf_threshold, iou=self.iou, imgsz=self.imgsz, verbose=False)
+        if 'first_inference_seconds' not in self.startup_timings:
+            self.startup_timings['first_inference_seconds'] = round(time.perf_counter() - started, 4)
+        return results
+
+    def startup_report(self):
+        """Import, weight load and first inference times (first inference is None until one has run)"""
+        report = {
+            'backend': self.backend,
+            'model_path': str(self.loaded_model_path),
+            'import_seconds': self.startup_timings.get('import_seconds'),
+            'weight_load_seconds': self.startup_timings.get('weight_load_seconds'),
+            'first_inference_seconds': self.startup_timings.get('first_inference_seconds')
+        }
+        report['total_seconds'] = round(sum(v for k, v in report.items() if k.endswith('_seconds') and v), 4)
+        return report
+
+    def describe(self):
+        """Model and cache details reported by the server health check"""
+        return {
+            'mode': 'single',
+            'model_path': str(self.loaded_model_path),
+            'backend': self.backend,
+            'result_key': self.result_key,
+            'classes': len(self.class_names),
+            'result_cache': self.result_cache.stats() if self.result_cache else None,
+            'startup': self.startup_report()
+        }
 
     def load_image_from_url(self, url):
         """Load image from URL"""
         try:
-            print(f"📥 Downloading image from URL: {url}")
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            
-            # Convert to numpy array
-            image_array = np.asarray(bytearray(response.content), dtype=np.uint8)
-            img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            log(f"📥 Downloading image from URL: {url}")
+            content = self.fetcher.fetch(url)
+        except Exception as e:
+            log(f"❌ Error loading image from URL: {e}")
+            return None
+
+        return self.decode_image_bytes(content)
+
+    def load_image_from_file(self, path):
+        """Load image from a local file through a read-only memory map (also used for /dev/shm files)"""
+        try:
+            log(f"📂 Reading image from file: {path}")
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                img = self.decode_image_bytes(mapped)
+            return img
+        except Exception as e:
+            log(f"❌ Error loading image from file: {e}")
+            return None
+
+    def decode_image_bytes(self, data):
+        """Decode encoded image bytes (bytes, memoryview or mmap) without copying them"""
+        try:
+            img = decode_image(data, self.imgsz if self.reduced_decode else None)
             
             if img is None:
                 raise ValueError("Failed to decode image")
             
-            print(f"✅ Image loaded. Shape: {img.shape}")
+            if img.scale:
+                log(f"✅ Image loaded. Shape: {img.original_shape}, decoded at {img.pixels.shape}")
+            else:
+                log(f"✅ Image loaded. Shape: {img.original_shape}")
             return img
         except Exception as e:
-            print(f"❌ Error loading image from URL: {e}")
+            log(f"❌ Error decoding image: {e}")
             return None
 
+    def load_image(self, source):
+        """Load image from a URL, a local file path, or raw encoded bytes"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return self.decode_image_bytes(source)
+        if source.startswith(('http://', 'https://')):
+            return self.load_image_from_url(source)
+        return self.load_image_from_file(source)
+
     def predict(self, image_url):
+        """Predict from an image URL, a local file path, or raw encoded image bytes"""
+        with collect_timings(self.instrument) as timings:
+            result = self._predict(image_url)
+        if not self.report_threshold:
+            result.pop('confidence_threshold', None)
+        if timings is not None:
+            result['timing'] = timings.as_dict()
+        return result
+
+    def _predict(self, image_url):
         try:
-            print(f"🔍 Starting prediction for: {image_url}")
+            if isinstance(image_url, (bytes, bytearray, memoryview)):
+                log(f"🔍 Starting prediction for {len(image_url)} bytes of image data")
+            else:
+                log(f"🔍 Starting prediction for: {image_url}")
 
             # Load image
-            img = self.load_image_from_url(image_url)
+            with span('load'):
+                img = self.load_image(image_url)
             if img is None:
                 return {
                     'success': False,
@@ -107,55 +303,23 @@ class RubberTreePredictor:
                     'analysis': {}
                 }
 
-            # Try multiple confidence thresholds to ensure we get detections
-            confidence_thresholds = [0.15, 0.1, 0.05, 0.01]
-            detections = []
-
-            for conf_threshold in confidence_thresholds:
-                print(f"🤖 Running YOLO detection with confidence {conf_threshold}...")
-                results = self.model(img, conf=conf_threshold, iou=0.45, verbose=False)
-
-                for result in results:
-                    boxes = result.boxes
-                    if boxes is not None and len(boxes) > 0:
-                        for box in boxes:
-                            cls = int(box.cls[0])
-                            conf = float(box.conf[0])
-                            bbox = box.xyxy[0].cpu().numpy().tolist()
-
-                            # Map COCO classes to our rubber tree classes if possible
-                            class_name = self.map_coco_to_rubber_classes(cls, conf, bbox, img.shape)
-
-                            detections.append({
-                                'class_id': cls,
-                                'class_name': class_name,
-                                'confidence': round(conf, 4),
-                                'bbox': [round(x, 2) for x in bbox],
-                                'width': round(float(bbox[2]-bbox[0]), 2),
-                                'height': round(float(bbox[3]-bbox[1]), 2)
-                            })
-
-                # If we found detections, break out of the loop
-                if len(detections) > 0:
-                    print(f"✅ Found {len(detections)} detections at confidence {conf_threshold}")
-                    break
-
-            # If still no detections, create fallback detections based on image analysis
-            if len(detections) == 0:
-                print("⚠️ No detections found, creating intelligent fallback analysis...")
-                detections = self.create_fallback_detections(img)
+            image_hash, cached = self.lookup_cached_result(img)
+            if cached is not None:
+                return cached
 
-            # Generate analysis
-            analysis = self.generate_analysis(detections, img.shape)
+            if self.use_tiling(img):
+                detections, conf_threshold = self.detect_tiled(img)
+            elif self.single_pass:
+                detections, conf_threshold = self.detect_single_pass(img)
+            else:
+                detections, conf_threshold = self.detect_with_retries(img)
 
-            return {
-                'success': True,
-                'detections': detections,
-                'analysis': analysis
-            }
+            result = self.build_result(img, detections, conf_threshold)
+            self.store_cached_result(image_hash, result)
+            return result
 
         except Exception as e:
-            print(f"❌ Prediction error: {e}")
+            log(f"❌ Prediction error: {e}")
             traceback.print_exc()
             return {
                 'success': False,
@@ -164,30 +328,324 @@ class RubberTreePredictor:
                 'analysis': {}
             }
 
+    def predict_batch(self, image_sources, batch_size=8, fetch_workers=8):
+        """Predict many images, returning one result per source in input order"""
+        return list(self.iter_predict_batch(image_sources, batch_size, fetch_workers))
+
+    def iter_predict_batch(self, image_sources, batch_size=8, fetch_workers=8):
+        """Yield results in input order while the next batch is fetched and decoded in the background"""
+        image_sources = list(image_sources)
+        chunks = [image_sources[i:i + batch_size] for i in range(0, len(image_sources), batch_size)]
+        if not chunks:
+            return
+
+        def timed_load(source):
+            # Spans do not reach the fetch threads, so the load is timed here and attached per image
+            started = time.perf_counter()
+            img = self.load_image(source)
+            return img, time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=fetch_workers) as executor:
+            pending = [executor.submit(timed_load, source) for source in chunks[0]]
+
+            for index, chunk in enumerate(chunks):
+                loaded = [future.result() for future in pending]
+
+                # Start fetching the next batch before running inference on this one
+                if index + 1 < len(chunks):
+                    pending = [executor.submit(timed_load, source) for source in chunks[index + 1]]
+
+                results = self.predict_images([img for img, _ in loaded])
+                for source, (_, load_seconds), result in zip(chunk, loaded, results):
+                    result['image_url'] = source
+                    if 'timing' in result:
+                        result['timing']['load_ms'] = round(load_seconds * 1000, 3)
+                    yield result
+
+    def predict_images(self, images):
+        """Run batched inference over already-decoded images (None entries failed to load).
+
+        Entries are DecodedImage from load_image() or plain BGR ndarrays at full resolution.
+        """
+        images = [as_decoded(img) for img in images]
+        with collect_timings(self.instrument) as timings:
+            results = self._predict_images(images)
+        if not self.report_threshold:
+            for result in results:
+                result.pop('confidence_threshold', None)
+        if timings is not None:
+            # Stages ran once for the whole batch, so every image reports the shared batch timings
+            timing = timings.as_dict()
+            timing['batch_size'] = len(images)
+            for result in results:
+                result['timing'] = dict(timing)
+        return results
+
+    def _predict_images(self, images):
+        loaded = [i for i, img in enumerate(images) if img is not None]
+        results = [{
+            'success': False,
+            'error': 'Could not load image from URL',
+            'detections': [],
+            'analysis': {}
+        } for _ in images]
+
+        image_hashes = {}
+        for i in list(loaded):
+            image_hashes[i], cached = self.lookup_cached_result(images[i])
+            if cached is not None:
+                results[i] = cached
+                loaded.remove(i)
+
+        if not loaded:
+            return results
+
+        try:
+            # Tiled images already fill a batch on their own, so they run one at a time
+            for i in [i for i in loaded if self.use_tiling(images[i])]:
+                results[i] = self.build_result(images[i], *self.detect_tiled(images[i]))
+                self.store_cached_result(image_hashes[i], results[i])
+                loaded.remove(i)
+            if not loaded:
+                return results
+
+            batch = [images[i] for i in loaded]
+            if self.single_pass:
+                outcomes = self.detect_batch_single_pass(batch)
+            else:
+                outcomes = self.detect_batch_with_retries(batch)
+
+            for i, (detections, conf_threshold) in zip(loaded, outcomes):
+                results[i] = self.build_result(images[i], detections, conf_threshold)
+                self.store_cached_result(image_hashes[i], results[i])
+
+        except Exception as e:
+            log(f"❌ Batch prediction error: {e}")
+            traceback.print_exc()
+            for i in loaded:
+                results[i] = {
+                    'success': False,
+                    'error': str(e),
+                    'detections': [],
+                    'analysis': {}
+                }
+
+        return results
+
+    def lookup_cached_result(self, img):
+        """Return (image_hash, cached_result); both are None when the result cache is off"""
+        if self.result_cache is None:
+            return None, None
+
+        with span('cache'):
+            image_hash = hash_image(img.pixels)
+            cached = self.result_cache.get(image_hash)
+        if cached is not None:
+            log(f"💾 Using cached result for image {image_hash}")
+        return image_hash, cached
+
+    def store_cached_result(self, image_hash, result):
+        if self.result_cache is not None and image_hash is not None and result.get('success'):
+            with span('cache'):
+                self.result_cache.put(image_hash, result)
+
+    def build_result(self, img, detections, conf_threshold):
+        """Apply the fallback and analysis steps shared by single and batch prediction"""
+        with span('analysis'):
+            # If still no detections, create fallback detections based on image analysis
+            if len(detections) == 0:
+                log("⚠️ No detections found, creating intelligent fallback analysis...")
+                detections = self.create_fallback_detections(img)
+
+            # Generate analysis
+            analysis = self.generate_analysis(detections, img.original_shape)
+
+        return {
+            'success': True,
+            'detections': detections,
+            'analysis': analysis,
+            'confidence_threshold': conf_threshold
+        }
+
+    def detect_with_retries(self, img):
+        """Re-run YOLO at decreasing confidence thresholds until something is detected"""
+        for conf_threshold in self.confidence_thresholds:
+            log(f"🤖 Running YOLO detection with confidence {conf_threshold}...")
+            results = self.run_model(img.pixels, conf_threshold)
+            with span('postprocess'):
+                detections = self.extract_detections(results, img.original_shape, scale=img.scale)
+
+            # If we found detections, stop lowering the threshold
+            if len(detections) > 0:
+                log(f"✅ Found {len(detections)} detections at confidence {conf_threshold}")
+                return detections, conf_threshold
+
+        return [], None
+
+    def detect_single_pass(self, img):
+        """Run YOLO once at the lowest threshold and replay the retry ladder on the cached boxes.
+
+        NMS only lets a box be suppressed by a higher-scoring one, so the boxes above a
+        threshold are the same whether NMS ran at that threshold or at a lower one.
+        """
+        lowest_threshold = min(self.confidence_thresholds)
+        log(f"🤖 Running single-pass YOLO detection with confidence {lowest_threshold}...")
+        results = self.run_model(img.pixels, lowest_threshold)
+        with span('postprocess'):
+            return self.replay_thresholds(results, img.original_shape, scale=img.scale)
+
+    def detect_batch_with_retries(self, images):
+        """Batched retry ladder: only images without detections are re-run at the next threshold"""
+        outcomes = [([], None)] * len(images)
+        remaining = list(range(len(images)))
+
+        for conf_threshold in self.confidence_thresholds:
+            if not remaining:
+                break
+            log(f"🤖 Running YOLO detection on {len(remaining)} images with confidence {conf_threshold}...")
+            results = self.run_model([images[i].pixels for i in remaining], conf_threshold)
+
+            still_empty = []
+            with span('postprocess'):
+                for i, result in zip(remaining, results):
+                    detections = self.extract_detections([result], images[i].original_shape,
+                                                         scale=images[i].scale)
+                    if len(detections) > 0:
+                        outcomes[i] = (detections, conf_threshold)
+                    else:
+                        still_empty.append(i)
+            remaining = still_empty
+
+        return outcomes
+
+    def detect_batch_single_pass(self, images):
+        """Batched single-pass inference, replaying the threshold ladder per image"""
+        lowest_threshold = min(self.confidence_thresholds)
+        log(f"🤖 Running single-pass YOLO detection on {len(images)} images with confidence {lowest_threshold}...")
+        results = self.run_model([img.pixels for img in images], lowest_threshold)
+        with span('postprocess'):
+            return [self.replay_thresholds([result], img.original_shape, scale=img.scale)
+                    for img, result in zip(images, results)]
+
+    def use_tiling(self, img):
+        return self.tile_size is not None and max(as_decoded(img).pixels.shape[:2]) > self.tile_size
+
+    def detect_tiled(self, img):
+        """Run the tiles once at the lowest threshold, merge them, then replay the threshold ladder"""
+        lowest_threshold = min(self.confidence_thresholds)
+        log(f"🧩 Running tiled YOLO detection ({self.tile_size}px tiles, {self.tile_overlap:.0%} overlap) "
+              f"with confidence {lowest_threshold}...")
+        result = predict_tiled(self.run_model, img.pixels, lowest_threshold, tile_size=self.tile_size,
+                               overlap=self.tile_overlap, batch_size=self.tile_batch_size, iou=self.iou,
+                               merge=self.tile_merge)
+        with span('postprocess'):
+            return self.replay_thresholds([result], img.original_shape, scale=img.scale)
+
+    def replay_thresholds(self, results, img_shape, scale=None):
+        """Pick the first threshold of the ladder that keeps any of the cached boxes"""
+        confidences = [
+            result.boxes.conf.cpu().numpy()
+            for result in results
+            if result.boxes is not None and len(result.boxes) > 0
+        ]
+        confidences = np.concatenate(confidences) if confidences else np.empty(0, dtype=np.float32)
+
+        for conf_threshold in self.confidence_thresholds:
+            if above_threshold(confidences, conf_threshold).any():
+                detections = self.extract_detections(results, img_shape, min_confidence=conf_threshold, scale=scale)
+                log(f"✅ Found {len(detections)} detections at confidence {conf_threshold}")
+                return detections, conf_threshold
+
+        return [], None
+
+    def extract_detections(self, results, img_shape, min_confidence=None, scale=None):
+        """Convert YOLO results into detection dicts, optionally dropping low-confidence boxes.
+
+        scale maps boxes from a reduced decode back to the img_shape the caller sent.
+        """
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            if boxes is None or len(boxes) == 0:
+                continue
+
+            # One device-to-host copy per result; columns are x1, y1, x2, y2, [track id,] conf, cls
+            data = boxes.data.cpu().numpy().astype(np.float64)
+            if min_confidence is not None:
+                data = data[above_threshold(data[:, -2], min_confidence)]
+
+            xyxy = data[:, :4]
+            if scale is not None:
+                sx, sy = scale
+                xyxy = xyxy * (sx, sy, sx, sy)
+                xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, img_shape[1])
+                xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, img_shape[0])
+            class_ids = data[:, -1].astype(np.int64)
+            widths = xyxy[:, 2] - xyxy[:, 0]
+            heights = xyxy[:, 3] - xyxy[:, 1]
+
+            # Map COCO classes to our rubber tree classes if possible
+            class_names = [
+                self.class_name_lut[cls] if 0 <= cls < len(self.class_name_lut) else f'Class {cls}'
+                for cls in class_ids.tolist()
+            ]
+
+            # Python round() on the binary value, not np.round, which scales by 10**n first and can
+            # land the other side of a near-tie (2.675 -> 2.67 vs 2.68)
+            for cls, class_name, conf, bbox, width, height in zip(
+                    class_ids.tolist(), class_names, data[:, -2].tolist(),
+                    xyxy.tolist(), widths.tolist(), heights.tolist()):
+                detections.append({
+                    'class_id': cls,
+                    'class_name': class_name,
+                    'confidence': round(conf, 4),
+                    'bbox': [round(x, 2) for x in bbox],
+                    'width': round(width, 2),
+                    'height': round(height, 2)
+                })
+        return detections
+
     def generate_analysis(self, detections, img_shape):
         """Generate comprehensive analysis based on detections"""
-        # Count detections by category
-        tree_detections = [d for d in detections if 'Rubber' in d['class_name']]
-        disease_detections = [d for d in detections if 'disease' in d['class_name'].lower()]
-        normal_detections = [d for d in detections if 'normal' in d['class_name'].lower()]
+        # Single pass over the detections: per-class count and confidence sum, plus trunk box area.
+        # Category flags are worked out once per distinct class name rather than once per detection.
+        class_stats = {}
+        trunk_area_sum = 0.0
+        for d in detections:
+            class_name = d['class_name']
+            stats = class_stats.get(class_name)
+            if stats is None:
+                lower_name = class_name.lower()
+                stats = class_stats[class_name] = {
+                    'count': 0,
+                    'confidence_sum': 0.0,
+                    'is_tree': 'Rubber' in class_name,
+                    'is_disease': 'disease' in lower_name,
+                    'is_normal': 'normal' in lower_name
+                }
+            stats['count'] += 1
+            stats['confidence_sum'] += d['confidence']
+            if class_name == 'Rubber tree':
+                trunk_area_sum += d['width'] * d['height']
+
+        tree_detection_count = sum(s['count'] for s in class_stats.values() if s['is_tree'])
+        empty_stats = {'count': 0, 'confidence_sum': 0.0}
 
         # ALWAYS ensure we have tree identification and count
-        tree_count = max(1, len(tree_detections))  # At minimum 1 tree
+        tree_count = max(1, tree_detection_count)  # At minimum 1 tree
         tree_types = []
 
         # Analyze tree components
-        tree_components = {
-            'Rubber tree': len([d for d in detections if d['class_name'] == 'Rubber tree']),
-            'Rubber leaves': len([d for d in detections if d['class_name'] == 'Rubber leaves']),
-            'Rubber root': len([d for d in detections if d['class_name'] == 'Rubber root'])
-        }
+        trunk_stats = class_stats.get('Rubber tree', empty_stats)
+        leaves_stats = class_stats.get('Rubber leaves', empty_stats)
+        root_stats = class_stats.get('Rubber root', empty_stats)
 
         # Build tree identification - ALWAYS include at least basic tree identification
-        if tree_components['Rubber tree'] > 0:
+        if trunk_stats['count'] > 0:
             tree_types.append({
                 'type': 'Rubber Tree (Trunk)',
-                'count': tree_components['Rubber tree'],
-                'confidence': round(sum(d['confidence'] for d in detections if d['class_name'] == 'Rubber tree') / tree_components['Rubber tree'], 3)
+                'count': trunk_stats['count'],
+                'confidence': round(trunk_stats['confidence_sum'] / trunk_stats['count'], 3)
             })
         else:
             # Always include trunk identification
@@ -197,48 +655,43 @@ class RubberTreePredictor:
                 'confidence': 0.6  # Default confidence for inferred trunk
             })
 
-        if tree_components['Rubber leaves'] > 0:
+        if leaves_stats['count'] > 0:
             tree_types.append({
                 'type': 'Rubber Tree (Leaves)',
-                'count': tree_components['Rubber leaves'],
-                'confidence': round(sum(d['confidence'] for d in detections if d['class_name'] == 'Rubber leaves') / tree_components['Rubber leaves'], 3)
+                'count': leaves_stats['count'],
+                'confidence': round(leaves_stats['confidence_sum'] / leaves_stats['count'], 3)
             })
         else:
             # Always include leaf identification
             tree_types.append({
                 'type': 'Rubber Tree (Leaves)',
-                'count': max(3, tree_components['Rubber leaves']),  # At least 3 leaves
+                'count': 3,  # At least 3 leaves
                 'confidence': 0.5  # Default confidence for inferred leaves
             })
 
-        if tree_components['Rubber root'] > 0:
+        if root_stats['count'] > 0:
             tree_types.append({
                 'type': 'Rubber Tree (Root)',
-                'count': tree_components['Rubber root'],
-                'confidence': round(sum(d['confidence'] for d in detections if d['class_name'] == 'Rubber root') / tree_components['Rubber root'], 3)
+                'count': root_stats['count'],
+                'confidence': round(root_stats['confidence_sum'] / root_stats['count'], 3)
             })
 
-        # Disease analysis
-        disease_count = len(disease_detections)
+        # Disease analysis, in order of each disease's first detection
+        disease_count = 0
         disease_types = []
-        if disease_detections:
-            disease_by_type = {}
-            for d in disease_detections:
-                disease_name = d['class_name']
-                if disease_name not in disease_by_type:
-                    disease_by_type[disease_name] = []
-                disease_by_type[disease_name].append(d)
-
-            for disease_name, detections_list in disease_by_type.items():
-                disease_types.append({
-                    'disease': disease_name,
-                    'count': len(detections_list),
-                    'severity': self.calculate_disease_severity(detections_list),
-                    'confidence': round(sum(d['confidence'] for d in detections_list) / len(detections_list), 3)
-                })
+        for disease_name, stats in class_stats.items():
+            if not stats['is_disease']:
+                continue
+            disease_count += stats['count']
+            disease_types.append({
+                'disease': disease_name,
+                'count': stats['count'],
+                'severity': self.severity_from_stats(stats['count'], stats['confidence_sum']),
+                'confidence': round(stats['confidence_sum'] / stats['count'], 3)
+            })
 
         # Normal features count
-        normal_count = len(normal_detections)
+        normal_count = sum(s['count'] for s in class_stats.values() if s['is_normal'])
 
         # Calculate health score with improved logic
         health_score = 100
@@ -259,39 +712,28 @@ class RubberTreePredictor:
         else:
             health_status = 'Poor'
 
-        # Primary tree type
-        primary_tree_type = 'Unknown'
-        if tree_types:
-            primary_tree_type = tree_types[0]['type']
-        elif has_tree_indicators:
-            primary_tree_type = 'Rubber Tree (Inferred)'
+        # Primary tree type (the trunk entry above is always present)
+        primary_tree_type = tree_types[0]['type']
 
         # Estimated diameter with improved logic
-        estimated_diameter_cm = 0
-        if tree_count > 0:
-            if tree_detections:
-                # Use tree trunk detections for diameter estimation
-                trunk_detections = [d for d in detections if d['class_name'] == 'Rubber tree']
-                if trunk_detections:
-                    avg_confidence = sum(d['confidence'] for d in trunk_detections) / len(trunk_detections)
-                    # Improved diameter calculation based on confidence and size
-                    base_diameter = 15 + (avg_confidence * 50)  # 15-65 cm range
-                    # Adjust based on bbox size if available
-                    avg_bbox_area = sum(d['width'] * d['height'] for d in trunk_detections) / len(trunk_detections)
-                    size_multiplier = min(1.5, max(0.7, avg_bbox_area / 10000))  # Normalize bbox area
-                    estimated_diameter_cm = round(base_diameter * size_multiplier, 1)
-                else:
-                    estimated_diameter_cm = 35.0  # Default medium size
-            else:
-                # Estimate based on disease/normal detection patterns
-                estimated_diameter_cm = 35.0  # Default medium size
+        if trunk_stats['count'] > 0:
+            # Use tree trunk detections for diameter estimation
+            avg_confidence = trunk_stats['confidence_sum'] / trunk_stats['count']
+            # Improved diameter calculation based on confidence and size
+            base_diameter = 15 + (avg_confidence * 50)  # 15-65 cm range
+            # Adjust based on bbox size if available
+            avg_bbox_area = trunk_area_sum / trunk_stats['count']
+            size_multiplier = min(1.5, max(0.7, avg_bbox_area / 10000))  # Normalize bbox area
+            estimated_diameter_cm = round(base_diameter * size_multiplier, 1)
+        else:
+            estimated_diameter_cm = 35.0  # Default medium size
 
         return {
             'tree_identification': {
                 'types': tree_types,
                 'total_tree_count': tree_count,
                 'primary_tree_type': primary_tree_type,
-                'confidence': tree_types[0]['confidence'] if tree_types else 0
+                'confidence': tree_types[0]['confidence']
             },
             'health_assessment': {
                 'status': health_status,
@@ -314,29 +756,9 @@ class RubberTreePredictor:
 
     def map_coco_to_rubber_classes(self, coco_class_id, confidence, bbox, img_shape):
         """Map COCO dataset classes to rubber tree classes where applicable"""
-        # COCO class names (approximate mapping to rubber tree features)
-        coco_classes = {
-            0: 'person', 1: 'bicycle', 2: 'car', 3: 'motorcycle', 4: 'airplane', 5: 'bus',
-            6: 'train', 7: 'truck', 8: 'boat', 9: 'traffic light', 10: 'fire hydrant',
-            11: 'stop sign', 12: 'parking meter', 13: 'bench', 14: 'bird', 15: 'cat',
-            16: 'dog', 17: 'horse', 18: 'sheep', 19: 'cow', 20: 'elephant', 21: 'bear',
-            22: 'zebra', 23: 'giraffe', 24: 'backpack', 25: 'umbrella', 26: 'handbag',
-            27: 'tie', 28: 'suitcase', 29: 'frisbee', 30: 'skis', 31: 'snowboard',
-            32: 'sports ball', 33: 'kite', 34: 'baseball bat', 35: 'baseball glove',
-            36: 'skateboard', 37: 'surfboard', 38: 'tennis racket', 39: 'bottle',
-            40: 'wine glass', 41: 'cup', 42: 'fork', 43: 'knife', 44: 'spoon',
-            45: 'bowl', 46: 'banana', 47: 'apple', 48: 'sandwich', 49: 'orange',
-            50: 'broccoli', 51: 'carrot', 52: 'hot dog', 53: 'pizza', 54: 'donut',
-            55: 'cake', 56: 'chair', 57: 'couch', 58: 'potted plant', 59: 'bed',
-            60: 'dining table', 61: 'toilet', 62: 'tv', 63: 'laptop', 64: 'mouse',
-            65: 'remote', 66: 'keyboard', 67: 'cell phone', 68: 'microwave', 69: 'oven',
-            70: 'toaster', 71: 'sink', 72: 'refrigerator', 73: 'book', 74: 'clock',
-            75: 'vase', 76: 'scissors', 77: 'teddy bear', 78: 'hair drier', 79: 'toothbrush'
-        }
-
         # Map relevant COCO classes to rubber tree features
-        if coco_class_id in coco_classes:
-            coco_name = coco_classes[coco_class_id]
+        if coco_class_id in COCO_CLASSES:
+            coco_name = COCO_CLASSES[coco_class_id]
 
             # Map tree-like objects to rubber tree
             if coco_name in ['potted plant', 'tree'] or 'plant' in coco_name:
@@ -352,10 +774,10 @@ class RubberTreePredictor:
 
     def create_fallback_detections(self, img):
         """Create intelligent fallback detections when YOLO finds nothing"""
-        print("🔍 Analyzing image for fallback detections...")
+        log("🔍 Analyzing image for fallback detections...")
 
-        # Get image dimensions
-        height, width = img.shape[:2]
+        # Get image dimensions, before any decode-time reduction
+        height, width = img.original_shape[:2]
 
         # Create basic tree detection in center of image
         center_x, center_y = width // 2, height // 2
@@ -409,7 +831,7 @@ class RubberTreePredictor:
                 'height': 40.0
             })
 
-        print(f"✅ Created {len(detections)} fallback detections")
+        log(f"✅ Created {len(detections)} fallback detections")
         return detections
 
     def calculate_disease_severity(self, disease_detections):
@@ -417,8 +839,12 @@ class RubberTreePredictor:
         if not disease_detections:
             return 0
 
-        avg_confidence = sum(d['confidence'] for d in disease_detections) / len(disease_detections)
-        count_factor = min(3, len(disease_detections))  # Cap at 3 for severity calculation
+        return self.severity_from_stats(len(disease_detections), sum(d['confidence'] for d in disease_detections))
+
+    def severity_from_stats(self, count, confidence_sum):
+        """Disease severity from a detection count and confidence sum"""
+        avg_confidence = confidence_sum / count
+        count_factor = min(3, count)  # Cap at 3 for severity calculation
 
         # Severity scale: Low (1), Medium (2), High (3)
         severity = 1
@@ -430,25 +856,100 @@ class RubberTreePredictor:
         return severity
 
 def main():
+    parser = argparse.ArgumentParser(description='Predict Rubber Tree features from an image URL')
+    parser.add_argument('image_url', nargs='?', help="Image URL or local path to analyze ('-' reads image bytes from stdin)")
+    parser.add_argument('--single-pass', action='store_true',
+                        help='Run YOLO once at the lowest confidence threshold instead of retrying')
+    parser.add_argument('--batch', type=str, default=None,
+                        help="File with one image URL or path per line ('-' reads stdin); prints one JSON line per image")
+    parser.add_argument('--batch-size', type=int, default=8, help='Images per YOLO forward pass in batch mode')
+    parser.add_argument('--fetch-workers', type=int, default=8, help='Concurrent image downloads in batch mode')
+    parser.add_argument('--no-image-cache', action='store_true', help='Always download images instead of using the disk cache')
+    parser.add_argument('--no-result-cache', action='store_true', help='Always run inference instead of reusing cached results')
+    parser.add_argument('--cache-stats', action='store_true', help='Print result cache statistics and exit')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS,
+                        help='Inference backend; exported backends need TrainRubberTree.py --export')
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help='Detect on overlapping tiles of this many pixels when the image is larger (off by default)')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='Fraction of a tile shared with its neighbours')
+    parser.add_argument('--tile-batch-size', type=int, default=8, help='Tiles per YOLO forward pass')
+    parser.add_argument('--tile-merge', type=str, default='nms', choices=MERGE_METHODS,
+                        help='How overlapping boxes from neighbouring tiles are merged')
+    parser.add_argument('--warmup', action='store_true',
+                        help='Load the model and run one dummy inference before predicting (alone: warm up and exit)')
+    parser.add_argument('--timing', action='store_true',
+                        help="Add a 'timing' block with per-stage milliseconds to each result")
+    parser.add_argument('--startup-report', action='store_true',
+                        help='Print import, weight load and first inference times (stderr when predicting)')
+    parser.add_argument('--reduced-decode', action='store_true',
+                        help='Decode large JPEGs at 1/2, 1/4 or 1/8 scale when YOLO would downsize them anyway')
+    parser.add_argument('--report-threshold', action='store_true',
+                        help="Add 'confidence_threshold', the ladder threshold the detections were kept at")
+    parser.add_argument('--output-format', type=str, default='json', choices=OUTPUT_FORMATS,
+                        help="Result encoding: 'json' (indented; NDJSON with --batch), 'compact' (one line, "
+                             "orjson when installed) or 'binary' (columnar frames, see ResultFormat.py)")
+    args = parser.parse_args()
+
+    # Check imports before doing anything
+    missing = check_imports(args.backend)
+    if missing:
+        error_msg = f"Missing required packages: {', '.join(missing)}. Please run: pip install {' '.join(missing)}"
+        print(json.dumps({
+            'success': False, 
+            'error': error_msg,
+            'detections': [],
+            'analysis': {}
+        }))
+        sys.exit(1)
+
+    if args.cache_stats:
+        with contextlib.redirect_stdout(sys.stderr):
+            predictor = RubberTreePredictor(backend=args.backend)
+        print(json.dumps(predictor.result_cache.stats(), indent=2))
+        return
+
+    if args.batch:
+        run_batch(args)
+        return
+
+    # Fail before loading the model when there is nothing to predict
+    startup_only = args.warmup or args.startup_report
+    if not args.image_url and not startup_only:
+        print(json.dumps({
+            'success': False,
+            'error': 'Image URL required',
+            'detections': [],
+            'analysis': {}
+        }, indent=2))
+        return
+
     try:
         # Create predictor
-        predictor = RubberTreePredictor()
-        
-        # Get image URL from command line
-        if len(sys.argv) < 2:
-            result = {
-                'success': False,
-                'error': 'Image URL required',
-                'detections': [],
-                'analysis': {}
-            }
+        predictor = RubberTreePredictor(single_pass=args.single_pass, image_cache=not args.no_image_cache,
+                                        result_cache=not args.no_result_cache, backend=args.backend,
+                                        warmup=args.warmup or (args.startup_report and not args.image_url),
+                                        instrument=args.timing, reduced_decode=args.reduced_decode,
+                                        report_threshold=args.report_threshold,
+                                        **tiling_options(args))
+
+        if not args.image_url:
+            # --warmup / --startup-report on their own: report how long startup took and exit
+            print(json.dumps({'success': True, 'startup': predictor.startup_report()}, indent=2))
+            return
+
+        image_url = args.image_url.strip('"\'')
+        if image_url == '-':
+            # Raw encoded image bytes piped on stdin
+            image_url = sys.stdin.buffer.read()
         else:
-            image_url = sys.argv[1].strip('"\'')
-            print(f"🌐 Processing: {image_url}")
-            result = predictor.predict(image_url)
+            log(f"🌐 Processing: {image_url}")
+        result = predictor.predict(image_url)
         
-        # Print result as JSON
-        print(json.dumps(result, indent=2))
+        # Print result in the requested format
+        write_result(sys.stdout, result, args.output_format)
+
+        if args.startup_report:
+            print(json.dumps({'startup': predictor.startup_report()}), file=sys.stderr)
         
     except Exception as e:
         error_result = {
@@ -457,7 +958,49 @@ def main():
             'detections': [],
             'analysis': {}
         }
-        print(json.dumps(error_result))
+        write_result(sys.stdout, error_result, args.output_format, line=True)
+        sys.exit(1)
+
+def tiling_options(args):
+    """Predictor keyword arguments for the --tile-* flags"""
+    return {
+        'tile_size': args.tile_size,
+        'tile_overlap': args.tile_overlap,
+        'tile_batch_size': args.tile_batch_size,
+        'tile_merge': args.tile_merge
+    }
+
+def run_batch(args):
+    """Batch CLI mode: progress goes to stderr so stdout carries only JSON lines"""
+    stdout = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.batch == '-':
+                lines = sys.stdin.read().splitlines()
+            else:
+                with open(args.batch, 'r') as f:
+                    lines = f.read().splitlines()
+            image_sources = [line.strip().strip('"\'') for line in lines if line.strip()]
+
+            predictor = RubberTreePredictor(single_pass=args.single_pass, image_cache=not args.no_image_cache,
+                                            fetch_workers=args.fetch_workers, result_cache=not args.no_result_cache,
+                                            backend=args.backend, warmup=args.warmup,
+                                            instrument=args.timing, reduced_decode=args.reduced_decode,
+                                            report_threshold=args.report_threshold,
+                                            **tiling_options(args))
+            for result in predictor.iter_predict_batch(image_sources, args.batch_size, args.fetch_workers):
+                write_result(stdout, result, args.output_format, line=True)
+
+            if args.startup_report:
+                print(json.dumps({'startup': predictor.startup_report()}))
+
+    except Exception as e:
+        write_result(stdout, {
+            'success': False,
+            'error': f"Fatal error: {str(e)}",
+            'detections': [],
+            'analysis': {}
+        }, args.output_format, line=True)
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+# backend/MLmodels/RubberTree/Preprocess.py
+import struct
+from typing import NamedTuple, Optional
+
+from LazyImport import lazy_import
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+# Decode-time downscale factors, largest first; JPEG scales in the DCT so pixels are never materialised
+REDUCTION_FACTORS = (8, 4, 2)
+
+
+def image_size(data):
+    """(width, height) from a JPEG or PNG header without decoding, or None for other formats"""
+    view = memoryview(data)
+    if view[:8] == b'\x89PNG\r\n\x1a\n' and len(view) >= 24:
+        return struct.unpack('>II', view[16:24])
+
+    if view[:2] != b'\xff\xd8':
+        return None
+    offset = 2
+    while offset + 9 <= len(view):
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack('>H', view[offset + 2:offset + 4])[0]
+        # Start-of-frame markers carry the dimensions; C4, C8 and CC are tables, not frames
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', view[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def reduction_factor(width, height, imgsz):
+    """Largest factor that still leaves the long side at least imgsz pixels, so YOLO only downsizes"""
+    for factor in REDUCTION_FACTORS:
+        if max(width, height) / factor >= imgsz:
+            return factor
+    return 1
+
+
+class DecodedImage(NamedTuple):
+    """Decoded BGR pixels plus the shape the caller sent and the (x, y) scale back to it.
+
+    scale is None for a full-resolution decode. The geometry travels beside the array rather
+    than on it, so crops, copies and resizes of pixels cannot lose or inherit it.
+    """
+    pixels: object
+    original_shape: tuple
+    scale: Optional[tuple] = None
+
+
+def as_decoded(img):
+    """Wrap a plain ndarray as a full-resolution DecodedImage; DecodedImage and None pass through"""
+    if img is None or isinstance(img, DecodedImage):
+        return img
+    return DecodedImage(img, img.shape)
+
+
+def decode_image(data, imgsz=None):
+    """Decode encoded image bytes into a DecodedImage, or None if they are not an image.
+
+    With imgsz, JPEGs large enough for it are downscaled at decode time; the result then
+    records the full-resolution shape and the scale that maps its boxes back to it.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    try:
+        size = image_size(data) if imgsz else None
+        factor = reduction_factor(*size, imgsz) if size else 1
+        if factor == 1:
+            return as_decoded(cv2.imdecode(buffer, cv2.IMREAD_COLOR))
+
+        flag = getattr(cv2, f'IMREAD_REDUCED_COLOR_{factor}')
+        img = cv2.imdecode(buffer, flag)
+        if img is None:
+            return None
+        width, height = size
+        # EXIF orientation is applied while decoding, which swaps the header's axes
+        if (img.shape[1] > img.shape[0]) != (width > height):
+            width, height = height, width
+        return DecodedImage(img, (height, width, img.shape[2]), (width / img.shape[1], height / img.shape[0]))
+    finally:
+        # Drop the view so an underlying mmap can be closed
+        del buffer
+
+
+def letterbox_into(img, canvas, color=114):
+    """Letterbox img into a preallocated (H, W, 3) uint8 canvas.
+
+    Same geometry as ultralytics' LetterBox with auto=False, which ExportedModel.scale_boxes
+    undoes, but the resize writes straight into the canvas so no padded copy is allocated.
+    """
+    height, width = canvas.shape[:2]
+    shape = img.shape[:2]
+    ratio = min(height / shape[0], width / shape[1])
+    new_width, new_height = int(round(shape[1] * ratio)), int(round(shape[0] * ratio))
+    top = int(round((height - new_height) / 2 - 0.1))
+    left = int(round((width - new_width) / 2 - 0.1))
+
+    canvas[:top] = color
+    canvas[top + new_height:] = color
+    canvas[top:top + new_height, :left] = color
+    canvas[top:top + new_height, left + new_width:] = color
+    region = canvas[top:top + new_height, left:left + new_width]
+    if (new_height, new_width) == shape:
+        region[...] = img
+    else:
+        resized = cv2.resize(img, (new_width, new_height), dst=region, interpolation=cv2.INTER_LINEAR)
+        # OpenCV writes in place when dst fits; otherwise it hands back a new array
+        if resized is not region and not np.shares_memory(resized, region):
+            region[...] = resized
+    return canvas
+
+
+class LetterboxBuffers:
+    """Reused uint8 canvas and float32 NCHW blob for batched letterboxing at a fixed input shape"""
+
+    def __init__(self, input_shape):
+        self.input_shape = tuple(input_shape)
+        self.canvas = None
+        self.blob = None
+
+    def preprocess(self, images):
+        """BGR HWC uint8 images -> RGB NCHW float32 batch in [0, 1], valid until the next call"""
+        count = len(images)
+        if self.canvas is None or len(self.canvas) < count:
+            self.canvas = np.empty((count, *self.input_shape, 3), dtype=np.uint8)
+            self.blob = np.empty((count, 3, *self.input_shape), dtype=np.float32)
+        for img, canvas in zip(images, self.canvas):
+            letterbox_into(img, canvas)
+        blob = self.blob[:count]
+        np.divide(self.canvas[:count, ..., ::-1].transpose(0, 3, 1, 2), 255.0, out=blob, casting='unsafe')
+        return blob
@@ -0,0 +1,175 @@
+# backend/MLmodels/RubberTree/ResultCache.py
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from Instrumentation import log
+
+
+def fingerprint_file(path, chunk_size=1024 * 1024):
+    """Content hash of a weights file, so a retrained model gets a new fingerprint"""
+    path = Path(path)
+    if not path.exists():
+        # Hub weights such as 'yolo11n.pt' are identified by name only
+        return f'name:{path.name}'
+
+    # Exported OpenVINO models are directories of .xml/.bin files
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in files:
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_key(model_fingerprint, params):
+    """One hash of weights and inference parameters; results are only reusable under the same key"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(model_fingerprint.encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def hash_image(img):
+    """Hash of the decoded pixels, independent of URL or JPEG encoding details"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(img.shape).encode('utf-8'))
+    digest.update(img.data if img.flags['C_CONTIGUOUS'] else img.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Persistent SQLite cache of prediction results with LRU eviction.
+
+    The cache is best-effort: pool workers share one database file, and a lookup or store that
+    hits a database error (e.g. 'database is locked' under write contention) is logged and
+    treated as a miss or skipped, never as a failed prediction.
+    """
+
+    def __init__(self, db_path, model_fingerprint, params, max_entries=10000):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_fingerprint = model_fingerprint
+        self.params_key = json.dumps(params, sort_keys=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS results (
+                image_hash TEXT NOT NULL,
+                model_fingerprint TEXT NOT NULL,
+                params TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hit_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (image_hash, model_fingerprint, params)
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access)')
+
+        # Entries produced by older weights with these parameters can never be hit again
+        try:
+            deleted = self.conn.execute(
+                'DELETE FROM results WHERE params = ? AND model_fingerprint != ?',
+                (self.params_key, self.model_fingerprint)
+            ).rowcount
+            self.conn.commit()
+        except sqlite3.Error as e:
+            self.conn.rollback()
+            log(f"⚠️ Could not invalidate old cached results: {e}")
+            deleted = 0
+        if deleted:
+            log(f"🧹 Invalidated {deleted} cached results from previous model weights")
+
+    def get(self, image_hash):
+        """Cached result for an image, or None on a miss or a database error"""
+        with self.lock:
+            try:
+                row = self.conn.execute(
+                    'SELECT result FROM results WHERE image_hash = ? AND model_fingerprint = ? AND params = ?',
+                    (image_hash, self.model_fingerprint, self.params_key)
+                ).fetchone()
+            except sqlite3.Error as e:
+                log(f"⚠️ Result cache lookup failed: {e}")
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            try:
+                self.conn.execute(
+                    'UPDATE results SET last_access = ?, hit_count = hit_count + 1 '
+                    'WHERE image_hash = ? AND model_fingerprint = ? AND params = ?',
+                    (time.time(), image_hash, self.model_fingerprint, self.params_key)
+                )
+                self.conn.commit()
+            except sqlite3.Error as e:
+                # Only the LRU bookkeeping is lost; the hit itself is still good
+                self.conn.rollback()
+                log(f"⚠️ Could not update result cache access time: {e}")
+        return json.loads(row[0])
+
+    def put(self, image_hash, result):
+        """Store a result; database errors are logged and the result is simply not cached"""
+        now = time.time()
+        with self.lock:
+            try:
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO results '
+                    '(image_hash, model_fingerprint, params, result, created_at, last_access, hit_count) '
+                    'VALUES (?, ?, ?, ?, ?, ?, 0)',
+                    (image_hash, self.model_fingerprint, self.params_key, json.dumps(result), now, now)
+                )
+                self._evict()
+                self.conn.commit()
+            except sqlite3.Error as e:
+                self.conn.rollback()
+                log(f"⚠️ Could not store result in cache: {e}")
+
+    def _evict(self):
+        """Keep only the max_entries most recently used results"""
+        count = self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if count > self.max_entries:
+            self.conn.execute(
+                'DELETE FROM results WHERE rowid IN '
+                '(SELECT rowid FROM results ORDER BY last_access ASC LIMIT ?)',
+                (count - self.max_entries,)
+            )
+
+    def stats(self):
+        with self.lock:
+            entries, total_bytes, total_hits = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(result)), 0), COALESCE(SUM(hit_count), 0) FROM results'
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'total_bytes': total_bytes,
+            'lifetime_hits': total_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'model_fingerprint': self.model_fingerprint
+        }
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM results')
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,141 @@
+# backend/MLmodels/RubberTree/ResultFormat.py
+import json
+import struct
+
+from LazyImport import lazy_import, missing_packages
+
+np = lazy_import('numpy')
+# Optional: compact output uses orjson when it is installed and the json module otherwise
+orjson = lazy_import('orjson')
+HAS_ORJSON = not missing_packages(['orjson'])
+
+OUTPUT_FORMATS = ['json', 'compact', 'binary']
+BINARY_CONTENT_TYPE = 'application/x-rubber-tree-columnar'
+
+# Columnar frame, all little-endian:
+#   header   magic b'RTB1', uint32 metadata length M, uint32 detection count N, uint32 reserved (0)
+#   metadata M bytes of UTF-8 JSON: the result without 'detections', plus 'class_names', the
+#            distinct detection class names; padded with spaces to a multiple of 4
+#   columns  float32 confidence[N], float32 bbox[N][4] (x1, y1, x2, y2), float32 width[N],
+#            float32 height[N], uint16 class_id[N], uint16 class_name_index[N]
+# Frames can be concatenated; each one's length follows from its header.
+BINARY_MAGIC = b'RTB1'
+FRAME_HEADER = struct.Struct('<4sIII')
+
+
+def encode_json(result, output_format='json'):
+    """The existing pretty-printed schema, or the same data on one line for 'compact'"""
+    if output_format == 'json':
+        return json.dumps(result, indent=2).encode('utf-8')
+    if HAS_ORJSON:
+        return orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(result, separators=(',', ':')).encode('utf-8')
+
+
+def encode_binary(result):
+    """One columnar frame for a result dict"""
+    detections = result.get('detections') or []
+    count = len(detections)
+    class_names = list(dict.fromkeys(d['class_name'] for d in detections))
+    name_index = {name: i for i, name in enumerate(class_names)}
+
+    metadata = {key: value for key, value in result.items() if key != 'detections'}
+    metadata['class_names'] = class_names
+    encoded = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+    encoded += b' ' * (-len(encoded) % 4)
+
+    floats = np.empty((count, 7), dtype='<f4')
+    if count:
+        floats[:, 0] = [d['confidence'] for d in detections]
+        floats[:, 1:5] = [d['bbox'] for d in detections]
+        floats[:, 5] = [d['width'] for d in detections]
+        floats[:, 6] = [d['height'] for d in detections]
+    class_ids = np.fromiter((d['class_id'] for d in detections), dtype='<u2', count=count)
+    names = np.fromiter((name_index[d['class_name']] for d in detections), dtype='<u2', count=count)
+
+    return b''.join([
+        FRAME_HEADER.pack(BINARY_MAGIC, len(encoded), count, 0),
+        encoded,
+        floats[:, 0].tobytes(), floats[:, 1:5].tobytes(), floats[:, 5].tobytes(), floats[:, 6].tobytes(),
+        class_ids.tobytes(), names.tobytes()
+    ])
+
+
+def frame_length(header):
+    """Total length of the frame that starts with this 16-byte header"""
+    magic, metadata_length, count, _ = FRAME_HEADER.unpack(header)
+    if magic != BINARY_MAGIC:
+        raise ValueError('Not a Rubber Tree columnar frame')
+    return FRAME_HEADER.size + metadata_length + count * 32
+
+
+def decode_binary(frame):
+    """Result dict in the default schema from one columnar frame"""
+    magic, metadata_length, count, _ = FRAME_HEADER.unpack_from(frame)
+    if magic != BINARY_MAGIC:
+        raise ValueError('Not a Rubber Tree columnar frame')
+    offset = FRAME_HEADER.size
+    result = json.loads(bytes(frame[offset:offset + metadata_length]))
+    class_names = result.pop('class_names')
+    offset += metadata_length
+
+    def column(dtype, width=1):
+        nonlocal offset
+        values = np.frombuffer(frame, dtype=dtype, count=count * width, offset=offset)
+        offset += values.nbytes
+        return values.reshape(count, width) if width > 1 else values
+
+    confidences, bboxes, widths, heights = column('<f4'), column('<f4', 4), column('<f4'), column('<f4')
+    class_ids, names = column('<u2'), column('<u2')
+    # float32 holds the 4- and 2-decimal rounded values closely enough to round back exactly
+    detections = [{
+        'class_id': int(class_id),
+        'class_name': class_names[name],
+        'confidence': round(float(conf), 4),
+        'bbox': [round(float(v), 2) for v in bbox],
+        'width': round(float(width), 2),
+        'height': round(float(height), 2)
+    } for class_id, name, conf, bbox, width, height in zip(class_ids, names, confidences, bboxes, widths, heights)]
+
+    # Keep the default key order, with detections right after success
+    ordered = {}
+    for key, value in result.items():
+        ordered[key] = value
+        if key == 'success':
+            ordered['detections'] = detections
+    ordered.setdefault('detections', detections)
+    return ordered
+
+
+def iter_binary_frames(stream):
+    """Decode concatenated frames from a binary stream, such as --batch --output-format binary"""
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if not header:
+            return
+        rest = stream.read(frame_length(header) - FRAME_HEADER.size)
+        yield decode_binary(header + rest)
+
+
+def encode_result(result, output_format='json'):
+    if output_format == 'binary':
+        return encode_binary(result)
+    return encode_json(result, output_format)
+
+
+def write_result(stream, result, output_format='json', line=False):
+    """Write one result to a text stream (stdout) in the chosen format.
+
+    line=True is the batch mode: 'json' and 'compact' then emit one NDJSON line per result,
+    while binary frames are self-delimiting either way.
+    """
+    if output_format == 'json' and line:
+        stream.write(json.dumps(result) + '\n')
+    elif output_format == 'binary':
+        stream.flush()
+        stream.buffer.write(encode_binary(result))
+        stream.buffer.flush()
+        return
+    else:
+        stream.write(encode_json(result, output_format).decode('utf-8') + '\n')
+    stream.flush()
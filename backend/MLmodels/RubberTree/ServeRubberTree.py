@@ -0,0 +1,332 @@
+# backend/MLmodels/RubberTree/ServeRubberTree.py
+import sys
+import json
+import signal
+import asyncio
+import argparse
+import contextlib
+import threading
+import time
+import tempfile
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PredictRubberTree import RubberTreePredictor, tiling_options
+from PoolRubberTree import PredictorPool
+from MicroBatcher import MicroBatcher
+from ExportedModel import BACKENDS
+from TiledInference import MERGE_METHODS
+from Instrumentation import MetricsRegistry, log
+from ResultFormat import BINARY_CONTENT_TYPE, encode_binary, encode_json
+from ImageFetcher import ImageFetcher
+from JobQueue import IMAGE_CACHE_DIR, JOBS_DB_PATH, JobQueue, JobWorker
+
+# Local files the server may read: the Node backend's multer upload folder and shared-memory frames
+DEFAULT_ALLOWED_DIRS = [Path(tempfile.gettempdir()) / 'rubbersense_uploads', Path('/dev/shm')]
+
+
+def source_error(source, allowed_dirs):
+    """Why a client-supplied image source may not be read, or None when it is allowed.
+
+    Clients may send http(s) URLs, or paths to regular files inside allowed_dirs. Paths are
+    resolved first, so symlinks and '..' cannot reach other files, and devices such as /dev/zero
+    are refused.
+    """
+    if source.startswith(('http://', 'https://')):
+        return None
+    if '://' in source:
+        return 'Only http and https image URLs are supported'
+    try:
+        path = Path(source).resolve(strict=True)
+    except (OSError, RuntimeError):
+        return 'Image file not found'
+    if not any(path.is_relative_to(directory) for directory in allowed_dirs) or not path.is_file():
+        return 'Image path is outside the upload directories'
+    return None
+
+
+class PredictionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP handler exposing the warm predictor as a JSON API"""
+    server_version = 'RubberSensePredictor/1.0'
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, self.server.health())
+        elif self.path == '/metrics':
+            self.send_text(200, self.server.metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+        elif self.path == '/jobs' and self.server.jobs is not None:
+            self.send_json(200, {'success': True, **self.server.jobs.stats()})
+        elif self.path.startswith('/jobs/') and self.server.jobs is not None:
+            job = self.server.jobs.get(self.path[len('/jobs/'):])
+            if job is None:
+                self.send_json(404, {'success': False, 'error': 'Unknown job'})
+            else:
+                self.send_json(200, {'success': True, **job})
+        else:
+            self.send_json(404, {'success': False, 'error': f'Unknown endpoint: {self.path}'})
+
+    def do_POST(self):
+        if self.path not in ('/predict', '/jobs') or (self.path == '/jobs' and self.server.jobs is None):
+            self.send_json(404, {'success': False, 'error': f'Unknown endpoint: {self.path}'})
+            return
+
+        if self.server.shutting_down.is_set():
+            self.send_json(503, {
+                'success': False,
+                'error': 'Server is shutting down',
+                'detections': [],
+                'analysis': {}
+            })
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, json.JSONDecodeError) as e:
+            self.send_json(400, {
+                'success': False,
+                'error': f'Invalid JSON body: {e}',
+                'detections': [],
+                'analysis': {}
+            })
+            return
+
+        image_url = str(payload.get('image_url') or '').strip('"\'')
+        error = source_error(image_url, self.server.allowed_dirs) if image_url else 'Image URL required'
+        if error:
+            self.send_json(400, {
+                'success': False,
+                'error': error,
+                'detections': [],
+                'analysis': {}
+            })
+            return
+
+        if self.path == '/jobs':
+            try:
+                priority = int(payload.get('priority', 0))
+            except (TypeError, ValueError):
+                self.send_json(400, {'success': False, 'error': 'priority must be an integer'})
+                return
+            job, created = self.server.submit_job(image_url, priority)
+            # 202 for a new job; a duplicate returns the job it joined, which may already be done
+            self.send_json(202 if created else 200, {'success': True, 'created': created, **job})
+            return
+
+        result = self.server.predict(image_url)
+        if BINARY_CONTENT_TYPE in self.headers.get('Accept', ''):
+            self.send_bytes(200, encode_binary(result), BINARY_CONTENT_TYPE)
+        else:
+            self.send_json(200, result)
+
+    def send_json(self, status, body):
+        self.send_bytes(status, encode_json(body, 'compact'), 'application/json')
+
+    def send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_text(self, status, text, content_type):
+        self.send_bytes(status, text.encode('utf-8'), content_type)
+
+    def log_message(self, format, *args):
+        log(f"🌐 {self.address_string()} - {format % args}")
+
+
+class PredictionServer(ThreadingHTTPServer):
+    """Long-lived server that loads the YOLO model once and keeps it warm"""
+    daemon_threads = False
+    block_on_close = True
+
+    def __init__(self, address, predictor, allowed_dirs=DEFAULT_ALLOWED_DIRS):
+        super().__init__(address, PredictionRequestHandler)
+        self.predictor = predictor
+        self.allowed_dirs = [Path(directory).resolve() for directory in allowed_dirs]
+        # A single in-process model is not safe to call from several threads at once;
+        # a PredictorPool or MicroBatcher does its own queueing
+        self.predict_lock = threading.Lock() if isinstance(predictor, RubberTreePredictor) else contextlib.nullcontext()
+        self.shutting_down = threading.Event()
+        self.started_at = time.time()
+        self.requests_served = 0
+        # Fed from each result's timing block, so it covers pool workers as well
+        self.metrics = MetricsRegistry()
+        # Set by start_jobs(); POST /jobs and GET /jobs/<id> are only served when it is on
+        self.jobs = None
+        self.job_worker = None
+        self.job_thread = None
+
+    def start_jobs(self, db_path, concurrency=1, fetcher=None):
+        """Accept queued jobs and drain them on a background asyncio loop through predict()"""
+        self.jobs = JobQueue(db_path)
+        self.job_worker = JobWorker(self.jobs, self.predict, fetcher=fetcher, concurrency=concurrency,
+                                    result_key=self.predictor.describe().get('result_key'))
+        self.job_thread = threading.Thread(target=asyncio.run, args=(self.job_worker.run(),),
+                                           name='job-worker', daemon=True)
+        self.job_thread.start()
+
+    def submit_job(self, image_url, priority=0):
+        job, created = self.jobs.submit(image_url, priority)
+        if created:
+            self.metrics.inc('jobs_submitted_total', help_text='Jobs accepted into the queue')
+            self.job_worker.notify()
+        return job, created
+
+    def stop_jobs(self):
+        """Finish the jobs in progress; queued jobs stay in the database for the next start"""
+        if self.job_worker is None:
+            return
+        self.job_worker.stop()
+        self.job_thread.join()
+        self.jobs.close()
+
+    def predict(self, image_url):
+        started = time.perf_counter()
+        with self.predict_lock:
+            self.requests_served += 1
+            result = self.predictor.predict(image_url)
+        # Includes time spent waiting for the model lock or a pool worker
+        self.metrics.observe_result(result, time.perf_counter() - started)
+        return result
+
+    def health(self):
+        return {
+            'success': True,
+            'status': 'shutting_down' if self.shutting_down.is_set() else 'ok',
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests_served': self.requests_served,
+            'jobs': self.jobs.stats() if self.jobs is not None else None,
+            **self.predictor.describe()
+        }
+
+    def request_shutdown(self):
+        """Stop accepting new predictions and let in-flight ones finish"""
+        if self.shutting_down.is_set():
+            return
+        self.shutting_down.set()
+        log("🛑 Shutdown requested, draining in-flight requests...")
+        # shutdown() blocks until serve_forever() returns, so it must run off the serving thread
+        threading.Thread(target=self.shutdown, daemon=True).start()
+        if self.job_worker is not None:
+            self.job_worker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Rubber Tree YOLO predictions over HTTP')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Host to bind')
+    parser.add_argument('--port', type=int, default=5001, help='Port to bind')
+    parser.add_argument('--model', type=str, default='yolov11_custom.pt', help='Model weights file')
+    parser.add_argument('--single-pass', action='store_true',
+                        help='Run YOLO once at the lowest confidence threshold instead of retrying')
+    parser.add_argument('--no-image-cache', action='store_true', help='Always download images instead of using the disk cache')
+    parser.add_argument('--no-result-cache', action='store_true', help='Always run inference instead of reusing cached results')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS,
+                        help='Inference backend; exported backends need TrainRubberTree.py --export')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Serve from a pool of N worker processes instead of one in-process model')
+    parser.add_argument('--threads-per-worker', type=int, default=None, help='Torch/OpenCV threads in each pool worker')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds for pool workers')
+    parser.add_argument('--startup-timeout', type=float, default=300,
+                        help='Seconds to wait for pool workers to load the model before giving up')
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help='Detect on overlapping tiles of this many pixels when the image is larger (off by default)')
+    parser.add_argument('--tile-overlap', type=float, default=0.2, help='Fraction of a tile shared with its neighbours')
+    parser.add_argument('--tile-batch-size', type=int, default=8, help='Tiles per YOLO forward pass')
+    parser.add_argument('--tile-merge', type=str, default='nms', choices=MERGE_METHODS,
+                        help='How overlapping boxes from neighbouring tiles are merged')
+    parser.add_argument('--warmup', action='store_true',
+                        help='Run one dummy inference per model before accepting requests')
+    parser.add_argument('--reduced-decode', action='store_true',
+                        help='Decode large JPEGs at 1/2, 1/4 or 1/8 scale when YOLO would downsize them anyway')
+    parser.add_argument('--report-threshold', action='store_true',
+                        help="Add 'confidence_threshold', the ladder threshold the detections were kept at")
+    parser.add_argument('--no-instrumentation', action='store_true',
+                        help='Skip per-stage timings; /metrics then only has request counts and latency')
+    parser.add_argument('--metrics-file', type=str, default=None,
+                        help='Also write Prometheus metrics to this file (for a textfile collector)')
+    parser.add_argument('--metrics-interval', type=float, default=15, help='Seconds between --metrics-file writes')
+    parser.add_argument('--micro-batch', action='store_true',
+                        help='Group concurrent requests into batched forward passes (single-process mode)')
+    parser.add_argument('--max-batch-size', type=int, default=8, help='Most requests in one micro-batch')
+    parser.add_argument('--batch-window-ms', type=float, default=5.0,
+                        help='Initial time to wait for more requests before running a micro-batch')
+    parser.add_argument('--target-latency-ms', type=float, default=250.0,
+                        help='Latency the batch window is tuned to stay under (0 keeps the window fixed)')
+    parser.add_argument('--jobs', action='store_true',
+                        help='Also accept queued jobs: POST /jobs returns a job id, GET /jobs/<id> returns its result')
+    parser.add_argument('--jobs-db', type=str, default=str(JOBS_DB_PATH), help='SQLite database of the job queue')
+    parser.add_argument('--allowed-dir', type=str, action='append', default=None,
+                        help='Directory whose files clients may name as image_url; repeatable '
+                             f"(default: {', '.join(str(d) for d in DEFAULT_ALLOWED_DIRS)})")
+
+    args = parser.parse_args()
+
+    predictor_kwargs = {
+        'model_path': args.model,
+        'single_pass': args.single_pass,
+        'image_cache': not args.no_image_cache,
+        'result_cache': not args.no_result_cache,
+        'backend': args.backend,
+        'warmup': args.warmup,
+        'instrument': not args.no_instrumentation,
+        'reduced_decode': args.reduced_decode,
+        'report_threshold': args.report_threshold,
+        **tiling_options(args)
+    }
+    if args.workers > 0:
+        predictor = PredictorPool(workers=args.workers, threads_per_worker=args.threads_per_worker,
+                                  request_timeout=args.timeout, **predictor_kwargs)
+        if not predictor.wait_ready(timeout=args.startup_timeout):
+            error = predictor.failed or f'Workers did not load the model within {args.startup_timeout}s'
+            predictor.close(timeout=0)
+            print(json.dumps({'success': False, 'error': f"Fatal error: {error}"}))
+            sys.exit(1)
+    else:
+        predictor = RubberTreePredictor(**predictor_kwargs)
+        log(f"⏱️ Startup: {json.dumps(predictor.startup_report())}")
+        if args.micro_batch:
+            predictor = MicroBatcher(predictor, max_batch_size=args.max_batch_size, window_ms=args.batch_window_ms,
+                                     target_latency_ms=args.target_latency_ms or None)
+            log(f"📦 Micro-batching up to {args.max_batch_size} requests, {args.batch_window_ms} ms initial window")
+    server = PredictionServer((args.host, args.port), predictor, allowed_dirs=args.allowed_dir or DEFAULT_ALLOWED_DIRS)
+    fetcher = None
+    if args.jobs:
+        # Jobs hand the predictor image bytes (so duplicates are found by content hash); downloads are cached here
+        fetcher = ImageFetcher(cache_dir=None if args.no_image_cache else IMAGE_CACHE_DIR)
+        # Enough concurrent jobs to fill the pool or a micro-batch
+        concurrency = args.max_batch_size if isinstance(predictor, MicroBatcher) else max(1, args.workers)
+        server.start_jobs(args.jobs_db, concurrency=concurrency, fetcher=fetcher)
+        log(f"📬 Job queue enabled at {args.jobs_db}")
+
+    def handle_signal(signum, frame):
+        server.request_shutdown()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    if args.metrics_file:
+        def write_metrics():
+            while not server.shutting_down.wait(args.metrics_interval):
+                server.metrics.write(args.metrics_file)
+
+        threading.Thread(target=write_metrics, daemon=True).start()
+
+    log(f"🚀 Prediction server listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.stop_jobs()
+        if fetcher is not None:
+            fetcher.close()
+        if isinstance(predictor, (PredictorPool, MicroBatcher)):
+            predictor.close()
+        if args.metrics_file:
+            server.metrics.write(args.metrics_file)
+        log("✅ Prediction server stopped")
+
+
+if __name__ == '__main__':
+    main()
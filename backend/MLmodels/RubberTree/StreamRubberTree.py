@@ -0,0 +1,408 @@
+# backend/MLmodels/RubberTree/StreamRubberTree.py
+import sys
+import json
+import queue
+import argparse
+import threading
+import contextlib
+from pathlib import Path
+from collections import Counter
+
+from LazyImport import lazy_import
+from ExportedModel import BACKENDS
+from Instrumentation import log
+from TiledInference import predict_tiled
+
+cv2 = lazy_import('cv2')
+np = lazy_import('numpy')
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff'}
+EMIT_KINDS = ['frames', 'tracks', 'segments']
+
+# Marks the end of a stage's output; an exception instance in its place ends the stream with that error
+END = object()
+
+
+def iter_frames(source, stride=1, sample_fps=None, start=0, max_frames=None):
+    """Yield (frame_index, seconds, image) from a video file or a directory of frames.
+
+    Skipped video frames are grabbed without being decoded, and skipped files are never read.
+    """
+    path = Path(source)
+    if path.is_dir():
+        files = sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        # Frame directories have no timestamps; --sample-fps assumes they were extracted at 30 fps
+        fps = 30.0
+        step = max(1, round(fps / sample_fps)) if sample_fps else stride
+        emitted = 0
+        for index in range(start, len(files), step):
+            img = cv2.imread(str(files[index]), cv2.IMREAD_COLOR)
+            if img is None:
+                log(f"⚠️ Skipping unreadable frame: {files[index]}")
+                continue
+            yield index, index / fps, img
+            emitted += 1
+            if max_frames and emitted >= max_frames:
+                return
+        return
+
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f'Could not open video: {source}')
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        step = max(1, round(fps / sample_fps)) if sample_fps else stride
+        index = -1
+        emitted = 0
+        while True:
+            if not capture.grab():
+                return
+            index += 1
+            if index < start or (index - start) % step:
+                continue
+            ok, img = capture.retrieve()
+            if not ok:
+                return
+            yield index, index / fps, img
+            emitted += 1
+            if max_frames and emitted >= max_frames:
+                return
+    finally:
+        capture.release()
+
+
+def box_iou_matrix(a, b):
+    """Pairwise IoU of two (N, 4) and (M, 4) xyxy arrays"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+class IoUTracker:
+    """Greedy same-class IoU tracker; a track closes after max_age analysed frames without a match"""
+
+    def __init__(self, iou_threshold=0.3, max_age=5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.active = []
+        self.next_id = 0
+
+    def update(self, frame_index, seconds, detections):
+        """Match this frame's detections to open tracks; returns the tracks that closed"""
+        boxes = np.array([d['bbox'] for d in detections], dtype=np.float64).reshape(-1, 4)
+        unmatched = set(range(len(detections)))
+        matched_tracks = set()
+
+        if self.active and detections:
+            track_boxes = np.array([t['last_bbox'] for t in self.active], dtype=np.float64)
+            ious = box_iou_matrix(track_boxes, boxes)
+            same_class = np.array([t['class_name'] for t in self.active])[:, None] == \
+                np.array([d['class_name'] for d in detections])[None, :]
+            ious[~same_class] = 0
+
+            # Best pairs first; each track and detection is used at most once
+            for flat in np.argsort(-ious, axis=None):
+                t, d = divmod(int(flat), ious.shape[1])
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if d not in unmatched or t in matched_tracks:
+                    continue
+                unmatched.discard(d)
+                matched_tracks.add(t)
+                self._extend(self.active[t], frame_index, seconds, detections[d])
+
+        for t, track in enumerate(self.active):
+            if t not in matched_tracks:
+                track['misses'] += 1
+
+        for d in sorted(unmatched):
+            detection = detections[d]
+            track = {
+                'track_id': self.next_id,
+                'class_name': detection['class_name'],
+                'first_frame': frame_index,
+                'first_seconds': round(seconds, 3),
+                'hits': 0,
+                'confidence_sum': 0.0,
+                'max_confidence': 0.0
+            }
+            self.next_id += 1
+            self._extend(track, frame_index, seconds, detection)
+            self.active.append(track)
+
+        closed = [t for t in self.active if t['misses'] > self.max_age]
+        self.active = [t for t in self.active if t['misses'] <= self.max_age]
+        return [self.summarize(t) for t in closed]
+
+    def _extend(self, track, frame_index, seconds, detection):
+        track['misses'] = 0
+        track['last_frame'] = frame_index
+        track['last_seconds'] = round(seconds, 3)
+        track['last_bbox'] = detection['bbox']
+        track['hits'] += 1
+        track['confidence_sum'] += detection['confidence']
+        track['max_confidence'] = max(track['max_confidence'], detection['confidence'])
+
+    def flush(self):
+        """Close every open track at the end of the stream"""
+        closed, self.active = self.active, []
+        return [self.summarize(t) for t in closed]
+
+    @staticmethod
+    def summarize(track):
+        summary = {'type': 'track'}
+        summary.update((key, value) for key, value in track.items() if key not in ('confidence_sum', 'misses'))
+        summary['mean_confidence'] = round(track['confidence_sum'] / track['hits'], 4)
+        summary['max_confidence'] = round(track['max_confidence'], 4)
+        return summary
+
+
+class SegmentAggregator:
+    """Per-segment totals over fixed windows of video time"""
+
+    def __init__(self, segment_seconds=10.0):
+        self.segment_seconds = segment_seconds
+        self.current = None
+
+    def add(self, seconds, detections, analysis):
+        """Fold one frame in; returns the previous segment's summary when this frame starts a new one"""
+        index = int(seconds // self.segment_seconds)
+        finished = None
+        if self.current is not None and self.current['segment'] != index:
+            finished = self.flush()
+        if self.current is None:
+            self.current = {
+                'segment': index,
+                'frames': 0,
+                'class_counts': Counter(),
+                'disease_frames': 0,
+                'health_score_sum': 0,
+                'min_health_score': 100
+            }
+
+        segment = self.current
+        health = analysis['health_assessment']
+        segment['frames'] += 1
+        segment['class_counts'].update(d['class_name'] for d in detections)
+        segment['disease_frames'] += health['disease_count'] > 0
+        segment['health_score_sum'] += health['score']
+        segment['min_health_score'] = min(segment['min_health_score'], health['score'])
+        return finished
+
+    def flush(self):
+        segment, self.current = self.current, None
+        if segment is None:
+            return None
+        return {
+            'type': 'segment',
+            'segment': segment['segment'],
+            'start_seconds': segment['segment'] * self.segment_seconds,
+            'end_seconds': (segment['segment'] + 1) * self.segment_seconds,
+            'frames': segment['frames'],
+            'class_counts': dict(segment['class_counts'].most_common()),
+            'disease_frames': segment['disease_frames'],
+            'mean_health_score': round(segment['health_score_sum'] / segment['frames'], 1),
+            'min_health_score': segment['min_health_score']
+        }
+
+
+class StreamAnalyzer:
+    """Decode -> inference -> post-processing pipeline joined by bounded queues.
+
+    Decoding and inference each run on their own thread and post-processing runs on the
+    caller's, so a slow stage applies backpressure instead of letting frames pile up.
+    """
+
+    def __init__(self, predictor, batch_size=8, queue_size=16, segment_seconds=10.0,
+                 track_iou=0.3, track_max_age=5):
+        self.predictor = predictor
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.segment_seconds = segment_seconds
+        self.track_iou = track_iou
+        self.track_max_age = track_max_age
+
+    def run(self, frames, emit=EMIT_KINDS):
+        """Yield JSON-serializable records as frames flow through; frames is an iter_frames() generator"""
+        decoded = queue.Queue(maxsize=self.queue_size)
+        inferred = queue.Queue(maxsize=max(1, self.queue_size // self.batch_size))
+        stop = threading.Event()
+
+        stages = [
+            threading.Thread(target=self._decode_stage, args=(frames, decoded, stop), daemon=True),
+            threading.Thread(target=self._inference_stage, args=(decoded, inferred, stop), daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            yield from self._postprocess_stage(inferred, emit)
+        finally:
+            # Unblock the producers if the consumer stopped early
+            stop.set()
+            for stage in stages:
+                stage.join(timeout=5)
+
+    def _put(self, q, item, stop):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q, stop):
+        while not stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return END
+
+    def _decode_stage(self, frames, decoded, stop):
+        try:
+            for frame in frames:
+                if not self._put(decoded, frame, stop):
+                    return
+            self._put(decoded, END, stop)
+        except Exception as e:
+            self._put(decoded, e, stop)
+
+    def _inference_stage(self, decoded, inferred, stop):
+        predictor = self.predictor
+        lowest_threshold = min(predictor.confidence_thresholds)
+        try:
+            finished = False
+            while not finished:
+                batch = []
+                while len(batch) < self.batch_size:
+                    item = self._get(decoded, stop)
+                    if item is END or isinstance(item, Exception):
+                        finished = True
+                        break
+                    batch.append(item)
+
+                if batch:
+                    # Same single pass as detect_batch_single_pass; large frames go through the tiler
+                    plain = [frame for frame in batch if not predictor.use_tiling(frame[2])]
+                    results = dict(zip(
+                        (frame[0] for frame in plain),
+                        predictor.run_model([frame[2] for frame in plain], lowest_threshold) if plain else []
+                    ))
+                    for index, seconds, img in batch:
+                        if index not in results:
+                            results[index] = predict_tiled(
+                                predictor.run_model, img, lowest_threshold, tile_size=predictor.tile_size,
+                                overlap=predictor.tile_overlap, batch_size=predictor.tile_batch_size,
+                                iou=predictor.iou, merge=predictor.tile_merge)
+                        if not self._put(inferred, (index, seconds, img.shape, results[index]), stop):
+                            return
+
+                if finished:
+                    self._put(inferred, item, stop)
+        except Exception as e:
+            self._put(inferred, e, stop)
+
+    def _postprocess_stage(self, inferred, emit):
+        predictor = self.predictor
+        tracker = IoUTracker(self.track_iou, self.track_max_age)
+        segments = SegmentAggregator(self.segment_seconds)
+        frames = 0
+        class_counts = Counter()
+
+        while True:
+            item = inferred.get()
+            if item is END:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            index, seconds, img_shape, result = item
+            detections, conf_threshold = predictor.replay_thresholds([result], img_shape)
+            analysis = predictor.generate_analysis(detections, img_shape)
+            frames += 1
+            class_counts.update(d['class_name'] for d in detections)
+
+            if 'frames' in emit:
+                yield {
+                    'type': 'frame',
+                    'frame': index,
+                    'seconds': round(seconds, 3),
+                    'detections': detections,
+                    'analysis': analysis,
+                    'confidence_threshold': conf_threshold
+                }
+            closed = tracker.update(index, seconds, detections)
+            if 'tracks' in emit:
+                yield from closed
+            segment = segments.add(seconds, detections, analysis)
+            if segment is not None and 'segments' in emit:
+                yield segment
+
+        if 'tracks' in emit:
+            yield from tracker.flush()
+        segment = segments.flush()
+        if segment is not None and 'segments' in emit:
+            yield segment
+        yield {
+            'type': 'summary',
+            'frames': frames,
+            'tracks': tracker.next_id,
+            'class_counts': dict(class_counts.most_common())
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse Rubber Tree video or frame directories as a stream of JSON lines')
+    parser.add_argument('source', help='Video file or directory of frame images')
+    parser.add_argument('--stride', type=int, default=1, help='Analyse every Nth frame')
+    parser.add_argument('--sample-fps', type=float, default=None, help='Analyse about this many frames per second (overrides --stride)')
+    parser.add_argument('--start', type=int, default=0, help='First frame index to analyse')
+    parser.add_argument('--max-frames', type=int, default=None, help='Stop after this many analysed frames')
+    parser.add_argument('--batch-size', type=int, default=8, help='Frames per YOLO forward pass')
+    parser.add_argument('--queue-size', type=int, default=16, help='Decoded frames buffered ahead of inference')
+    parser.add_argument('--segment-seconds', type=float, default=10.0, help='Length of each aggregated segment')
+    parser.add_argument('--track-iou', type=float, default=0.3, help='Minimum IoU to continue a track')
+    parser.add_argument('--track-max-age', type=int, default=5, help='Frames a track may go unmatched before it closes')
+    parser.add_argument('--emit', type=str, default=','.join(EMIT_KINDS),
+                        help=f"Comma-separated record types to print ({', '.join(EMIT_KINDS)}); the summary is always printed")
+    parser.add_argument('--model', type=str, default='yolov11_custom.pt', help='Model weights file')
+    parser.add_argument('--backend', type=str, default='torch', choices=BACKENDS,
+                        help='Inference backend; exported backends need TrainRubberTree.py --export')
+    parser.add_argument('--tile-size', type=int, default=None,
+                        help='Detect on overlapping tiles of this many pixels when the frame is larger (off by default)')
+    args = parser.parse_args()
+
+    emit = [kind.strip() for kind in args.emit.split(',') if kind.strip()]
+    stdout = sys.stdout
+    try:
+        # Predictor progress goes to stderr so stdout carries only JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            from PredictRubberTree import RubberTreePredictor
+            predictor = RubberTreePredictor(model_path=args.model, image_cache=False, result_cache=False,
+                                            backend=args.backend, tile_size=args.tile_size)
+            analyzer = StreamAnalyzer(predictor, batch_size=args.batch_size, queue_size=args.queue_size,
+                                      segment_seconds=args.segment_seconds, track_iou=args.track_iou,
+                                      track_max_age=args.track_max_age)
+            frames = iter_frames(args.source, stride=args.stride, sample_fps=args.sample_fps,
+                                 start=args.start, max_frames=args.max_frames)
+            for record in analyzer.run(frames, emit):
+                print(json.dumps(record), file=stdout, flush=True)
+
+    except Exception as e:
+        print(json.dumps({
+            'type': 'error',
+            'success': False,
+            'error': f"Fatal error: {str(e)}"
+        }), file=stdout)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
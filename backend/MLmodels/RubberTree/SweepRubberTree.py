@@ -0,0 +1,227 @@
+# backend/MLmodels/RubberTree/SweepRubberTree.py
+import os
+import sys
+import json
+import random
+import argparse
+import itertools
+import contextlib
+import statistics
+import multiprocessing as mp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PredictRubberTree import IMGSZ
+
+PROJECT_DIR = Path(__file__).parent
+SWEEP_DIR = PROJECT_DIR / 'runs' / 'sweep'
+# Validation metric used for pruning and for picking the winner
+METRIC = 'metrics/mAP50-95(B)'
+
+
+def build_trials(imgsz_values, batch_values, lr_values, max_trials=None, seed=0):
+    """Grid over imgsz/batch/lr0, randomly subsampled to max_trials"""
+    grid = [
+        {'imgsz': imgsz, 'batch': batch, 'lr0': lr0}
+        for imgsz, batch, lr0 in itertools.product(imgsz_values, batch_values, lr_values)
+    ]
+    if max_trials and len(grid) > max_trials:
+        grid = random.Random(seed).sample(grid, max_trials)
+    for trial_id, trial in enumerate(grid):
+        trial['trial_id'] = trial_id
+        trial['name'] = f"trial_{trial_id}_imgsz{trial['imgsz']}_b{trial['batch']}_lr{trial['lr0']}"
+    return grid
+
+
+def should_prune(history, trial_id, epoch, min_epochs=3, min_peers=2):
+    """Median stopping rule: stop a trial whose best score so far is below the median of
+    the other trials' best scores at the same epoch"""
+    if epoch < min_epochs:
+        return False
+    own = history.get(trial_id, [])
+    if len(own) < epoch:
+        return False
+    peers = [max(scores[:epoch]) for other, scores in history.items()
+             if other != trial_id and len(scores) >= epoch]
+    if len(peers) < min_peers:
+        return False
+    return max(own[:epoch]) < statistics.median(peers)
+
+
+def run_trial(trial, shared_history, options):
+    """Train one configuration in its own process, reporting validation mAP after every epoch"""
+    threads = options['threads']
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[var] = str(threads)
+
+    # ultralytics' logger binds stdout at import; route it to stderr so stdout stays the JSON summary
+    with contextlib.redirect_stdout(sys.stderr):
+        import torch
+        from ultralytics import YOLO
+    torch.set_num_threads(threads)
+
+    trial_id = trial['trial_id']
+    pruned = {'epoch': None}
+
+    def on_fit_epoch_end(trainer):
+        score = float(trainer.metrics.get(METRIC, 0.0))
+        history = shared_history.get(trial_id, []) + [score]
+        # Reassign so the Manager proxy sees the update
+        shared_history[trial_id] = history
+        epoch = len(history)
+        if should_prune(dict(shared_history), trial_id, epoch, options['min_epochs']):
+            print(f"✂️ Pruning {trial['name']} after epoch {epoch} (mAP {score:.4f})", file=sys.stderr)
+            pruned['epoch'] = epoch
+            trainer.stop = True
+
+    model = YOLO(options['model'])
+    model.add_callback('on_fit_epoch_end', on_fit_epoch_end)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            model.train(
+                data=options['data'],
+                epochs=options['epochs'],
+                imgsz=trial['imgsz'],
+                batch=trial['batch'],
+                lr0=trial['lr0'],
+                device=options['device'],
+                workers=options['workers'],
+                cache=options['cache'],
+                project=str(SWEEP_DIR),
+                name=trial['name'],
+                exist_ok=True,
+                seed=42,
+                plots=False,
+                verbose=False
+            )
+    except Exception as e:
+        return {**trial, 'status': 'failed', 'error': str(e), 'history': shared_history.get(trial_id, [])}
+
+    history = shared_history.get(trial_id, [])
+    return {
+        **trial,
+        'status': 'pruned' if pruned['epoch'] else 'completed',
+        'pruned_at_epoch': pruned['epoch'],
+        'best_score': max(history) if history else None,
+        'history': [round(score, 4) for score in history],
+        'weights': str(SWEEP_DIR / trial['name'] / 'weights' / 'best.pt')
+    }
+
+
+def eligible_trials(results):
+    """Trials that can win: those that completed, or pruned ones only if nothing completed"""
+    for statuses in (('completed',), ('completed', 'pruned')):
+        candidates = [r for r in results if r['status'] in statuses and r.get('best_score') is not None
+                      and Path(r['weights']).exists()]
+        if candidates:
+            return candidates
+    return []
+
+
+def pick_winner(results):
+    """Best eligible trial by mAP50-95 at the serving image size, which score_at_serving_size adds"""
+    candidates = [r for r in eligible_trials(results) if r.get('serving') is not None]
+    return max(candidates, key=lambda r: r['serving']['map50_95']) if candidates else None
+
+
+def score_at_serving_size(trainer, results, imgsz, device):
+    """Validate every eligible trial at the size the predictor runs at.
+
+    Trials train at their own imgsz, and their per-epoch mAP is measured there, so a trial
+    that only wins at a size the predictor never uses would otherwise be promoted.
+    """
+    data_yaml = PROJECT_DIR / 'data.yaml'
+    for result in eligible_trials(results):
+        result['serving'] = trainer.validate_map(result['weights'], data_yaml, imgsz, device=device)
+        print(f"📏 {result['name']}: mAP50-95 {result['serving']['map50_95']:.4f} at imgsz {imgsz}",
+              file=sys.stderr)
+
+
+def run_sweep(trials, parallel, options):
+    """Run trials in parallel worker processes, sharing per-epoch scores for pruning"""
+    results = []
+    # spawn keeps torch thread pools and CUDA state out of the parent
+    context = mp.get_context('spawn')
+    with context.Manager() as manager:
+        shared_history = manager.dict()
+        with ProcessPoolExecutor(max_workers=parallel, mp_context=context) as executor:
+            futures = {executor.submit(run_trial, trial, shared_history, options): trial for trial in trials}
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"🏁 {result['name']}: {result['status']}, best mAP50-95 {result.get('best_score')}",
+                      file=sys.stderr)
+    return sorted(results, key=lambda r: r['trial_id'])
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hyperparameter sweep for the Rubber Tree YOLO model')
+    parser.add_argument('--imgsz', type=str, default='512,640', help='Comma-separated image sizes')
+    parser.add_argument('--batch', type=str, default='8,16', help='Comma-separated batch sizes')
+    parser.add_argument('--lr0', type=str, default='0.01,0.005', help='Comma-separated initial learning rates')
+    parser.add_argument('--max-trials', type=int, default=None, help='Randomly sample this many grid points')
+    parser.add_argument('--epochs', type=int, default=30, help='Epochs per trial')
+    parser.add_argument('--parallel', type=int, default=2, help='Trials trained at the same time')
+    parser.add_argument('--min-epochs', type=int, default=3, help='Epochs before a trial can be pruned')
+    parser.add_argument('--model', type=str, default='yolo11n.pt', help='Starting weights for every trial')
+    parser.add_argument('--device', type=str, default=None, help='Device (cuda/cpu, default: GPU if available)')
+    parser.add_argument('--cache', type=str, default=None, choices=['ram', 'disk'], help='Cache decoded images')
+    parser.add_argument('--no-promote', action='store_true', help='Report the winner without copying it to yolov11_custom.pt')
+    parser.add_argument('--max-regression', type=float, default=0.0,
+                        help='Largest mAP50-95 drop from the current weights at which the winner is still promoted')
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    threads = max(1, cores // args.parallel)
+    model = PROJECT_DIR / args.model
+    options = {
+        'model': str(model) if model.exists() else args.model,
+        'data': str(PROJECT_DIR / 'data.yaml'),
+        'epochs': args.epochs,
+        # None lets ultralytics pick the GPU when there is one; torch stays out of this process
+        'device': args.device,
+        'cache': args.cache or False,
+        'min_epochs': args.min_epochs,
+        'threads': threads,
+        # Split the cores between the trials' dataloaders as well as their torch threads
+        'workers': max(1, min(4, threads - 1))
+    }
+    trials = build_trials(parse_list(args.imgsz, int), parse_list(args.batch, int), parse_list(args.lr0, float),
+                          args.max_trials)
+    print(f"🧪 Running {len(trials)} trials, {args.parallel} at a time with {threads} threads each", file=sys.stderr)
+
+    results = run_sweep(trials, args.parallel, options)
+    summary = {'trials': results, 'serving_imgsz': IMGSZ, 'winner': None, 'current': None, 'promoted': None}
+
+    # ultralytics reports validation on stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        from TrainRubberTree import RubberTreeTrainer
+        trainer = RubberTreeTrainer()
+        score_at_serving_size(trainer, results, IMGSZ, options['device'])
+        winner = pick_winner(results)
+        current_weights = PROJECT_DIR / 'yolov11_custom.pt'
+        if winner and current_weights.exists():
+            summary['current'] = trainer.validate_map(current_weights, PROJECT_DIR / 'data.yaml', IMGSZ,
+                                                      device=options['device'])
+
+        if winner:
+            summary['winner'] = winner['name']
+            current = summary['current']
+            if current and winner['serving']['map50_95'] < current['map50_95'] - args.max_regression:
+                print(f"⚠️ Kept current weights: mAP50-95 {current['map50_95']:.4f} -> "
+                      f"{winner['serving']['map50_95']:.4f} regresses by more than {args.max_regression}",
+                      file=sys.stderr)
+            elif not args.no_promote:
+                summary['promoted'] = str(trainer.promote(winner['weights']))
+
+    SWEEP_DIR.mkdir(parents=True, exist_ok=True)
+    (SWEEP_DIR / 'sweep_results.json').write_text(json.dumps(summary, indent=2) + '\n')
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+    main()
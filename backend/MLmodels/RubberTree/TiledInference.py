@@ -0,0 +1,100 @@
+# backend/MLmodels/RubberTree/TiledInference.py
+from LazyImport import lazy_import
+from ExportedModel import Boxes, Result, box_iou_one_to_many
+from Instrumentation import span
+
+np = lazy_import('numpy')
+
+MERGE_METHODS = ['nms', 'wbf']
+
+
+def tile_starts(length, tile_size, overlap):
+    """Start offsets covering [0, length) with tiles that overlap by a fraction of tile_size"""
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1 - overlap)))
+    starts = list(range(0, length - tile_size, stride))
+    # The last tile is aligned to the edge instead of running past it
+    starts.append(length - tile_size)
+    return starts
+
+
+def tile_grid(img_shape, tile_size, overlap):
+    """(x, y) origin of every tile of an image"""
+    height, width = img_shape[:2]
+    return [(x, y) for y in tile_starts(height, tile_size, overlap) for x in tile_starts(width, tile_size, overlap)]
+
+
+def cluster_boxes(boxes, scores, iou_threshold):
+    """Greedy NMS that also returns the boxes each kept box suppressed, strongest first.
+
+    Each step compares the current best box against all remaining ones in a single
+    vectorized IoU, exactly like ExportedModel.nms.
+    """
+    order = np.argsort(-scores, kind='stable')
+    clusters = []
+    while order.size > 0:
+        ious = box_iou_one_to_many(boxes[order[0]], boxes[order[1:]])
+        suppressed = ious > iou_threshold
+        clusters.append(np.concatenate([order[:1], order[1:][suppressed]]))
+        order = order[1:][~suppressed]
+    return clusters
+
+
+def merge_detections(data, iou_threshold, method='nms'):
+    """Merge an (N, 6) xyxy/conf/cls array gathered from overlapping tiles.
+
+    'nms' keeps the strongest box of each overlapping group. 'wbf' replaces it with the
+    confidence-weighted average of the group, which joins halves of objects cut by a
+    tile edge; the fused box keeps the strongest confidence so threshold replay is unchanged.
+    """
+    if len(data) == 0:
+        return data
+
+    # Offset boxes per class so one pass never merges across classes
+    offset = data[:, :4].max() + 1
+    shifted = data[:, :4] + data[:, 5:6] * offset
+    clusters = cluster_boxes(shifted, data[:, 4], iou_threshold)
+
+    if method == 'nms':
+        return data[[cluster[0] for cluster in clusters]]
+
+    merged = np.empty((len(clusters), 6), dtype=data.dtype)
+    for row, cluster in enumerate(clusters):
+        members = data[cluster]
+        weights = members[:, 4:5]
+        merged[row, :4] = (members[:, :4] * weights).sum(axis=0) / weights.sum()
+        merged[row, 4:] = members[0, 4:]
+    return merged
+
+
+def predict_tiled(run_model, img, conf, tile_size=640, overlap=0.2, batch_size=8, iou=0.45,
+                  merge='nms', include_full_image=True):
+    """Detect on overlapping tiles of img and return one Result in full-image coordinates.
+
+    run_model(images, conf) is called on at most batch_size tiles at a time. Tiles are views
+    into img, so memory stays bounded by one batch however large the photo is. The
+    downscaled full image is run too, so objects larger than a tile are still found whole.
+    """
+    origins = tile_grid(img.shape, tile_size, overlap)
+    jobs = [(img[y:y + tile_size, x:x + tile_size], x, y) for x, y in origins]
+    if include_full_image and len(origins) > 1:
+        jobs.append((img, 0, 0))
+
+    gathered = []
+    for start in range(0, len(jobs), batch_size):
+        chunk = jobs[start:start + batch_size]
+        results = run_model([tile for tile, _, _ in chunk], conf)
+        for (_, x, y), result in zip(chunk, results):
+            if result.boxes is None or len(result.boxes) == 0:
+                continue
+            # Columns are x1, y1, x2, y2, [track id,] conf, cls
+            data = result.boxes.data.cpu().numpy().astype(np.float32)
+            data = data[:, [0, 1, 2, 3, -2, -1]]
+            data[:, [0, 2]] += x
+            data[:, [1, 3]] += y
+            gathered.append(data)
+
+    with span('postprocess'):
+        data = np.concatenate(gathered) if gathered else np.zeros((0, 6), dtype=np.float32)
+        return Result(Boxes(merge_detections(data, iou, merge)), img.shape[:2])
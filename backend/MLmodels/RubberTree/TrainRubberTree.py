@@ -1,10 +1,250 @@
 # backend/MLmodels/RubberTree/TrainRubberTree.py
+import os
+import gc
+import json
+import time
+import random
+import hashlib
 import yaml
 from pathlib import Path
 from ultralytics import YOLO
 import argparse
 import torch
 
+from DatasetIndex import build_index, CORRUPT, BAD_LABEL, NO_LABEL
+from EvaluateRubberTree import evaluate, format_report
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+UPLOADS_DIR = Path(__file__).parent.parent.parent / 'uploads' / 'rubber-tree'
+# Content hashes of the uploads already folded into yolov11_custom.pt
+INCREMENTAL_STATE_PATH = Path(__file__).parent / 'cache' / 'incremental_state.json'
+
+
+def available_cores():
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+
+
+def auto_workers():
+    """Dataloader workers for this machine, leaving one core for the training loop itself"""
+    return max(1, min(8, available_cores() - 1))
+
+
+def available_memory_bytes():
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except ImportError:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+
+
+def estimate_cache_bytes(image_dir, imgsz):
+    """Decoded size of a split once ultralytics resizes each image's long side to imgsz"""
+    images = [p for p in Path(image_dir).rglob('*') if p.suffix.lower() in IMAGE_SUFFIXES]
+    # Worst case is a square image; aspect ratio only makes the cached array smaller
+    return len(images) * imgsz * imgsz * 3
+
+
+def choose_cache(image_dir, imgsz, memory_fraction=0.5):
+    """'ram' when the decoded training split fits comfortably in free memory, else 'disk'"""
+    needed = estimate_cache_bytes(image_dir, imgsz)
+    return 'ram' if needed <= available_memory_bytes() * memory_fraction else 'disk'
+
+
+def current_rss_bytes():
+    """Resident memory right now rather than the process high-water mark, or None if unreadable"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+
+def release_freed_memory():
+    """Collect garbage and, on glibc, hand freed heap pages back to the OS so RSS shows only live memory"""
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def training_step_bytes(net, batch_size, imgsz, device):
+    """Resident memory one forward and backward pass adds while its activations and gradients are alive"""
+    # Without this the previous step's freed pages are reused and this step looks cheaper than it is
+    release_freed_memory()
+    before = current_rss_bytes()
+    x = torch.rand(batch_size, 3, imgsz, imgsz, device=device)
+    outputs = net(x)
+    outputs = outputs if isinstance(outputs, (list, tuple)) else [outputs]
+    # Activations are all held here, just before backward starts releasing them
+    forward = current_rss_bytes()
+    sum(o.float().sum() for o in outputs if torch.is_tensor(o)).backward()
+    backward = current_rss_bytes()
+    net.zero_grad(set_to_none=True)
+    return max(forward, backward) - before
+
+
+def auto_batch_size(model, imgsz, device, reserved_bytes=0, memory_fraction=0.6, max_batch=64):
+    """Largest power-of-two batch whose training step fits in the memory left after the cache.
+
+    On CUDA ultralytics' own AutoBatch (batch=-1) sizes against GPU memory. On CPU the cost of
+    one image is measured by running forward and backward passes at two batch sizes and
+    comparing how much resident memory each adds. The process high-water mark is no use here:
+    dataset indexing or an earlier run can already have pushed it past either step. A throwaway
+    step runs first so one-off allocations (weight gradients, thread pools, kernel workspaces)
+    are not charged to the first measured size.
+    """
+    if str(device).startswith('cuda'):
+        return -1
+    if current_rss_bytes() is None:
+        print("⚠️ Cannot read resident memory on this platform, using batch 16")
+        return 16
+
+    import copy
+    net = copy.deepcopy(model.model).to(device).float().train()
+    for parameter in net.parameters():
+        parameter.requires_grad_(True)
+
+    small, large = 2, 8
+    training_step_bytes(net, small, imgsz, device)
+    step_small = training_step_bytes(net, small, imgsz, device)
+    step_large = training_step_bytes(net, large, imgsz, device)
+    del net
+
+    measured = (step_large - step_small) / (large - small)
+    budget = available_memory_bytes() * memory_fraction - reserved_bytes
+    print(f"Auto batch: measured {measured / 1e6:.1f} MB per image "
+          f"(batch {small}: {step_small / 1e6:.0f} MB, batch {large}: {step_large / 1e6:.0f} MB)")
+    if measured <= 0 or budget <= 0:
+        print("⚠️ Could not measure per-image training memory, using batch 16")
+        return 16
+
+    # The float32 input alone is held for the whole step, so anything below it is measurement noise
+    per_image = max(measured, 3 * imgsz * imgsz * 4)
+    batch = 1
+    while batch * 2 <= min(max_batch, budget / per_image):
+        batch *= 2
+    print(f"Auto batch: ~{per_image / 1e6:.0f} MB per image, {budget / 1e9:.1f} GB budget -> batch {batch}")
+    return batch
+
+
+def upload_label_path(image_path):
+    """YOLO label of an uploaded image: <stem>.txt beside it or in a labels/ subdirectory, else None"""
+    for candidate in (image_path.with_suffix('.txt'), image_path.parent / 'labels' / f'{image_path.stem}.txt'):
+        if candidate.exists() and candidate.stat().st_size > 0:
+            return candidate
+    return None
+
+
+def sample_hash(image_path, label_path):
+    """Hash of an image together with its labels, so relabelling an upload counts as a change"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(image_path.read_bytes())
+    digest.update(label_path.read_bytes())
+    return digest.hexdigest()
+
+
+def labelled_uploads(uploads_dir=UPLOADS_DIR):
+    """(image, label, hash) for every uploaded image that has a label file"""
+    uploads_dir = Path(uploads_dir)
+    if not uploads_dir.is_dir():
+        return []
+    samples = []
+    for image_path in sorted(uploads_dir.iterdir()):
+        if image_path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        label_path = upload_label_path(image_path)
+        if label_path is not None:
+            samples.append((image_path, label_path, sample_hash(image_path, label_path)))
+    return samples
+
+
+def load_incremental_state(path=INCREMENTAL_STATE_PATH):
+    if not path.exists():
+        return {'trained': {}, 'runs': []}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_incremental_state(state, path=INCREMENTAL_STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def stage_dataset(stage_dir, samples, val_dir, names):
+    """Symlink (image, label) pairs into an images/ labels/ tree and write a data yaml for it.
+
+    val points at the original validation split so every fine-tune is scored on the same images.
+    """
+    images_dir = stage_dir / 'images' / 'train'
+    labels_dir = stage_dir / 'labels' / 'train'
+    images_dir.mkdir(parents=True, exist_ok=True)
+    labels_dir.mkdir(parents=True, exist_ok=True)
+    for i, (image_path, label_path) in enumerate(samples):
+        # Prefix with the position so uploads and dataset images with the same stem do not collide
+        name = f'{i:05d}_{image_path.stem}'
+        (images_dir / f'{name}{image_path.suffix}').symlink_to(image_path.resolve())
+        (labels_dir / f'{name}.txt').symlink_to(label_path.resolve())
+
+    data_yaml = stage_dir / 'data.yaml'
+    with open(data_yaml, 'w') as f:
+        yaml.safe_dump({
+            'path': str(stage_dir),
+            'train': str(images_dir),
+            'val': str(val_dir),
+            'nc': len(names),
+            'names': list(names)
+        }, f, sort_keys=False)
+    return data_yaml
+
+
+class EpochTimer:
+    """ultralytics callbacks that record training time and throughput per epoch"""
+
+    def __init__(self):
+        self.epochs = []
+        self.started = None
+
+    def register(self, model):
+        model.add_callback('on_train_epoch_start', self.on_train_epoch_start)
+        model.add_callback('on_train_epoch_end', self.on_train_epoch_end)
+
+    def on_train_epoch_start(self, trainer):
+        self.started = time.perf_counter()
+
+    def on_train_epoch_end(self, trainer):
+        seconds = time.perf_counter() - self.started
+        images = len(trainer.train_loader.dataset)
+        epoch = {
+            'epoch': trainer.epoch + 1,
+            'seconds': round(seconds, 2),
+            'images': images,
+            'images_per_second': round(images / seconds, 2) if seconds else None
+        }
+        self.epochs.append(epoch)
+        print(f"⏱️ Epoch {epoch['epoch']}: {epoch['seconds']}s, {epoch['images_per_second']} images/sec")
+
+    def summary(self):
+        if not self.epochs:
+            return {'epochs': []}
+        seconds = sum(e['seconds'] for e in self.epochs)
+        images = sum(e['images'] for e in self.epochs)
+        return {
+            'epochs': self.epochs,
+            'mean_epoch_seconds': round(seconds / len(self.epochs), 2),
+            'images_per_second': round(images / seconds, 2) if seconds else None
+        }
+
+
 class RubberTreeTrainer:
     def __init__(self, model_name='yolo11n.pt', data_yaml='data.yaml'):
         self.model_name = model_name
@@ -20,21 +260,86 @@ class RubberTreeTrainer:
         print(f"Classes: {self.config['names']}")
         print(f"Number of classes: {self.config['nc']}")
         
-    def train(self, epochs=100, imgsz=640, batch=16, device=None):
-        """Train the YOLO model"""
+    def resumable_checkpoint(self, run_name='rubber_tree_yolo11'):
+        """last.pt of an interrupted run, or None when there is nothing to resume"""
+        last = self.project_dir / 'runs' / 'detect' / run_name / 'weights' / 'last.pt'
+        if not last.exists():
+            return None
+        try:
+            checkpoint = torch.load(str(last), map_location='cpu', weights_only=False)
+        except Exception as e:
+            print(f"⚠️ Could not read checkpoint {last}: {e}")
+            return None
+        # Completed runs strip the optimizer from last.pt and mark the epoch as -1
+        if checkpoint.get('optimizer') is None or checkpoint.get('epoch', -1) < 0:
+            return None
+        return last
+
+    def check_dataset(self):
+        """Update the dataset manifest and report problems that would otherwise surface mid-run"""
+        index = build_index(self.project_dir / self.data_yaml)
+        problems = index.problems()
+        counts = {key: len(value) for key, value in problems.items()}
+        for key in ('corrupt', 'truncated', 'bad_label', 'orphan_labels'):
+            if counts[key]:
+                print(f"⚠️ {counts[key]} {key.replace('_', ' ')} files, e.g. {problems[key][0]}")
+        leaked = [group for group in problems['duplicates'] if group['cross_split']]
+        if leaked:
+            print(f"⚠️ {len(leaked)} images appear in more than one split, e.g. {leaked[0]['images']}")
+        for split, stats in index.class_balance().items():
+            if stats['missing_classes']:
+                print(f"⚠️ {split} split has no boxes for: {', '.join(stats['missing_classes'])}")
+        return counts
+
+    def resolve_auto_settings(self, model, train_dir, imgsz, device, batch, cache, workers):
+        """Replace any 'auto' batch, cache or workers setting with a value sized to this machine"""
+        if cache == 'auto':
+            cache = choose_cache(train_dir, imgsz)
+            print(f"Auto cache: {cache}")
+        if workers == 'auto':
+            workers = auto_workers()
+            print(f"Auto workers: {workers} of {available_cores()} cores")
+        if batch == 'auto':
+            reserved = estimate_cache_bytes(train_dir, imgsz) if cache == 'ram' else 0
+            batch = auto_batch_size(model, imgsz, device, reserved_bytes=reserved)
+        return batch, cache, workers
+
+    def train(self, epochs=100, imgsz=640, batch=16, device=None, cache=False, workers=4, resume=True,
+              check_dataset=True):
+        """Train the YOLO model
+
+        cache is False, 'ram', 'disk' or 'auto'; batch and workers also accept 'auto'.
+        'ram' keeps the decoded images in memory and 'disk' stores them as .npy files
+        next to the JPEGs, so epochs after the first skip JPEG decoding.
+        With resume, an interrupted run continues from its last.pt with the optimizer state,
+        epoch count and hyperparameters saved in the checkpoint.
+        With check_dataset, the dataset manifest is updated first and its problems are printed.
+        """
         try:
+            dataset_problems = self.check_dataset() if check_dataset else None
+
             # Set device
             if device is None:
                 device = 'cuda' if torch.cuda.is_available() else 'cpu'
             print(f"Using device: {device}")
             
             # Load model
+            checkpoint = self.resumable_checkpoint() if resume else None
             model_path = self.project_dir / self.model_name
-            if not model_path.exists():
-                print(f"Model {model_name} not found, using base YOLOv11 model")
+            if checkpoint is not None:
+                print(f"🔁 Resuming interrupted training from {checkpoint}")
+                model = YOLO(str(checkpoint))
+            elif not model_path.exists():
+                print(f"Model {self.model_name} not found, using base YOLOv11 model")
                 model = YOLO('yolo11n.pt')
             else:
                 model = YOLO(str(model_path))
+
+            train_dir = (self.project_dir / self.config['train']).resolve()
+            batch, cache, workers = self.resolve_auto_settings(model, train_dir, imgsz, device, batch, cache, workers)
+
+            epoch_timer = EpochTimer()
+            epoch_timer.register(model)
             
             # Training arguments
             train_args = {
@@ -43,17 +348,18 @@ class RubberTreeTrainer:
                 'imgsz': imgsz,
                 'batch': batch,
                 'device': device,
-                'workers': 4,
+                'workers': workers,
                 'save': True,
                 'save_period': 10,
-                'cache': False,
+                'cache': cache,
+                'project': str(self.project_dir / 'runs' / 'detect'),
                 'name': 'rubber_tree_yolo11',
                 'patience': 50,
                 'box': 7.5,
                 'cls': 0.5,
                 'dfl': 1.5,
                 'close_mosaic': 10,
-                'resume': False,
+                'resume': str(checkpoint) if checkpoint is not None else False,
                 'amp': True,
                 'fraction': 1.0,
                 'profile': False,
@@ -87,16 +393,19 @@ class RubberTreeTrainer:
                 best_model_path = self.project_dir / 'runs/detect/rubber_tree_yolo11/weights/best.pt'
             
             if best_model_path.exists():
-                # Copy to main directory
-                import shutil
-                final_model_path = self.project_dir / 'yolov11_custom.pt'
-                shutil.copy2(best_model_path, final_model_path)
-                print(f"\n✅ Trained model saved to: {final_model_path}")
+                self.promote(best_model_path)
             
+            throughput = epoch_timer.summary()
+            if throughput['epochs']:
+                print(f"⏱️ Mean epoch time {throughput['mean_epoch_seconds']}s, "
+                      f"{throughput['images_per_second']} images/sec")
+
             return {
                 'success': True,
                 'metrics': metrics,
-                'results': results
+                'results': results,
+                'throughput': throughput,
+                'dataset_problems': dataset_problems
             }
             
         except Exception as e:
@@ -106,23 +415,196 @@ class RubberTreeTrainer:
                 'error': str(e)
             }
     
-    def test(self, model_path=None):
-        """Test the trained model"""
+    def replay_pool(self, state):
+        """Labelled samples the current weights were trained on: clean dataset train images plus past uploads"""
+        index = build_index(self.project_dir / self.data_yaml)
+        columns = index.columns
+        usable = (columns['split'] == 0) & ((columns['flags'] & (CORRUPT | BAD_LABEL | NO_LABEL)) == 0)
+        pool = [(index.root / image, index.root / label)
+                for image, label in zip(columns['image'][usable], columns['label'][usable])]
+        for entry in state['trained'].values():
+            image_path, label_path = Path(entry['image']), Path(entry['label'])
+            if image_path.exists() and label_path.exists():
+                pool.append((image_path, label_path))
+        return pool
+
+    def validate_map(self, weights_path, data_yaml, imgsz=640, batch=16, device=None):
+        """mAP50-95 and mAP50 of weights on the val split of data_yaml"""
+        metrics = YOLO(str(weights_path)).val(data=str(data_yaml), split='val', imgsz=imgsz, batch=batch,
+                                              device=device, plots=False, verbose=False)
+        return {'map50_95': float(metrics.box.map), 'map50': float(metrics.box.map50)}
+
+    def train_incremental(self, epochs=5, imgsz=640, batch=16, device=None, cache=False, workers=4,
+                          uploads_dir=UPLOADS_DIR, replay_ratio=2.0, max_regression=0.0, lr0=0.001):
+        """Fine-tune yolov11_custom.pt on new or changed labelled uploads plus a replay sample.
+
+        Uploads are tracked by the hash of image and label, so only ones not yet folded into the
+        deployed weights are trained on. replay_ratio old samples per new one guard against
+        forgetting. The result replaces yolov11_custom.pt only if its val mAP50-95 is no more than
+        max_regression below the current weights'.
+        """
+        try:
+            base_weights = self.project_dir / 'yolov11_custom.pt'
+            if not base_weights.exists():
+                return {'success': False, 'error': f'{base_weights.name} not found; run a full training first'}
+
+            state = load_incremental_state()
+            new_samples = [sample for sample in labelled_uploads(uploads_dir) if sample[2] not in state['trained']]
+            if not new_samples:
+                print(f"No new or changed labelled images in {uploads_dir}")
+                return {'success': True, 'promoted': False, 'new_images': 0}
+
+            if device is None:
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            print(f"Using device: {device}")
+
+            pool = self.replay_pool(state)
+            replay_count = min(len(pool), int(round(len(new_samples) * replay_ratio)))
+            replay = random.Random(42).sample(pool, replay_count)
+            print(f"🆕 {len(new_samples)} new labelled uploads, replaying {replay_count} of {len(pool)} old images")
+
+            run_name = time.strftime('%Y%m%d-%H%M%S')
+            run_dir = self.project_dir / 'runs' / 'incremental'
+            val_dir = (self.project_dir / self.config['val']).resolve()
+            samples = [(image_path, label_path) for image_path, label_path, _ in new_samples] + replay
+            data_yaml = stage_dataset(run_dir / run_name / 'dataset', samples, val_dir, self.config['names'])
+
+            model = YOLO(str(base_weights))
+            train_dir = data_yaml.parent / 'images' / 'train'
+            batch, cache, workers = self.resolve_auto_settings(model, train_dir, imgsz, device, batch, cache, workers)
+            # AutoBatch (-1) only applies to training; validate at the default batch instead
+            val_batch = batch if batch > 0 else 16
+
+            print("Validating current weights...")
+            baseline = self.validate_map(base_weights, data_yaml, imgsz, val_batch, device)
+
+            epoch_timer = EpochTimer()
+            epoch_timer.register(model)
+            print(f"Fine-tuning for {epochs} epochs...")
+            model.train(
+                data=str(data_yaml),
+                epochs=epochs,
+                imgsz=imgsz,
+                batch=batch,
+                device=device,
+                workers=workers,
+                cache=cache,
+                project=str(run_dir),
+                name=run_name,
+                exist_ok=True,
+                # A fixed optimizer, since 'auto' picks its own learning rate and would ignore lr0
+                optimizer='SGD',
+                lr0=lr0,
+                warmup_epochs=0,
+                seed=42,
+                plots=False
+            )
+
+            best_model_path = run_dir / run_name / 'weights' / 'best.pt'
+            print("Validating fine-tuned weights...")
+            candidate = self.validate_map(best_model_path, data_yaml, imgsz, val_batch, device)
+
+            promoted = candidate['map50_95'] >= baseline['map50_95'] - max_regression
+            if promoted:
+                self.promote(best_model_path)
+                for image_path, label_path, digest in new_samples:
+                    state['trained'][digest] = {
+                        'image': str(image_path.resolve()),
+                        'label': str(label_path.resolve()),
+                        'run': run_name
+                    }
+                print(f"✅ Promoted: mAP50-95 {baseline['map50_95']:.4f} -> {candidate['map50_95']:.4f}")
+            else:
+                print(f"⚠️ Kept current weights: mAP50-95 {baseline['map50_95']:.4f} -> "
+                      f"{candidate['map50_95']:.4f} regresses by more than {max_regression}")
+
+            run = {
+                'run': run_name,
+                'new_images': len(new_samples),
+                'replay_images': replay_count,
+                'baseline': baseline,
+                'candidate': candidate,
+                'promoted': promoted
+            }
+            state['runs'].append(run)
+            save_incremental_state(state)
+
+            return {
+                'success': True,
+                **run,
+                'weights': str(best_model_path),
+                'throughput': epoch_timer.summary()
+            }
+
+        except Exception as e:
+            print(f"Incremental training failed: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def promote(self, weights_path):
+        """Copy trained weights to yolov11_custom.pt, keeping the previous weights as yolov11_custom.prev.pt"""
+        import shutil
+        final_model_path = self.project_dir / 'yolov11_custom.pt'
+        if final_model_path.exists():
+            shutil.copy2(final_model_path, self.project_dir / 'yolov11_custom.prev.pt')
+        shutil.copy2(weights_path, final_model_path)
+        print(f"\n✅ Trained model saved to: {final_model_path}")
+        return final_model_path
+
+    def export(self, model_path=None, formats=('onnx',), imgsz=640):
+        """Export trained weights for CPU inference next to the .pt file"""
         try:
             if model_path is None:
                 model_path = self.project_dir / 'yolov11_custom.pt'
-                if not model_path.exists():
-                    return {'success': False, 'error': 'Model not found'}
-            
-            model = YOLO(str(model_path))
-            
-            # Test on validation set
-            results = model.val(data=str(self.project_dir / self.data_yaml))
-            
+            if not Path(model_path).exists():
+                return {'success': False, 'error': 'Model not found'}
+
+            exported = {}
+            for export_format in formats:
+                # Each export mutates the model's predictor state, so start from fresh weights
+                model = YOLO(str(model_path))
+                export_args = {'imgsz': imgsz}
+                if export_format == 'onnx':
+                    export_args.update({'format': 'onnx', 'simplify': True, 'dynamic': False})
+                elif export_format == 'openvino':
+                    export_args.update({'format': 'openvino'})
+                elif export_format == 'openvino-int8':
+                    # INT8 post-training quantization calibrates on the dataset
+                    export_args.update({'format': 'openvino', 'int8': True,
+                                        'data': str(self.project_dir / self.data_yaml)})
+                else:
+                    return {'success': False, 'error': f'Unsupported export format: {export_format}'}
+
+                print(f"Exporting {model_path} to {export_format}...")
+                exported[export_format] = str(model.export(**export_args))
+                print(f"✅ Exported {export_format} model to: {exported[export_format]}")
+
             return {
                 'success': True,
-                'metrics': results
+                'exported': exported
+            }
+
+        except Exception as e:
+            print(f"Export failed: {e}")
+            return {
+                'success': False,
+                'error': str(e)
             }
+
+    def test(self, model_path=None, backends=('torch',), imgsizes=(640,), split='test'):
+        """Per-class accuracy and latency of the trained model on the test split (see EvaluateRubberTree.py)"""
+        try:
+            if model_path is None:
+                model_path = self.project_dir / 'yolov11_custom.pt'
+                if not model_path.exists():
+                    return {'success': False, 'error': 'Model not found'}
+
+            report = evaluate(self.project_dir / self.data_yaml, split=split, model_path=model_path,
+                              backends=backends, imgsizes=imgsizes)
+            print(format_report(report))
+            return report
             
         except Exception as e:
             return {
@@ -132,29 +614,86 @@ class RubberTreeTrainer:
 
 def main():
     parser = argparse.ArgumentParser(description='Train Rubber Tree YOLO Model')
-    parser.add_argument('--epochs', type=int, default=100, help='Number of epochs')
+    parser.add_argument('--epochs', type=int, default=None, help='Number of epochs (default 100, or 5 with --incremental)')
     parser.add_argument('--imgsz', type=int, default=640, help='Image size')
-    parser.add_argument('--batch', type=int, default=16, help='Batch size')
+    parser.add_argument('--batch', type=str, default=None, help="Batch size (default 16), or 'auto' to size it to free memory")
+    parser.add_argument('--cache', type=str, default=None, choices=['ram', 'disk', 'auto'],
+                        help='Cache decoded images in RAM or as .npy files on disk (default: no cache)')
+    parser.add_argument('--workers', type=str, default=None,
+                        help="Dataloader workers (default 4), or 'auto' to use the available cores")
+    parser.add_argument('--fresh', action='store_true',
+                        help='Start a new run even if runs/detect/rubber_tree_yolo11 has an interrupted checkpoint')
+    parser.add_argument('--skip-dataset-check', action='store_true',
+                        help='Do not update the dataset manifest (DatasetIndex.py) before training')
+    parser.add_argument('--fast', action='store_true',
+                        help='Use auto for whichever of --cache, --workers and --batch are not given')
     parser.add_argument('--device', type=str, default=None, help='Device (cuda/cpu)')
     parser.add_argument('--test', action='store_true', help='Test mode')
+    parser.add_argument('--export', type=str, default=None,
+                        help='Comma-separated export formats after training: onnx, openvino, openvino-int8')
+    parser.add_argument('--export-only', action='store_true', help='Export the existing yolov11_custom.pt without training')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Fine-tune yolov11_custom.pt on new labelled uploads instead of a full training run')
+    parser.add_argument('--uploads-dir', type=str, default=str(UPLOADS_DIR),
+                        help='Uploaded images, each with a YOLO <stem>.txt beside it or in labels/')
+    parser.add_argument('--replay-ratio', type=float, default=2.0,
+                        help='Old training images replayed per new upload with --incremental')
+    parser.add_argument('--max-regression', type=float, default=0.0,
+                        help='Largest val mAP50-95 drop that still promotes an incremental run')
     
     args = parser.parse_args()
     
     trainer = RubberTreeTrainer()
+    export_formats = [f.strip() for f in args.export.split(',') if f.strip()] if args.export else []
     
-    if args.test:
+    if args.export_only:
+        result = trainer.export(formats=export_formats or ['onnx'], imgsz=args.imgsz)
+        print(f"Export result: {result}")
+    elif args.test:
         print("Testing model...")
-        result = trainer.test()
-        print(f"Test result: {result}")
+        result = trainer.test(imgsizes=(args.imgsz,))
+        print(json.dumps(result, indent=2))
+    elif args.incremental:
+        default = 'auto' if args.fast else None
+        batch = args.batch or default or '16'
+        workers = args.workers or default or '4'
+        result = trainer.train_incremental(
+            epochs=args.epochs or 5,
+            imgsz=args.imgsz,
+            batch=batch if batch == 'auto' else int(batch),
+            device=args.device,
+            cache=args.cache or default or False,
+            workers=workers if workers == 'auto' else int(workers),
+            uploads_dir=Path(args.uploads_dir),
+            replay_ratio=args.replay_ratio,
+            max_regression=args.max_regression
+        )
+        print(f"Incremental training completed: {result}")
+
+        if export_formats and result.get('promoted'):
+            export_result = trainer.export(formats=export_formats, imgsz=args.imgsz)
+            print(f"Export result: {export_result}")
     else:
-        print(f"Training model for {args.epochs} epochs...")
+        epochs = args.epochs or 100
+        print(f"Training model for {epochs} epochs...")
+        default = 'auto' if args.fast else None
+        batch = args.batch or default or '16'
+        workers = args.workers or default or '4'
         result = trainer.train(
-            epochs=args.epochs,
+            epochs=epochs,
             imgsz=args.imgsz,
-            batch=args.batch,
-            device=args.device
+            batch=batch if batch == 'auto' else int(batch),
+            device=args.device,
+            cache=args.cache or default or False,
+            workers=workers if workers == 'auto' else int(workers),
+            resume=not args.fresh,
+            check_dataset=not args.skip_dataset_check
         )
         print(f"Training completed: {result}")
+        
+        if export_formats and result['success']:
+            export_result = trainer.export(formats=export_formats, imgsz=args.imgsz)
+            print(f"Export result: {export_result}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
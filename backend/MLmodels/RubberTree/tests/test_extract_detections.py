@@ -0,0 +1,106 @@
+# backend/MLmodels/RubberTree/tests/test_extract_detections.py
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from ExportedModel import Boxes, Result
+from PredictRubberTree import RubberTreePredictor
+
+IMG_SHAPE = (480, 640, 3)
+
+
+def make_predictor(**kwargs):
+    """Predictor without weights; these tests only exercise post-processing"""
+    with mock.patch.object(RubberTreePredictor, 'load_model', return_value=None):
+        return RubberTreePredictor(image_cache=False, result_cache=False, instrument=False, **kwargs)
+
+
+class Float64Boxes(Boxes):
+    """Boxes that keep float64 values instead of casting to float32 like YOLO's"""
+
+    def __init__(self, data):
+        self.array = np.asarray(data, dtype=np.float64).reshape(-1, 6)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield Float64Boxes(self.array[i:i + 1])
+
+
+def fixed_results():
+    """Float32 boxes like YOLO's, including values whose decimal form ends in a 5"""
+    rng = np.random.default_rng(9)
+    count = 200
+    x1 = rng.uniform(0, 600, count)
+    y1 = rng.uniform(0, 440, count)
+    data = np.stack([x1, y1, x1 + rng.uniform(1, 40, count), y1 + rng.uniform(1, 40, count),
+                     rng.uniform(0.01, 0.95, count), rng.integers(0, 90, count)], axis=1)
+    near_ties = np.array([
+        [2.675, 1.005, 10.125, 20.345, 0.28125, 2],
+        [100.125, 0.285, 200.675, 300.015, 0.15005, 0],
+        [1.115, 2.225, 3.335, 4.445, 0.10005, 58],
+    ])
+    return [Result(Boxes(data[:100]), IMG_SHAPE[:2]), Result(Boxes(np.concatenate([data[100:], near_ties])), IMG_SHAPE[:2])]
+
+
+def baseline_detections(predictor, results, img_shape, min_confidence=None):
+    """The per-box loop extract_detections replaced"""
+    detections = []
+    for result in results:
+        boxes = result.boxes
+        if boxes is not None and len(boxes) > 0:
+            for box in boxes:
+                conf = float(box.conf[0])
+                if min_confidence is not None and not conf > min_confidence:
+                    continue
+
+                cls = int(box.cls[0])
+                bbox = box.xyxy[0].cpu().numpy().tolist()
+                class_name = predictor.map_coco_to_rubber_classes(cls, conf, bbox, img_shape)
+
+                detections.append({
+                    'class_id': cls,
+                    'class_name': class_name,
+                    'confidence': round(conf, 4),
+                    'bbox': [round(x, 2) for x in bbox],
+                    'width': round(float(bbox[2]-bbox[0]), 2),
+                    'height': round(float(bbox[3]-bbox[1]), 2)
+                })
+    return detections
+
+
+class ExtractDetectionsTest(unittest.TestCase):
+    def setUp(self):
+        self.predictor = make_predictor()
+        self.results = fixed_results()
+
+    def test_matches_baseline_loop(self):
+        self.assertEqual(self.predictor.extract_detections(self.results, IMG_SHAPE),
+                         baseline_detections(self.predictor, self.results, IMG_SHAPE))
+
+    def test_matches_baseline_loop_at_each_threshold(self):
+        for conf_threshold in self.predictor.confidence_thresholds:
+            with self.subTest(conf_threshold=conf_threshold):
+                self.assertEqual(
+                    self.predictor.extract_detections(self.results, IMG_SHAPE, min_confidence=conf_threshold),
+                    baseline_detections(self.predictor, self.results, IMG_SHAPE, min_confidence=conf_threshold))
+
+    def test_rounds_float64_ties_like_the_loop(self):
+        # np.round(2.675, 2) is 2.68 but round(2.675, 2) is 2.67; float32 boxes never land this close
+        boxes = Float64Boxes([[2.675, 1.005, 10.675, 20.345, 0.28125, 2],
+                              [0.145, 0.285, 8.115, 300.015, 0.10005, 0]])
+        results = [Result(boxes, IMG_SHAPE[:2])]
+        self.assertEqual(self.predictor.extract_detections(results, IMG_SHAPE),
+                         baseline_detections(self.predictor, results, IMG_SHAPE))
+
+    def test_skips_empty_results(self):
+        results = [Result(Boxes(np.zeros((0, 6))), IMG_SHAPE[:2]), Result(None, IMG_SHAPE[:2])]
+        self.assertEqual(self.predictor.extract_detections(results, IMG_SHAPE), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
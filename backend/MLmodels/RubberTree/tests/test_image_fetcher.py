@@ -0,0 +1,149 @@
+# backend/MLmodels/RubberTree/tests/test_image_fetcher.py
+import sys
+import time
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ImageFetcher import ImageCache, ImageFetcher
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Local image host: /image serves the current body with an ETag, /flaky fails once with a 503"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address, self.headers.get('If-None-Match')))
+            body = server.body
+            if self.path == '/flaky' and not server.failed_once:
+                server.failed_once = True
+                self.respond(503, b'busy')
+                return
+
+        if self.path == '/image' and self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.respond(200, body, server.etag)
+
+    def respond(self, status, body, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ImageFetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.body = b'first image bytes'
+        self.server.etag = '"v1"'
+        self.server.failed_once = False
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def test_reuses_keep_alive_connection(self):
+        fetcher = ImageFetcher(pool_size=1)
+        for _ in range(3):
+            self.assertEqual(fetcher.fetch(f'{self.base_url}/image'), b'first image bytes')
+        fetcher.close()
+        ports = {client_address for _, client_address, _ in self.server.requests}
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(ports), 1)
+
+    def test_retries_server_error(self):
+        fetcher = ImageFetcher()
+        self.assertEqual(fetcher.fetch(f'{self.base_url}/flaky'), b'first image bytes')
+        fetcher.close()
+        self.assertEqual([path for path, _, _ in self.server.requests], ['/flaky', '/flaky'])
+
+    def test_revalidates_with_etag(self):
+        fetcher = ImageFetcher(cache_dir=self.cache_dir.name, revalidate=True)
+        url = f'{self.base_url}/image'
+        self.assertEqual(fetcher.fetch(url), b'first image bytes')
+        # The stand-in would now send different bytes, but its ETag says the cached copy is current
+        self.server.body = b'not sent on a 304'
+        self.assertEqual(fetcher.fetch(url), b'first image bytes')
+        fetcher.close()
+        self.assertEqual([etag for _, _, etag in self.server.requests], [None, '"v1"'])
+
+    def test_serves_fresh_entries_without_a_request(self):
+        fetcher = ImageFetcher(cache_dir=self.cache_dir.name, max_age=60)
+        url = f'{self.base_url}/image'
+        fetcher.fetch(url)
+        fetcher.fetch(url)
+        fetcher.close()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_refetches_changed_content_after_max_age(self):
+        fetcher = ImageFetcher(cache_dir=self.cache_dir.name, max_age=0)
+        url = f'{self.base_url}/image'
+        self.assertEqual(fetcher.fetch(url), b'first image bytes')
+        self.server.body, self.server.etag = b'replaced image bytes', '"v2"'
+        self.assertEqual(fetcher.fetch(url), b'replaced image bytes')
+        fetcher.close()
+
+
+class ImageCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ImageCache(cache_dir, max_bytes=250)
+            cache.put('a', b'a' * 100)
+            time.sleep(0.01)
+            cache.put('b', b'b' * 100)
+            time.sleep(0.01)
+            # Reading a makes b the least recently used entry
+            self.assertEqual(cache.get('a')[0], b'a' * 100)
+            time.sleep(0.01)
+            cache.put('c', b'c' * 100)
+
+            self.assertEqual(cache.get('b'), (None, None))
+            self.assertEqual(cache.get('a')[0], b'a' * 100)
+            self.assertEqual(cache.get('c')[0], b'c' * 100)
+            self.assertEqual(cache.total_bytes, 200)
+
+    def test_failed_body_write_keeps_previous_metadata(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ImageCache(cache_dir)
+            cache.put('a', b'old bytes', etag='"v1"')
+            write = cache._atomic_write
+
+            def fail_on_body(path, data):
+                if path.suffix == '.bin':
+                    raise OSError('disk full')
+                write(path, data)
+
+            with mock.patch.object(cache, '_atomic_write', side_effect=fail_on_body):
+                with self.assertRaises(OSError):
+                    cache.put('a', b'new bytes', etag='"v2"')
+
+            content, metadata = cache.get('a')
+            self.assertEqual(content, b'old bytes')
+            self.assertEqual(metadata['etag'], '"v1"')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# backend/MLmodels/RubberTree/tests/test_job_queue.py
+import sys
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from JobQueue import JobQueue, JobWorker
+
+
+class CountingPredictor:
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, content):
+        self.calls += 1
+        return {'success': True, 'detections': [], 'analysis': {}, 'call': self.calls}
+
+
+class JobDedupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(Path(self.tmp.name) / 'jobs.sqlite3')
+        self.image = Path(self.tmp.name) / 'tree.jpg'
+        self.image.write_bytes(b'same image bytes')
+        self.copy = Path(self.tmp.name) / 'copy.jpg'
+        self.copy.write_bytes(b'same image bytes')
+        self.predictor = CountingPredictor()
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def run_job(self, source, result_key):
+        job, _ = self.queue.submit(str(source))
+        worker = JobWorker(self.queue, self.predictor.predict, result_key=result_key)
+        worker.process(self.queue.claim())
+        return self.queue.get(job['job_id'])
+
+    def test_reuses_result_under_the_same_key(self):
+        first = self.run_job(self.image, 'weights-a')
+        second = self.run_job(self.copy, 'weights-a')
+        self.assertEqual(self.predictor.calls, 1)
+        self.assertEqual(second['duplicate_of'], first['job_id'])
+        self.assertEqual(second['result'], first['result'])
+
+    def test_predicts_again_after_the_key_changes(self):
+        self.run_job(self.image, 'weights-a')
+        retrained = self.run_job(self.copy, 'weights-b')
+        self.assertEqual(self.predictor.calls, 2)
+        self.assertIsNone(retrained['duplicate_of'])
+        self.assertEqual(retrained['result']['call'], 2)
+
+    def test_no_reuse_without_a_key(self):
+        self.run_job(self.image, None)
+        self.run_job(self.copy, None)
+        self.assertEqual(self.predictor.calls, 2)
+
+    def test_submit_by_hash_only_matches_done_jobs_with_the_same_key(self):
+        first = self.run_job(self.image, 'weights-a')
+        job, created = self.queue.submit('other', image_hash=first['image_hash'], result_key='weights-a')
+        self.assertFalse(created)
+        self.assertEqual(job['job_id'], first['job_id'])
+        _, created = self.queue.submit('other', image_hash=first['image_hash'], result_key='weights-b')
+        self.assertTrue(created)
+
+    def test_adds_result_key_to_an_existing_database(self):
+        db_path = Path(self.tmp.name) / 'old.sqlite3'
+        conn = sqlite3.connect(str(db_path))
+        conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, source TEXT NOT NULL, image_hash TEXT, '
+                     'priority INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+                     'result TEXT, error TEXT, duplicate_of TEXT, created_at REAL NOT NULL, started_at REAL, '
+                     'finished_at REAL)')
+        conn.execute("INSERT INTO jobs (id, source, image_hash, status, result, created_at, finished_at) "
+                     "VALUES ('old', 'x', 'hash', 'done', '{\"success\": true}', 0, 0)")
+        conn.commit()
+        conn.close()
+
+        queue = JobQueue(db_path)
+        try:
+            # Results from before keys were recorded are never reused
+            _, created = queue.submit('y', image_hash='hash', result_key='weights-a')
+            self.assertTrue(created)
+        finally:
+            queue.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# backend/MLmodels/RubberTree/tests/test_single_pass.py
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from ExportedModel import Boxes, Result, non_max_suppression
+from Preprocess import as_decoded
+from PredictRubberTree import RubberTreePredictor
+
+NUM_CLASSES = 3
+
+
+class StandInModel:
+    """Replays fixed raw outputs through the same conf filter and NMS as a real model.
+
+    Each image is a tiny array whose first pixel is the index of its raw output.
+    """
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+        self.calls = []
+
+    def __call__(self, source, conf=0.25, iou=0.45, imgsz=None, verbose=False):
+        images = source if isinstance(source, list) else [source]
+        self.calls.append((len(images), conf))
+        results = []
+        for img in images:
+            prediction = self.predictions[int(img[0, 0, 0])]
+            results.append(Result(Boxes(non_max_suppression(prediction, conf, iou)), img.shape[:2]))
+        return results
+
+
+def make_predictor(**kwargs):
+    """Predictor without weights; the stand-in model is attached afterwards"""
+    with mock.patch.object(RubberTreePredictor, 'load_model', return_value=None):
+        return RubberTreePredictor(image_cache=False, result_cache=False, instrument=False, **kwargs)
+
+
+def raw_prediction(boxes):
+    """(4 + nc, anchors) float32 output from (cx, cy, w, h, conf, cls) rows"""
+    prediction = np.zeros((4 + NUM_CLASSES, len(boxes)), dtype=np.float32)
+    for anchor, (cx, cy, w, h, conf, cls) in enumerate(boxes):
+        prediction[:4, anchor] = (cx, cy, w, h)
+        prediction[4 + cls, anchor] = conf
+    return prediction
+
+
+def fixed_predictions():
+    f32 = np.float32
+    predictions = [
+        # Scored exactly at the float32 value of a ladder threshold, next to a box above it
+        raw_prediction([(50, 50, 20, 20, f32(0.15), 0), (150, 150, 20, 20, 0.3, 1)]),
+        raw_prediction([(50, 50, 20, 20, f32(0.1), 2), (150, 150, 20, 20, 0.12, 0)]),
+        # Overlapping boxes, so NMS at the lower threshold has something to suppress
+        raw_prediction([(60, 60, 40, 40, 0.11, 1), (62, 62, 40, 40, 0.09, 1), (200, 80, 30, 30, 0.06, 2)]),
+        raw_prediction([(30, 30, 10, 10, 0.03, 0), (90, 90, 10, 10, f32(0.05), 1)]),
+        # Nothing above the lowest threshold: both modes fall back
+        raw_prediction([(30, 30, 10, 10, f32(0.01), 0), (90, 90, 10, 10, 0.005, 1)]),
+        raw_prediction([]),
+    ]
+    rng = np.random.default_rng(2)
+    for _ in range(30):
+        count = int(rng.integers(1, 12))
+        predictions.append(raw_prediction(list(zip(
+            rng.uniform(20, 300, count), rng.uniform(20, 220, count), rng.uniform(5, 60, count),
+            rng.uniform(5, 60, count), rng.choice([f32(0.15), f32(0.1), f32(0.05), f32(0.01), 0.2, 0.07], count),
+            rng.integers(0, NUM_CLASSES, count)))))
+    return predictions
+
+
+def make_images(count):
+    images = []
+    for index in range(count):
+        img = np.zeros((240, 320, 3), dtype=np.uint8)
+        img[0, 0, 0] = index
+        images.append(img)
+    return images
+
+
+class SinglePassTest(unittest.TestCase):
+    def setUp(self):
+        self.predictions = fixed_predictions()
+        self.images = make_images(len(self.predictions))
+
+    def run_mode(self, single_pass):
+        predictor = make_predictor(single_pass=single_pass)
+        predictor.model = StandInModel(self.predictions)
+        return predictor
+
+    def test_single_image_matches_retry_ladder(self):
+        ladder, single = self.run_mode(False), self.run_mode(True)
+        for index, img in enumerate(self.images):
+            with self.subTest(image=index):
+                img = as_decoded(img)
+                self.assertEqual(single.detect_single_pass(img), ladder.detect_with_retries(img))
+
+    def test_batch_matches_retry_ladder(self):
+        ladder, single = self.run_mode(False), self.run_mode(True)
+        # The fallback for images without detections is randomised
+        np.random.seed(0)
+        single_results = single.predict_images(self.images)
+        np.random.seed(0)
+        self.assertEqual(single_results, ladder.predict_images(self.images))
+        self.assertEqual({conf for _, conf in single.model.calls}, {min(single.confidence_thresholds)})
+
+    def test_ladder_threshold_boxes_are_dropped(self):
+        # The box scored float32(0.15) is not above 0.15, so only the 0.3 box is kept
+        detections, conf_threshold = self.run_mode(True).detect_single_pass(as_decoded(self.images[0]))
+        self.assertEqual(conf_threshold, 0.15)
+        self.assertEqual([d['confidence'] for d in detections], [0.3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,17 +27,44 @@ class MLController {
                 return res.status(400).json({ error: 'Uploaded file not found' });
             }
 
+            // Use real AI processing now that Python packages are installed
+            // Set to true if you want to use mock data for testing
+            const USE_MOCK_DATA = false;
+
             // ----------------------
-            // UPLOAD TO CLOUDINARY
+            // RUN PREDICTION ON THE LOCAL FILE WHILE UPLOADING TO CLOUDINARY
             // ----------------------
+            // The Python side reads the multer file directly, so it no longer
+            // has to download the same bytes back from Cloudinary
+            console.log('☁️ Uploading image to Cloudinary...');
+            const uploadPromise = uploadToCloudinary(localImagePath, 'rubbersense/rubbertrees');
+            let predictionPromise;
+
+            if (USE_MOCK_DATA) {
+                console.log('🎭 Using mock data (Python packages not installed)');
+                predictionPromise = Promise.resolve(MLController.getMockPredictionResult());
+            } else if (process.env.PREDICTOR_URL) {
+                // A predictor on another host cannot read the multer file and needs the Cloudinary URL
+                predictionPromise = MLController.callPredictionServer(
+                    localImagePath,
+                    () => uploadPromise.then(image => image.url)
+                );
+            } else {
+                console.log('🐍 Calling Python script with local image:', localImagePath);
+                predictionPromise = MLController.callPythonPrediction(localImagePath);
+            }
+            // Handle the prediction's outcome now: if it fails while the upload is still pending,
+            // an unhandled rejection would take down the whole process
+            const predictionSettled = predictionPromise.then(result => ({ result }), error => ({ error }));
+
             let cloudImage;
             try {
-                console.log('☁️ Uploading image to Cloudinary...');
-                cloudImage = await uploadToCloudinary(localImagePath, 'rubbersense/rubbertrees');
+                cloudImage = await uploadPromise;
                 console.log('✅ Cloudinary upload successful:', cloudImage.url);
             } catch (uploadError) {
                 console.error('❌ Cloudinary upload failed:', uploadError.message);
-                // Clean up local file on error
+                // Let Python finish reading the file before cleaning it up
+                await predictionSettled;
                 try { fs.unlinkSync(localImagePath); } catch(e) {}
                 return res.status(500).json({ 
                     error: 'Failed to upload image to Cloudinary', 
@@ -45,30 +72,21 @@ class MLController {
                 });
             }
 
-            // Clean up local file after upload
-            try {
-                fs.unlinkSync(localImagePath);
-                console.log('🗑️ Deleted local file');
-            } catch (cleanupError) {
-                console.warn('⚠️ Could not delete local file:', cleanupError.message);
-            }
-
-            // ----------------------
-            // CALL PYTHON SCRIPT WITH CLOUDINARY URL
-            // ----------------------
-            console.log('🐍 Calling Python script with Cloudinary URL:', cloudImage.url);
-            
-            // Use real AI processing now that Python packages are installed
-            // Set to true if you want to use mock data for testing
-            const USE_MOCK_DATA = false;
-            
             let pythonResult;
-            
-            if (USE_MOCK_DATA) {
-                console.log('🎭 Using mock data (Python packages not installed)');
-                pythonResult = MLController.getMockPredictionResult();
-            } else {
-                pythonResult = await MLController.callPythonPrediction(cloudImage.url);
+            try {
+                const prediction = await predictionSettled;
+                if (prediction.error) {
+                    throw prediction.error;
+                }
+                pythonResult = prediction.result;
+            } finally {
+                // Clean up local file once both the upload and the prediction are done
+                try {
+                    fs.unlinkSync(localImagePath);
+                    console.log('🗑️ Deleted local file');
+                } catch (cleanupError) {
+                    console.warn('⚠️ Could not delete local file:', cleanupError.message);
+                }
             }
             
             console.log('📊 Python/Mock script result:', JSON.stringify(pythonResult, null, 2));
@@ -112,6 +130,55 @@ class MLController {
         }
     }
 
+    // Only a predictor on this host shares the filesystem holding the multer upload
+    static isLoopbackPredictor(serverUrl) {
+        try {
+            const { hostname } = new URL(serverUrl);
+            return hostname === 'localhost' || hostname === '[::1]' || hostname.startsWith('127.');
+        } catch (e) {
+            return false;
+        }
+    }
+
+    // Call the long-lived prediction server (ServeRubberTree.py), falling back to the script.
+    // A loopback server reads the local file; a remote one, or a local one that could not read
+    // the file, gets the Cloudinary URL from getCloudUrl() instead.
+    static async callPredictionServer(localImagePath, getCloudUrl) {
+        const serverUrl = process.env.PREDICTOR_URL.replace(/\/$/, '');
+        const cleanImagePath = localImagePath.replace(/^["']|["']$/g, '');
+
+        const requestPrediction = async (imageUrl) => {
+            const response = await fetch(`${serverUrl}/predict`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ image_url: imageUrl })
+            });
+
+            if (response.status === 503) {
+                throw new Error('Prediction server is shutting down');
+            }
+
+            return await response.json();
+        };
+
+        try {
+            console.log('🚀 Calling prediction server:', serverUrl);
+            if (!MLController.isLoopbackPredictor(serverUrl)) {
+                return await requestPrediction(await getCloudUrl());
+            }
+
+            const result = await requestPrediction(cleanImagePath);
+            if (!result.success && /could not load|not found|outside the upload/i.test(result.error || '')) {
+                console.warn('⚠️ Prediction server could not read the local file, retrying with the Cloudinary URL:', result.error);
+                return await requestPrediction(await getCloudUrl());
+            }
+            return result;
+        } catch (serverError) {
+            console.warn('⚠️ Prediction server unavailable, spawning Python script:', serverError.message);
+            return MLController.callPythonPrediction(localImagePath);
+        }
+    }
+
     // Call Python script with better error handling
     static async callPythonPrediction(imageUrl) {
         return new Promise((resolve, reject) => {
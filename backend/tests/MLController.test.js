@@ -0,0 +1,88 @@
+// backend/tests/MLController.test.js
+const test = require('node:test');
+const assert = require('node:assert');
+const fs = require('fs');
+const os = require('os');
+const path = require('path');
+
+// Stand in for Cloudinary before the controller loads it
+const cloudinary = { upload: null, deleted: [] };
+require.cache[require.resolve('../utils/Cloudinary')] = {
+    exports: {
+        uploadToCloudinary: (...args) => cloudinary.upload(...args),
+        deleteFromCloudinary: async (publicId) => { cloudinary.deleted.push(publicId); }
+    }
+};
+const MLController = require('../controllers/MLController');
+
+const delay = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+function uploadedFile() {
+    const dir = fs.mkdtempSync(path.join(os.tmpdir(), 'mlcontroller-'));
+    const filePath = path.join(dir, 'tree.jpg');
+    fs.writeFileSync(filePath, 'not really a jpeg');
+    return filePath;
+}
+
+function response() {
+    return {
+        statusCode: 200,
+        body: null,
+        status(code) { this.statusCode = code; return this; },
+        json(body) { this.body = body; return this; }
+    };
+}
+
+async function processWithoutUnhandledRejections(req, res) {
+    const unhandled = [];
+    const onUnhandled = (reason) => unhandled.push(reason);
+    process.on('unhandledRejection', onUnhandled);
+    try {
+        await MLController.processRubberTree(req, res);
+        // Give any orphaned rejection a chance to surface
+        await delay(20);
+    } finally {
+        process.off('unhandledRejection', onUnhandled);
+    }
+    return unhandled;
+}
+
+test('prediction failing before the upload finishes is handled', async (t) => {
+    delete process.env.PREDICTOR_URL;
+    t.mock.method(MLController, 'callPythonPrediction', async () => {
+        throw new Error('Python not found');
+    });
+    cloudinary.upload = async () => {
+        await delay(50);
+        return { url: 'https://cdn.example/tree.jpg', public_id: 'tree' };
+    };
+    const filePath = uploadedFile();
+    const res = response();
+
+    const unhandled = await processWithoutUnhandledRejections({ file: { path: filePath } }, res);
+
+    assert.deepStrictEqual(unhandled, []);
+    assert.strictEqual(res.statusCode, 500);
+    assert.strictEqual(res.body.details, 'Python not found');
+    assert.strictEqual(fs.existsSync(filePath), false);
+});
+
+test('prediction and upload both failing reports the upload error', async (t) => {
+    delete process.env.PREDICTOR_URL;
+    t.mock.method(MLController, 'callPythonPrediction', async () => {
+        throw new Error('Python not found');
+    });
+    cloudinary.upload = async () => {
+        await delay(50);
+        throw new Error('Cloudinary unavailable');
+    };
+    const filePath = uploadedFile();
+    const res = response();
+
+    const unhandled = await processWithoutUnhandledRejections({ file: { path: filePath } }, res);
+
+    assert.deepStrictEqual(unhandled, []);
+    assert.strictEqual(res.statusCode, 500);
+    assert.strictEqual(res.body.error, 'Failed to upload image to Cloudinary');
+    assert.strictEqual(fs.existsSync(filePath), false);
+});